@@ -1,41 +1,149 @@
 #!/usr/bin/python
 # aggregator.py
 
+import copy
+import importlib
 import os
+import shlex
 import sys
+import threading
+import time
 from argparse import ArgumentParser
 from argparse import RawTextHelpFormatter
 from argparse import FileType
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from importlib import metadata
 from flow import pluginloader
 import flow.utils.commons as commons
 from flow.buildconfig import BuildConfig
-from flow.cloud.cloudfoundry.cloudfoundry import CloudFoundry
-from flow.cloud.gcappengine.gcappengine import GCAppEngine
-from flow.coderepo.github.github import GitHub
-from flow.communications.slack.slack import Slack
-from flow.metrics.graphite.graphite import Graphite
-from flow.projecttracking.jira.jira import Jira
-from flow.projecttracking.tracker.tracker import Tracker
+from flow.logger import Logger
 from pydispatch import dispatcher
 
-from flow.servicemanagement.servicenow.service_now import ServiceNow
-from flow.staticqualityanalysis.sonar.sonarmodule import SonarQube
 from flow.utils.commons import Commons
-from flow.zipit.zipit import ZipIt
-import pkg_resources
-
-
-from flow.artifactstorage.artifactory.artifactory import Artifactory
+from flow.zipit.parallel_compressor import ParallelCompressor
+
+# integrations are imported the first time a task uses them so every run only pays for the modules it needs
+integrations = {
+    'Artifactory': 'flow.artifactstorage.artifactory.artifactory',
+    'CloudFoundry': 'flow.cloud.cloudfoundry.cloudfoundry',
+    'GCAppEngine': 'flow.cloud.gcappengine.gcappengine',
+    'GitHub': 'flow.coderepo.github.github',
+    'Graphite': 'flow.metrics.graphite.graphite',
+    'Jira': 'flow.projecttracking.jira.jira',
+    'ServiceNow': 'flow.servicemanagement.servicenow.service_now',
+    'Slack': 'flow.communications.slack.slack',
+    'SonarQube': 'flow.staticqualityanalysis.sonar.sonarmodule',
+    'Tracker': 'flow.projecttracking.tracker.tracker',
+    'ZipIt': 'flow.zipit.zipit',
+}
+
+
+def load_integration(name):
+    # cached in the module globals, which is also where tests patch them
+    if name not in globals():
+        globals()[name] = getattr(importlib.import_module(integrations[name]), name)
+    return globals()[name]
+
+
+def __getattr__(name):
+    if name in integrations:
+        return load_integration(name)
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
+
+
+class Task:
+    """A flow subcommand: the function that runs it and the clients (see dependencies) it uses.
+
+    When resolve_version is set, BuildConfig.version_number is looked up from the GitHub tags before the task runs.
+    consumes and produces name what a step needs from and leaves for later pipeline steps ('version', 'artifact',
+    'deployment'), either for every action or as a dict keyed by action.  A pipeline step waits only for the earlier
+    steps producing what it consumes.  Tasks that are not concurrent (they change process wide state such as the
+    cf cli login or the working directory) run on their own.
+    """
+
+    def __init__(self, name, run, dependencies=(), resolve_version=True, consumes=(), produces=(), concurrent=True):
+        self.name = name
+        self.run = run
+        self.dependencies = dependencies
+        self.resolve_version = resolve_version and 'github' in dependencies
+        self.consumes = consumes
+        self.produces = produces
+        self.concurrent = concurrent
+
+    @staticmethod
+    def _for_action(resources, action):
+        return resources.get(action, ()) if isinstance(resources, dict) else resources
+
+    def consumes_for(self, action):
+        return set(Task._for_action(self.consumes, action)) | ({'version'} if self.resolve_version else set())
+
+    def produces_for(self, action):
+        return set(Task._for_action(self.produces, action))
+
+
+# task dependency -> integration class
+dependencies = {
+    'artifactory': 'Artifactory',
+    'cf': 'CloudFoundry',
+    'gcappengine': 'GCAppEngine',
+    'github': 'GitHub',
+    'jira': 'Jira',
+    'metrics': 'Graphite',
+    'servicenow': 'ServiceNow',
+    'slack': 'Slack',
+    'sonar': 'SonarQube',
+    'tracker': 'Tracker',
+}
+
+
+class TaskContext:
+    """Arguments and clients of a single run.
+
+    A client is constructed the first time a task asks for it and shared after that, so configuration loading and
+    checks such as GitHub's repo verification happen at most once per run.  The steps of a pipeline share the
+    clients and the commit history and story details held in results, even when they run on separate threads.
+    """
+
+    def __init__(self, task, args, parser=None):
+        self.task = task
+        self.args = args
+        self.parser = parser
+        self.results = {}
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.version_lock = threading.Lock()
+
+    def for_step(self, task, args):
+        # shares results and locks with this context
+        step_context = copy.copy(self)
+        step_context.task = task
+        step_context.args = args
+        return step_context
+
+    def get(self, dependency):
+        return self.memoize(('client', dependency), lambda: load_integration(dependencies[dependency])())
+
+    def memoize(self, key, func):
+        # one lock per key: a second caller waits for the first one's result instead of fetching it again
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            if key not in self.results:
+                self.results[key] = func()
+            return self.results[key]
+
+    def write_metric(self):
+        self.get('metrics').write_metric(self.task, self.args.action)
 
 
 def main():
     clazz = 'aggregator'
     method = 'main'
-    tasks_requiring_github = []
 
     try:
-        version = pkg_resources.require("THD-Flow")[0].version
-    except:
+        version = metadata.version("THD-Flow")
+    except metadata.PackageNotFoundError:
         version = 'UNKNOWN'
 
     parser = ArgumentParser(prog='version {} \n flow'.format(version))
@@ -50,17 +158,12 @@ def main():
     
     load_task_parsers(subparsers)
 
-    plugins = []
-
     for i in pluginloader.get_plugins():
         plugin = pluginloader.load_plugin(i)
 
         new_parser = subparsers.add_parser(plugin.parser, formatter_class=RawTextHelpFormatter)
         plugin.register_parser(new_parser)
-        plugins.append(plugin)
-
-        if hasattr(plugin, 'require_version') and plugin.require_version is True:
-            tasks_requiring_github.append(plugin.parser)
+        register_plugin(plugin)
 
     args = parser.parse_args()
 
@@ -76,6 +179,7 @@ def main():
     commons.print_msg(clazz, method, "THD-Flow Version: {}".format(version))
 
     BuildConfig(args)
+    Logger.configure(BuildConfig.settings)
 
     if 'deploy_directory' in args and args.deploy_directory is not None:
         commons.print_msg(clazz, method, "Setting deployment directory to {}".format(args.deploy_directory))
@@ -83,238 +187,235 @@ def main():
 
     connect_error_dispatcher()
 
-    github = None
-
-    # TODO check if there are any registered metrics endpoints defined in settings.ini. This is optional.
-    metrics = Graphite()
+    context = TaskContext(task, args, parser)
 
     commons.print_msg(clazz, method, "Task {}".format(task))
 
-    tasks_requiring_github.extend(['sonar', 'tracker', 'jira', 'slack', 'artifactory', 'cf', 'zipit', 'gcappengine', 'servicenow'])
-
-    if task != 'github' and task in tasks_requiring_github:
-        github = GitHub()
-        if 'version' in args and args.version is not None and len(args.version.strip()) > 0 and args.version.strip(
-                                                                                                ).lower() != 'latest':
-            # The only time a user should be targeting a snapshot environment and specifying a version
-            # number without a "+" should be if they were manually versioning and passing in a base
-            # version number.  Although technically this could be used outside of the manually versioned
-            # experience.
-            #
-            # i.e. flow cf deploy -v 1.0.1 development
-            #      this would deploy the latest snapshot version of 1.0.1, 1.0.1+3
-            # if however, they supplied the "+" it would target that specific snapshot version and not the latest
-            # i.e. flow cf deploy -v 1.0.1+2
-            #      this would deploy the version 1.0.1+2 even though there is a snapshot available with +3
-            if BuildConfig.artifact_category == 'snapshot' and '+' not in args.version:
-                commons.print_msg(clazz, method, ('Base version passed in.  Looking for latest snapshot version '
-                                                  'determined by base', args.version))
-                # TODO it doesn't appear that this is actually returning the latest snapshot, but instead returning
-                #      what was passed in.  even in the older version of code.
-                BuildConfig.version_number = github.get_git_last_tag(args.version.strip())
-            else:
-                BuildConfig.version_number = BuildConfig.version_number = github.get_git_last_tag(args.version.strip())
-            # validate after processing what the version_number is set to.
-            commons.print_msg(clazz, method, "Setting version number based on argument {}"
-                              .format(BuildConfig.version_number))
+    run_task(context)
 
-        else:
-            BuildConfig.version_number = github.get_git_last_tag()
-
-    if task == 'github':
-        github = GitHub()
-        if args.action == 'version':
-            if 'tracker' in BuildConfig.json_config:
-                _tracker = Tracker()
-                call_github_version(github, tracker_instance=_tracker, file_path=args.output, args=args)
-            elif 'jira' in BuildConfig.json_config:
-                _jira = Jira()
-                call_github_version(github, jira_instance=_jira, file_path=args.output, args=args)
-            else:
-                call_github_version(github, None, file_path=args.output, args=args)
-            metrics.write_metric(task, args.action)
-        elif args.action == 'getversion':
-            if 'output' in args:
-                call_github_getversion(github, file_path=args.output)
-            else:
-                call_github_getversion(github)
-            metrics.write_metric(task, args.action)
-    elif task == 'tracker':
-        tracker = Tracker()
-
-        commits = get_git_commit_history(github, args)
 
-        story_list = commons.extract_story_id_from_commit_messages(commits)
+def run_task(context):
+    if tasks[context.task].resolve_version:
+        # BuildConfig.version_number is shared by every step.  concurrent steps resolve to the same tag, one at a
+        # time so only the first one fetches the tags.
+        with context.version_lock:
+            resolve_version(context)
 
-        tracker.tag_stories_in_commit(story_list)
-        metrics.write_metric(task, args.action)
-    elif task == 'jira':
-        jira = Jira()
+    tasks[context.task].run(context)
 
-        commits = get_git_commit_history(github, args)
 
-        story_list = commons.extract_story_id_from_commit_messages(commits, numeric_only=False)
+def resolve_version(context):
+    clazz = 'aggregator'
+    method = 'resolve_version'
 
-        jira.tag_stories_in_commit(story_list)
-        metrics.write_metric(task, args.action)
-    elif task == 'slack':
-        slack = Slack()
+    args = context.args
+    github = context.get('github')
 
-        if args.action == 'release':
-            commits = get_git_commit_history(github, args)
-            story_details = None
+    if 'version' in args and args.version is not None and len(args.version.strip()) > 0 and args.version.strip(
+                                                                                            ).lower() != 'latest':
+        # The only time a user should be targeting a snapshot environment and specifying a version
+        # number without a "+" should be if they were manually versioning and passing in a base
+        # version number.  Although technically this could be used outside of the manually versioned
+        # experience.
+        #
+        # i.e. flow cf deploy -v 1.0.1 development
+        #      this would deploy the latest snapshot version of 1.0.1, 1.0.1+3
+        # if however, they supplied the "+" it would target that specific snapshot version and not the latest
+        # i.e. flow cf deploy -v 1.0.1+2
+        #      this would deploy the version 1.0.1+2 even though there is a snapshot available with +3
+        if BuildConfig.artifact_category == 'snapshot' and '+' not in args.version:
+            commons.print_msg(clazz, method, ('Base version passed in.  Looking for latest snapshot version '
+                                              'determined by base', args.version))
+            # TODO it doesn't appear that this is actually returning the latest snapshot, but instead returning
+            #      what was passed in.  even in the older version of code.
+            BuildConfig.version_number = github.get_git_last_tag(args.version.strip())
+        else:
+            BuildConfig.version_number = github.get_git_last_tag(args.version.strip())
+        # validate after processing what the version_number is set to.
+        commons.print_msg(clazz, method, "Setting version number based on argument {}"
+                          .format(BuildConfig.version_number))
 
-            if 'tracker' in BuildConfig.json_config:
-                projectTracker = Tracker()
-                if projectTracker is not None:
-                    story_list = commons.extract_story_id_from_commit_messages(commits)
-                    story_details = projectTracker.get_details_for_all_stories(story_list)
-            elif 'jira' in BuildConfig.json_config:
-                projectTracker = Jira()
-                if projectTracker is not None:
-                    story_list = commons.extract_story_id_from_commit_messages(commits, numeric_only=False)
-                    story_details = projectTracker.get_details_for_all_stories(story_list)
-
-            slack.publish_deployment(story_details)
-        elif args.action == 'message':
-            channel = args.channel if args.channel else None
-            user = args.user if args.user else None
-            icon = args.icon if args.icon else None
-            emoji = args.emoji if args.emoji else None
-            attachment_color = args.attachment_color if args.attachment_color else None
-            slack_url = args.slack_url
-
-            slack.publish_custom_message(message=args.message, channel=channel, user=user, icon=icon, emoji=emoji,
-                                         attachment_color=attachment_color, slack_url=slack_url)
-        metrics.write_metric(task, args.action)
-    elif task == 'sonar':
-        sonar = SonarQube()
-
-        sonar.scan_code()
-        metrics.write_metric(task, args.action)
-    elif task == 'artifactory':
-        artifactory = Artifactory()
-
-        if args.action == 'upload':
-            artifactory.publish_build_artifact()
-            metrics.write_metric(task, args.action)
-        elif args.action == 'download':
-            create_deployment_directory()
-            artifactory.download_and_extract_artifacts_locally(BuildConfig.push_location + '/', extract=args.extract in ['y', 'yes', 'true'] or args.extract is None)
-    elif task == 'cf':
-        if 'user' in args and args.user is not None:
-            os.environ['DEPLOYMENT_USER'] = args.user
-            os.environ['DEPLOYMENT_PWD'] = args.password
+    else:
+        BuildConfig.version_number = github.get_git_last_tag()
 
-        if BuildConfig.build_env_info['cf']:
-            if 'version' not in args:
-                commons.print_msg(clazz, method, 'Version number not passed in for deployment. Format is: v{'
-                                                 'major}.{minor}.{bug}+{buildnumber} ', 'ERROR')
-                exit(1)
 
-        cf = CloudFoundry()
-
-        if args.action == 'promote':
-            cf.promote()
-            
-            # noinspection PyPep8Naming
-            SIGNAL = 'publish-promote-complete'
-            sender = {}
-            dispatcher.send(signal=SIGNAL, sender=sender)
-        elif args.action == 'cutover':
-            cf.cutover()
-
-            # noinspection PyPep8Naming
-            SIGNAL = 'publish-cutover-complete'
-            sender = {}
-            dispatcher.send(signal=SIGNAL, sender=sender)
+def run_github(context):
+    args = context.args
+    github = context.get('github')
+
+    if args.action == 'version':
+        if 'tracker' in BuildConfig.json_config:
+            call_github_version(github, tracker_instance=context.get('tracker'), file_path=args.output, args=args)
+        elif 'jira' in BuildConfig.json_config:
+            call_github_version(github, jira_instance=context.get('jira'), file_path=args.output, args=args)
+        else:
+            call_github_version(github, None, file_path=args.output, args=args)
+        context.write_metric()
+    elif args.action == 'getversion':
+        if 'output' in args:
+            call_github_getversion(github, file_path=args.output)
         else:
-            is_script_run_successful = True
+            call_github_getversion(github)
+        context.write_metric()
 
-            if 'script' in args and args.script is not None:
-                commons.print_msg(clazz, method, 'Custom deploy script detected')
-                cf.download_cf_cli()
-                cf.download_custom_deployment_script(args.script)
-                is_script_run_successful = cf.run_deployment_script(args.script)
-            else:
-                commons.print_msg(clazz, method, 'No custom deploy script passed in.  Cloud Foundry detected in '
-                                                 'buildConfig.  Calling standard CloudFoundry deployment.')
 
-                # TODO make this configurable in case they are using
-                create_deployment_directory()
+def _history_key(context):
+    return BuildConfig.version_number, context.args.version if 'version' in context.args else None
 
-                #TODO uncomment this back without breaking applications where we aren't donloading from artifactory within flow or downloading from github 
-                # if BuildConfig.artifact_extension is None and BuildConfig.artifact_extensions is None:
-                #     commons.print_msg(clazz, method, 'Attempting to retrieve and deploy from GitHub.')
 
-                #     github.download_code_at_version()
-                # else:
-                #     commons.print_msg(clazz, method, 'Attempting to retrieve and deploy from Artifactory.')
-                #     artifactory = Artifactory()
+def get_commits(context):
+    return context.memoize(('commits',) + _history_key(context),
+                           lambda: get_git_commit_history(context.get('github'), context.args))
 
-                #     artifactory.download_and_extract_artifacts_locally(BuildConfig.push_location + '/')
 
-                force = False
+def get_stories(context):
+    return context.memoize(('stories',) + _history_key(context),
+                           lambda: get_story_details(context, get_commits(context)))
 
-                if 'force' in args and args.force is not None and args.force.strip().lower() != 'false':
-                    force = True
 
-                manifest = None
+def run_tracker(context):
+    commits = get_commits(context)
 
-                if 'manifest' in args and args.manifest is not None:
-                    commons.print_msg(clazz, method, "Setting manifest to {}".format(args.manifest))
-                    manifest = args.manifest
+    story_list = commons.extract_story_id_from_commit_messages(commits)
 
-                #TODO put blue/green back
-                cf.deploy(force_deploy=force, manifest=manifest)
-                #if args.action == 'deploy':
-                #   cf.deploy(force_deploy=force, manifest=manifest)
-                #elif args.action =='bluegreen':
-                #    cf.deploy(force_deploy=force, manifest=manifest, blue_green=True)
+    context.get('tracker').tag_stories_in_commit(story_list)
+    context.write_metric()
 
-            commons.print_msg(clazz, method, 'Checking if we can attach the output to the CR')
 
-            # noinspection PyPep8Naming
-            SIGNAL = 'publish-deploy-complete'
-            sender = {}
-            dispatcher.send(signal=SIGNAL, sender=sender)
+def run_jira(context):
+    commits = get_commits(context)
 
-            if is_script_run_successful is False:
-                exit(1)
+    story_list = commons.extract_story_id_from_commit_messages(commits, numeric_only=False)
+
+    context.get('jira').tag_stories_in_commit(story_list)
+    context.write_metric()
+
+
+def get_story_details(context, commits):
+    # details of the stories in commits from whichever tracker buildConfig.json configures
+    if 'tracker' in BuildConfig.json_config:
+        story_list = commons.extract_story_id_from_commit_messages(commits)
+        return context.get('tracker').get_details_for_all_stories(story_list)
+    elif 'jira' in BuildConfig.json_config:
+        story_list = commons.extract_story_id_from_commit_messages(commits, numeric_only=False)
+        return context.get('jira').get_details_for_all_stories(story_list)
+
+    return None
 
-        metrics.write_metric(task, args.action)
-    elif task == 'gcappengine':
-        app_engine = GCAppEngine()
 
+def run_slack(context):
+    args = context.args
+    slack = context.get('slack')
+
+    if args.action == 'release':
+        slack.publish_deployment(get_stories(context))
+    elif args.action == 'message':
+        channel = args.channel if args.channel else None
+        user = args.user if args.user else None
+        icon = args.icon if args.icon else None
+        emoji = args.emoji if args.emoji else None
+        attachment_color = args.attachment_color if args.attachment_color else None
+        slack_url = args.slack_url
+
+        slack.publish_custom_message(message=args.message, channel=channel, user=user, icon=icon, emoji=emoji,
+                                     attachment_color=attachment_color, slack_url=slack_url)
+    context.write_metric()
+
+
+def run_sonar(context):
+    context.get('sonar').scan_code()
+    context.write_metric()
+
+
+def run_artifactory(context):
+    args = context.args
+    artifactory = context.get('artifactory')
+
+    if args.action == 'upload':
+        artifactory.publish_build_artifact()
+        context.write_metric()
+    elif args.action == 'download':
+        create_deployment_directory()
+        artifactory.download_and_extract_artifacts_locally(BuildConfig.push_location + '/', extract=args.extract in ['y', 'yes', 'true'] or args.extract is None)
+
+
+def run_cf(context):
+    clazz = 'aggregator'
+    method = 'run_cf'
+
+    args = context.args
+
+    if 'user' in args and args.user is not None:
+        os.environ['DEPLOYMENT_USER'] = args.user
+        os.environ['DEPLOYMENT_PWD'] = args.password
+
+    if BuildConfig.build_env_info['cf']:
+        if 'version' not in args:
+            commons.print_msg(clazz, method, 'Version number not passed in for deployment. Format is: v{'
+                                             'major}.{minor}.{bug}+{buildnumber} ', 'ERROR')
+            exit(1)
+
+    cf = context.get('cf')
+
+    if args.action == 'promote':
+        cf.promote()
+
+        # noinspection PyPep8Naming
+        SIGNAL = 'publish-promote-complete'
+        sender = {}
+        dispatcher.send(signal=SIGNAL, sender=sender)
+    elif args.action == 'cutover':
+        cf.cutover()
+
+        # noinspection PyPep8Naming
+        SIGNAL = 'publish-cutover-complete'
+        sender = {}
+        dispatcher.send(signal=SIGNAL, sender=sender)
+    else:
         is_script_run_successful = True
 
         if 'script' in args and args.script is not None:
-            commons.print_msg(clazz, method, 'Custom deploy detected')
-            app_engine.download_custom_deployment_script(args.script)
-            is_script_run_successful = app_engine.run_deployment_script(args.script)
+            commons.print_msg(clazz, method, 'Custom deploy script detected')
+            cf.download_cf_cli()
+            cf.download_custom_deployment_script(args.script)
+            is_script_run_successful = cf.run_deployment_script(args.script)
         else:
-            commons.print_msg(clazz, method, 'No custom deploy script passed in. Calling standard AppEngine deployment.')
+            commons.print_msg(clazz, method, 'No custom deploy script passed in.  Cloud Foundry detected in '
+                                             'buildConfig.  Calling standard CloudFoundry deployment.')
 
+            # TODO make this configurable in case they are using
             create_deployment_directory()
 
-            if BuildConfig.artifact_extension is None and BuildConfig.artifact_extensions is None:
-                commons.print_msg(clazz, method, 'Attempting to retrieve and deploy from GitHub.')
+            #TODO uncomment this back without breaking applications where we aren't donloading from artifactory within flow or downloading from github 
+            # if BuildConfig.artifact_extension is None and BuildConfig.artifact_extensions is None:
+            #     commons.print_msg(clazz, method, 'Attempting to retrieve and deploy from GitHub.')
+
+            #     github.download_code_at_version()
+            # else:
+            #     commons.print_msg(clazz, method, 'Attempting to retrieve and deploy from Artifactory.')
+            #     artifactory = Artifactory()
+
+            #     artifactory.download_and_extract_artifacts_locally(BuildConfig.push_location + '/')
+
+            force = False
 
-                github.download_code_at_version()
-            else:
-                commons.print_msg(clazz, method, 'Attempting to retrieve and deploy from Artifactory.')
-                artifactory = Artifactory()
+            if 'force' in args and args.force is not None and args.force.strip().lower() != 'false':
+                force = True
 
-                artifactory.download_and_extract_artifacts_locally(BuildConfig.push_location + '/')
+            manifest = None
 
-            app_yaml = None
+            if 'manifest' in args and args.manifest is not None:
+                commons.print_msg(clazz, method, "Setting manifest to {}".format(args.manifest))
+                manifest = args.manifest
 
-            if 'app_yaml' in args and args.app_yaml is not None:
-                commons.print_msg(clazz, method, "Setting app yaml to {}".format(args.app_yaml))
-                app_yaml = args.app_yaml
+            #TODO put blue/green back
+            cf.deploy(force_deploy=force, manifest=manifest)
+            #if args.action == 'deploy':
+            #   cf.deploy(force_deploy=force, manifest=manifest)
+            #elif args.action =='bluegreen':
+            #    cf.deploy(force_deploy=force, manifest=manifest, blue_green=True)
 
-            if 'promote' in args and args.promote is not 'true':
-                app_engine.deploy(app_yaml=app_yaml, promote=False)
+        commons.print_msg(clazz, method, 'Checking if we can attach the output to the CR')
 
         # noinspection PyPep8Naming
         SIGNAL = 'publish-deploy-complete'
@@ -324,35 +425,223 @@ def main():
         if is_script_run_successful is False:
             exit(1)
 
-        metrics.write_metric(task, args.action)
+    context.write_metric()
 
-    elif task == 'zipit':
-        ZipIt('artifactory', args.zipfile, args.contents)
 
-    elif task == 'servicenow':
-        service_now = ServiceNow()
+def run_gcappengine(context):
+    clazz = 'aggregator'
+    method = 'run_gcappengine'
 
-        commits = get_git_commit_history(github, args)
+    args = context.args
+    app_engine = context.get('gcappengine')
 
-        if 'tracker' in BuildConfig.json_config:
-            projectTracker = Tracker()
-            if projectTracker is not None:
-                story_list = commons.extract_story_id_from_commit_messages(commits)
-                story_details = projectTracker.get_details_for_all_stories(story_list)
-        elif 'jira' in BuildConfig.json_config:
-            projectTracker = Jira()
-            if projectTracker is not None:
-                story_list = commons.extract_story_id_from_commit_messages(commits, numeric_only=False)
-                story_details = projectTracker.get_details_for_all_stories(story_list)
+    is_script_run_successful = True
 
-        service_now.create_chg(story_details)
-        metrics.write_metric(task, args.action)
+    if 'script' in args and args.script is not None:
+        commons.print_msg(clazz, method, 'Custom deploy detected')
+        app_engine.download_custom_deployment_script(args.script)
+        is_script_run_successful = app_engine.run_deployment_script(args.script)
     else:
-        for i in plugins:
-            if i.parser == task:
-                i.run_action(args)
-                metrics.write_metric(task, args.action)
-                continue
+        commons.print_msg(clazz, method, 'No custom deploy script passed in. Calling standard AppEngine deployment.')
+
+        create_deployment_directory()
+
+        if BuildConfig.artifact_extension is None and BuildConfig.artifact_extensions is None:
+            commons.print_msg(clazz, method, 'Attempting to retrieve and deploy from GitHub.')
+
+            context.get('github').download_code_at_version()
+        else:
+            commons.print_msg(clazz, method, 'Attempting to retrieve and deploy from Artifactory.')
+
+            context.get('artifactory').download_and_extract_artifacts_locally(BuildConfig.push_location + '/')
+
+        app_yaml = None
+
+        if 'app_yaml' in args and args.app_yaml is not None:
+            commons.print_msg(clazz, method, "Setting app yaml to {}".format(args.app_yaml))
+            app_yaml = args.app_yaml
+
+        if 'promote' in args and args.promote is not 'true':
+            app_engine.deploy(app_yaml=app_yaml, promote=False)
+
+    # noinspection PyPep8Naming
+    SIGNAL = 'publish-deploy-complete'
+    sender = {}
+    dispatcher.send(signal=SIGNAL, sender=sender)
+
+    if is_script_run_successful is False:
+        exit(1)
+
+    context.write_metric()
+
+
+def run_zipit(context):
+    args = context.args
+
+    load_integration('ZipIt')('artifactory', args.zipfile, args.contents, args.compression, args.level,
+                              args.stream, args.reproducible)
+
+
+def run_servicenow(context):
+    context.get('servicenow').create_chg(get_stories(context))
+    context.write_metric()
+
+
+def run_pipeline(context):
+    clazz = 'aggregator'
+    method = 'run_pipeline'
+
+    steps = context.args.steps or BuildConfig.json_config.get('pipeline', [])
+
+    if not steps:
+        commons.print_msg(clazz, method, 'No pipeline steps passed in or defined in the pipeline section of '
+                                         'buildConfig.json', 'ERROR')
+        exit(1)
+
+    # parse every step before running any, so a typo in the last step fails before the first one ships anything
+    steps_args = [context.parser.parse_args(shlex.split(step) + [context.args.env]) for step in steps]
+
+    for step, step_args in zip(steps, steps_args):
+        if step_args.task.lower() == 'pipeline':
+            commons.print_msg(clazz, method, "Pipeline step '{}' cannot be another pipeline".format(step), 'ERROR')
+            exit(1)
+
+    max_workers = commons.get_int_setting(BuildConfig.settings, 'pipeline', 'max_concurrent_steps', 1)
+
+    run_pipeline_steps(context, steps, steps_args, plan_pipeline(steps_args), max_workers)
+
+
+def _step_action(step_args):
+    return step_args.action if 'action' in step_args else None
+
+
+def _runs_alone(step_args):
+    # a step with its own version would change BuildConfig.version_number under the steps running next to it
+    task = tasks[step_args.task.lower()]
+    own_version = task.resolve_version and 'version' in step_args and step_args.version is not None
+    return not task.concurrent or own_version
+
+
+def plan_pipeline(steps_args):
+    """For each step, the earlier steps it has to wait for."""
+    plan = []
+    for i, step_args in enumerate(steps_args):
+        consumes = tasks[step_args.task.lower()].consumes_for(_step_action(step_args))
+
+        waits_for = []
+        for j, earlier_args in enumerate(steps_args[:i]):
+            produces = tasks[earlier_args.task.lower()].produces_for(_step_action(earlier_args))
+            if _runs_alone(step_args) or _runs_alone(earlier_args) or consumes & produces:
+                waits_for.append(j)
+        plan.append(waits_for)
+
+    return plan
+
+
+def log_pipeline(steps, plan, status=None):
+    clazz = 'aggregator'
+    method = 'log_pipeline'
+
+    for i, step in enumerate(steps):
+        waits_for = ', '.join("[{}] {}".format(j, steps[j]) for j in plan[i]) or 'nothing'
+        commons.print_msg(clazz, method, "[{}] {}{} waits for {}".format(
+            i, step, " ({})".format(status[i]) if status else '', waits_for))
+
+
+def run_pipeline_steps(context, steps, steps_args, plan, max_workers):
+    """
+    Runs each step as soon as the steps it waits for are done, up to max_workers at a time.  cf and gcappengine
+    steps drive their cli in a child process, so threads are enough to overlap them with the http bound steps.
+    After the first failure no new step is started and the graph is logged with the state of every step.
+    """
+    clazz = 'aggregator'
+    method = 'run_pipeline_steps'
+
+    log_pipeline(steps, plan)
+
+    status = ['waiting'] * len(steps)
+    timings = {}
+    running = {}
+    failure = None
+
+    def _run_step(i):
+        start = time.time()
+        try:
+            run_task(context.for_step(steps_args[i].task.lower(), steps_args[i]))
+        finally:
+            timings[i] = time.time() - start
+
+    pipeline_start = time.time()
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        while True:
+            if failure is None:
+                for i in range(len(steps)):
+                    if len(running) >= max(max_workers, 1):
+                        break
+                    if status[i] == 'waiting' and all(status[j] == 'done' for j in plan[i]):
+                        commons.print_msg(clazz, method, "Starting [{}] {}".format(i, steps[i]))
+                        status[i] = 'running'
+                        running[executor.submit(_run_step, i)] = i
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                i = running.pop(future)
+                try:
+                    future.result()
+                    status[i] = 'done'
+                    commons.print_msg(clazz, method, "[{}] {} finished in {:.1f}s".format(i, steps[i], timings[i]))
+                    # noinspection PyPep8Naming
+                    SIGNAL = 'publish-pipeline-step-complete'
+                    dispatcher.send(signal=SIGNAL, sender={'step': steps[i], 'seconds': timings[i]})
+                except BaseException as e:
+                    status[i] = 'failed'
+                    commons.print_msg(clazz, method, "[{}] {} failed after {:.1f}s: {}".format(
+                        i, steps[i], timings.get(i, 0), e), 'WARN')
+                    failure = failure or e
+
+    for i, step in enumerate(steps):
+        if i in timings:
+            commons.print_msg(clazz, method, "{:>8.1f}s  {}".format(timings[i], step))
+    commons.print_msg(clazz, method, "{} of {} steps finished in {:.1f}s".format(
+        status.count('done'), len(steps), time.time() - pipeline_start))
+
+    if failure is not None:
+        log_pipeline(steps, plan, status)
+        raise failure
+
+
+def register_plugin(plugin):
+    def run_plugin(context):
+        plugin.run_action(context.args)
+        context.write_metric()
+
+    require_version = hasattr(plugin, 'require_version') and plugin.require_version is True
+    tasks[plugin.parser] = Task(plugin.parser, run_plugin, ('github',) if require_version else (), concurrent=False)
+
+
+cf_actions = {'deploy': ('artifact',), 'cutover': ('deployment',), 'promote': ('deployment',)}
+
+tasks = {task.name: task for task in [
+    Task('github', run_github, ('github', 'tracker', 'jira'), resolve_version=False,
+         produces={'version': ('version',)}, concurrent=False),
+    Task('tracker', run_tracker, ('github', 'tracker')),
+    Task('jira', run_jira, ('github', 'jira')),
+    Task('slack', run_slack, ('github', 'slack', 'tracker', 'jira'),
+         consumes={'release': ('artifact', 'deployment')}),
+    Task('sonar', run_sonar, ('github', 'sonar')),
+    Task('artifactory', run_artifactory, ('github', 'artifactory'),
+         consumes={'download': ('artifact',), 'upload': ('artifact',)}, produces={'upload': ('artifact',)}),
+    Task('cf', run_cf, ('github', 'cf'), consumes=cf_actions,
+         produces={action: ('deployment',) for action in cf_actions}, concurrent=False),
+    Task('gcappengine', run_gcappengine, ('github', 'gcappengine', 'artifactory'), consumes=('artifact',),
+         produces=('deployment',), concurrent=False),
+    Task('zipit', run_zipit, ('github',), produces=('artifact',)),
+    Task('servicenow', run_servicenow, ('github', 'servicenow', 'tracker', 'jira'), consumes=('artifact',)),
+    Task('pipeline', run_pipeline),
+]}
 
 
 def load_task_parsers(subparsers):
@@ -451,6 +740,17 @@ def load_task_parsers(subparsers):
     zipship_parser.add_argument('-v', '--version', help='(optional) If manually versioning, this is passed in by the '
                                                         'user.  Note: versionStrategy in buildConfig should be set to '
                                                         '"manual"')
+    zipship_parser.add_argument('--compression', help='(optional) Compress the tar using all cores. Possible values: '
+                                                      '\n none, gzip, xz, zstd (requires the zstandard package). '
+                                                      'Default none.',
+                                choices=['none'] + ParallelCompressor.compressions, default='none')
+    zipship_parser.add_argument('--level', help='(optional) Compression level. Defaults to 6 for gzip and xz, 3 for '
+                                                'zstd.', type=int)
+    zipship_parser.add_argument('--stream', help='(optional) Upload while the tar is being written instead of '
+                                                 'writing it to disk first.', action='store_true')
+    zipship_parser.add_argument('--reproducible', help='(optional) Build identical bytes for identical contents and '
+                                                       'skip archiving and upload when nothing changed since the last '
+                                                       'run.', action='store_true')
 
     gc_appengine_parser = subparsers.add_parser('gcappengine', help='Deployment to Google Cloud App Engine',
                                                 formatter_class=RawTextHelpFormatter)
@@ -470,6 +770,14 @@ def load_task_parsers(subparsers):
     service_now_parser = subparsers.add_parser("servicenow", help="ServiceNow task", formatter_class=RawTextHelpFormatter)
     service_now_parser.add_argument('action', help="ServiceNow task to execute. Possible values: \n "
                                               "createcr    - create a new CHG for")
+
+    pipeline_parser = subparsers.add_parser('pipeline', help='Run several tasks in one process',
+                                            formatter_class=RawTextHelpFormatter)
+    pipeline_parser.add_argument('steps', nargs='*', help='(optional) Tasks to run in order, each quoted with its '
+                                                          'action and flags, e.g. \n "github version" "artifactory '
+                                                          'upload" "slack release".  Defaults to the pipeline list '
+                                                          'in buildConfig.json.')
+
 def connect_error_dispatcher():
     clazz = 'aggregator'
     method = 'connect_error_dispatcher'
@@ -479,10 +787,10 @@ def connect_error_dispatcher():
     SIGNAL = 'publish-error-signal'
     if 'slack' in BuildConfig.json_config:
         commons.print_msg(clazz, method, 'Detected slack in buildConfig. Connecting error dispatcher to slack.')
-        dispatcher.connect(Slack.publish_error, signal=SIGNAL, sender=dispatcher.Any)
+        dispatcher.connect(load_integration('Slack').publish_error, signal=SIGNAL, sender=dispatcher.Any)
     elif BuildConfig.settings.has_section('slack'):
         commons.print_msg(clazz, method, 'Detected slack in global settings.ini.  Connecting error dispatcher to slack.')
-        dispatcher.connect(Slack.publish_error, signal=SIGNAL, sender=dispatcher.Any)
+        dispatcher.connect(load_integration('Slack').publish_error, signal=SIGNAL, sender=dispatcher.Any)
     else:
         commons.print_msg(clazz, method, 'No event dispatcher detected. The only place errors will show up is in this '
                                          'log.', 'WARN')
@@ -518,7 +826,7 @@ def create_deployment_directory():
             dir=BuildConfig.push_location, error=e), 'ERROR')
         exit(1)
 
-    commons.print_msg(CloudFoundry.clazz, method, 'end')
+    commons.print_msg(clazz, method, 'end')
 
 
 def call_github_getversion(git_hub_instance, file_path=None, open_func=open):
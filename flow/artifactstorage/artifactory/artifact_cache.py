@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# artifact_cache.py
+
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+
+import flow.utils.commons as commons
+
+
+class ArtifactCache:
+    """Local content-addressed store of downloaded artifacts, keyed by the sha1 Artifactory reports.
+
+    Entries are read-only and always handed out as copies, so changing a deployed artifact never changes the
+    cache.  An entry is hashed again before it is used and dropped if it no longer matches its sha1.  Once the
+    cache grows past max_size_bytes the least recently used entries are evicted.
+    """
+    clazz = 'ArtifactCache'
+    hash_chunk_size = 1024 * 1024
+    # entries being copied in by store, possibly by another build
+    temp_prefix = '.partial-'
+
+    def __init__(self, cache_directory, max_size_bytes):
+        self.cache_directory = os.path.join(cache_directory, 'artifactory')
+        self.max_size_bytes = max_size_bytes
+
+    def _entry_path(self, sha1):
+        sha1 = sha1.lower()
+        return os.path.join(self.cache_directory, sha1[:2], sha1)
+
+    @staticmethod
+    def _sha1(path):
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as handle:
+            for chunk in iter(lambda: handle.read(ArtifactCache.hash_chunk_size), b''):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def fetch(self, sha1, destination, size=None):
+        """Places the cached artifact at destination.  Returns False on a miss."""
+        method = 'fetch'
+
+        entry = self._entry_path(sha1)
+
+        try:
+            if not os.path.isfile(entry) or (size is not None and os.path.getsize(entry) != size):
+                return False
+
+            if self._sha1(entry) != sha1.lower():
+                commons.print_msg(ArtifactCache.clazz, method, "Dropping corrupt cached artifact {}".format(entry),
+                                  'WARN')
+                os.remove(entry)
+                return False
+
+            # mark as recently used for eviction
+            os.utime(entry)
+
+            if os.path.lexists(destination):
+                os.remove(destination)
+            shutil.copyfile(entry, destination)
+        except OSError as e:
+            commons.print_msg(ArtifactCache.clazz, method, "Unable to use cached artifact {}: {}".format(entry, e),
+                              'WARN')
+            return False
+
+        commons.print_msg(ArtifactCache.clazz, method, "Cache hit for sha1 {}".format(sha1))
+        return True
+
+    def store(self, sha1, source):
+        method = 'store'
+
+        entry = self._entry_path(sha1)
+
+        try:
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+
+            if not os.path.isfile(entry):
+                # stage next to the entry and swap it in so concurrent builds never see a partial file
+                handle, temp_file = tempfile.mkstemp(prefix=ArtifactCache.temp_prefix, dir=os.path.dirname(entry))
+                os.close(handle)
+                os.remove(temp_file)
+                shutil.copyfile(source, temp_file)
+                os.chmod(temp_file, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                os.replace(temp_file, entry)
+
+            self.evict()
+        except OSError as e:
+            commons.print_msg(ArtifactCache.clazz, method, "Unable to cache artifact {}: {}".format(source, e),
+                              'WARN')
+
+    def evict(self):
+        method = 'evict'
+
+        entries = []
+        total_size = 0
+        for directory, _, files in os.walk(self.cache_directory):
+            for file_name in files:
+                if file_name.startswith(ArtifactCache.temp_prefix):
+                    continue
+                path = os.path.join(directory, file_name)
+                try:
+                    file_stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((file_stat.st_mtime, file_stat.st_size, path))
+                total_size += file_stat.st_size
+
+        # oldest first
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+                commons.print_msg(ArtifactCache.clazz, method, "Evicted {}".format(path))
+            except OSError:
+                pass
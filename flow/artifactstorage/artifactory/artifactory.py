@@ -1,17 +1,23 @@
 #!/usr/bin/python
 # artifactory.py
 
+import hashlib
 import json
+import multiprocessing
 import os
 import os.path
 import tarfile
+import time
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
 
 import requests
 from flow.artifactstorage.artifact_storage_abc import Artifact_Storage
+from flow.artifactstorage.artifactory.artifact_cache import ArtifactCache
 from flow.buildconfig import BuildConfig
 
 import flow.utils.commons as commons
+import flow.utils.httpclient as httpclient
 
 
 class ArtifactDownloadException(Exception):
@@ -22,6 +28,55 @@ class ArtifactException(Exception):
     pass
 
 
+class _HashingReader:
+    """File-like wrapper that hashes everything read through it."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha1 = hashlib.sha1()
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.sha1.update(data)
+        return data
+
+    def drain(self):
+        for chunk in iter(lambda: self.read(1024 * 1024), b''):
+            pass
+
+
+tar_extensions = ["tar.gz", "tar", "tgz"]
+
+
+def _extract_tar(tar, download_dir):
+    if hasattr(tarfile, 'data_filter'):
+        tar.extraction_filter = tarfile.data_filter
+
+    destination = os.path.realpath(download_dir)
+
+    # works for both random access and stream ('r|*') archives since members are handled in order
+    for member in tar:
+        if not commons.is_safe_tar_member(member, destination):
+            raise ArtifactException("Unsafe archive member {}".format(member.name))
+        tar.extract(member, download_dir)
+
+
+def _extract_archive(download_path, download_dir, extension):
+    # module level (and free of logging) so it can run in a process pool worker.  returns seconds spent.
+    start_time = time.time()
+
+    if extension in tar_extensions:
+        with tarfile.open(download_path) as tar:
+            _extract_tar(tar, download_dir)
+        os.remove(download_path)
+    elif extension == "zip":
+        with zipfile.ZipFile(download_path, "r") as z:
+            z.extractall(download_dir)
+        os.remove(download_path)
+
+    return time.time() - start_time
+
+
 class Artifactory(Artifact_Storage):
     clazz = 'Artifactory'
 
@@ -34,6 +89,7 @@ class Artifactory(Artifact_Storage):
     pom_file = None
     config = BuildConfig
     http_timeout = 60
+    checksum_chunk_size = 1024 * 1024
 
     def __init__(self, config_override=None):
         method = '__init__'
@@ -42,6 +98,8 @@ class Artifactory(Artifact_Storage):
         if config_override is not None:
             self.config = config_override
 
+        self.artifact_indexes = {}
+
         try:
             # below line is to maintain backwards compatibility since stanza was renamed
             if 'artifactoryConfig' in self.config.json_config:
@@ -71,99 +129,135 @@ class Artifactory(Artifact_Storage):
 
         commons.print_msg(Artifactory.clazz, method, 'end')
 
+    def _get_publish_auth_and_headers(self, method):
+        headers = {'Content-type': commons.content_oct_stream, 'Accept': commons.content_json}
+
+        # token and user env variables
+        if os.getenv('ARTIFACTORY_TOKEN') and os.getenv('ARTIFACTORY_USER'):
+            commons.print_msg(Artifactory.clazz, method, 'Found artifactory token and user.')
+
+            return (os.getenv('ARTIFACTORY_USER'), os.getenv('ARTIFACTORY_TOKEN')), headers
+
+        # token environment var and user defined in settings.ini
+        elif os.getenv('ARTIFACTORY_TOKEN') and BuildConfig.settings.has_section('artifactory') and \
+                BuildConfig.settings.has_option('artifactory', 'user'):
+            commons.print_msg(Artifactory.clazz, method, 'Found artifactory token.  Using default user '
+                                                         'specified in settings.ini.')
+
+            return (BuildConfig.settings.get('artifactory', 'user'), os.getenv('ARTIFACTORY_TOKEN')), headers
+
+        # token only and assumed to be api key
+        elif os.getenv('ARTIFACTORY_TOKEN'):
+            commons.print_msg(Artifactory.clazz, method, 'Found artifactory token.  Assuming it\'s API key.')
+
+            headers['X-Api-Key'] = os.getenv('ARTIFACTORY_TOKEN')
+
+            return None, headers
+
+        commons.print_msg(Artifactory.clazz, method, 'No artifactory user specified.  This operation may '
+                                                     'fail if anonymous access is not allowed. To specify '
+                                                     'user, set environment variable \'ARTIFACTORY_TOKEN\' '
+                                                     'and \'ARTIFACTORY_USER\'.',
+                          'WARN')
+
+        return None, headers
+
+    def _deploy_by_checksum(self, file_url, file_name, checksums, auth, headers, method):
+        """
+        Deploys an artifact without sending its content.  Returns None when the url already holds exactly this
+        content, otherwise the response of the checksum deploy PUT, which is a 201 when artifactory already had a
+        blob with these checksums.
+        """
+        headers.update({'X-Checksum-Sha1': checksums['sha1'],
+                        'X-Checksum-Sha256': checksums['sha256'],
+                        'X-Checksum': checksums['md5']})
+
+        commons.print_msg(Artifactory.clazz, method, "Checking url {} for existing artifact.".format(file_url))
+
+        artifact_exist_check_resp = httpclient.head(file_url, auth=auth, headers=headers, timeout=self.http_timeout)
+        if artifact_exist_check_resp.status_code == 200:
+            if artifact_exist_check_resp.headers.get('X-Checksum-Sha1') == checksums['sha1']:
+                commons.print_msg(Artifactory.clazz, method, "Artifact {} with version {} is already published with "
+                                                             "the same content.  Skipping upload.".format(
+                                                                file_name, self.config.version_number))
+                return None
+
+            commons.print_msg(Artifactory.clazz, method, "Artifact with version {} already exists. "
+                                                         "Removing and attempting to publish."
+                              .format(self.config.version_number),
+                              "WARN")
+
+        # Attempt to DELETE current artifact first and upload new one instead of PUT to work around
+        # broken pipe error when Artifactory terminates early on a larger payload if Artifactory user
+        # does not have DELETE permission
+        commons.print_msg(Artifactory.clazz, method, "Publishing to {}".format(file_url))
+
+        remove_resp = httpclient.delete(file_url, auth=auth, headers=headers, timeout=self.http_timeout)
+
+        self._check_artifact_permissions(remove_resp, method)
+
+        # if artifactory already holds a blob with these checksums it links it without any upload
+        checksum_deploy_headers = dict(headers, **{'X-Checksum-Deploy': 'true'})
+        return httpclient.put(file_url, auth=auth, headers=checksum_deploy_headers, timeout=self.http_timeout)
+
+    def deploy_by_checksum(self, file_name, checksums):
+        """
+        Publish file_name using only the checksums of content artifactory may already hold, e.g. an identical
+        archive published under another version.
+        :return: True when the artifact is in place, False when the content has to be uploaded
+        """
+        method = 'deploy_by_checksum'
+        commons.print_msg(Artifactory.clazz, method, 'begin')
+
+        try:
+            file_url = "{artifact_home}/{file}".format(artifact_home=self.get_artifact_home_url(), file=file_name)
+
+            auth, headers = self._get_publish_auth_and_headers(method)
+
+            resp = self._deploy_by_checksum(file_url, file_name, checksums, auth, headers, method)
+        except requests.ConnectionError as e:
+            commons.print_msg(Artifactory.clazz, method, "Request to Artifactory raised a ConnectionError: {}"
+                              .format(e), "ERROR")
+            exit(1)
+        except Exception as ex:
+            commons.print_msg(Artifactory.clazz, method, "Failed publishing to artifactory: {}. Sometimes this can be "
+                                                         "due to an invalid user name/password.".format(ex), 'ERROR')
+            exit(1)
+
+        # noinspection PyUnboundLocalVariable
+        published = resp is None or resp.status_code == 201
+        if resp is not None:
+            commons.print_msg(Artifactory.clazz, method, "Checksum deploy of {} returned {}".format(file_name,
+                                                                                                   resp.status_code))
+
+        commons.print_msg(Artifactory.clazz, method, 'end')
+        return published
+
     def publish(self, file, file_name):
         method = 'publish'
         commons.print_msg(Artifactory.clazz, method, 'begin')
 
-        headers = {'Content-type': commons.content_oct_stream, 'Accept': commons.content_json}
-
         try:
             with open(file, 'rb') as zip_file:
                 file_url = "{artifact_home}/{file}".format(artifact_home=self.get_artifact_home_url(), file=file_name)
-                commons.print_msg(Artifactory.clazz, method, "Checking url {} for existing artifact.".format(file_url))
-
-                artifact_exist_check_resp = requests.get(file_url, timeout=self.http_timeout)
-                if artifact_exist_check_resp.status_code == 200:
-                    commons.print_msg(Artifactory.clazz, method, "Artifact with version {} already exists. "
-                                                                 "Removing and attempting to publish."
-                                      .format(self.config.version_number),
-                                      "WARN")
-
-                # Attempt to DELETE current artifact first and upload new one instead of PUT to work around
-                # broken pipe error when Artifactory terminates early on a larger payload if Artifactory user
-                # does not have DELETE permission
-                commons.print_msg(Artifactory.clazz, method, "Publishing to {}".format(file_url))
-
-                # token and user env variables
-                if os.getenv('ARTIFACTORY_TOKEN') and os.getenv('ARTIFACTORY_USER'):
-                    commons.print_msg(Artifactory.clazz, method, 'Found artifactory token and user.')
-
-                    remove_resp = requests.delete(file_url,
-                                                  auth=(os.getenv('ARTIFACTORY_USER'), os.getenv('ARTIFACTORY_TOKEN')),
-                                                  headers=headers,
-                                                  timeout=self.http_timeout)
-
-                    self._check_artifact_permissions(remove_resp, method)
-
-                    resp = requests.put(file_url,
-                                        auth=(os.getenv('ARTIFACTORY_USER'), os.getenv('ARTIFACTORY_TOKEN')),
-                                        headers=headers,
-                                        data=zip_file,
-                                        timeout=self.http_timeout)
-
-                # token environment var and user defined in settings.ini
-                elif os.getenv('ARTIFACTORY_TOKEN') and BuildConfig.settings.has_section('artifactory') and \
-                        BuildConfig.settings.has_option('artifactory', 'user'):
-                    commons.print_msg(Artifactory.clazz, method, 'Found artifactory token.  Using default user '
-                                                                 'specified in settings.ini.')
-
-                    remove_resp = requests.delete(file_url,
-                                                  auth=(BuildConfig.settings.get('artifactory', 'user'),
-                                                        os.getenv('ARTIFACTORY_TOKEN')),
-                                                  headers=headers,
-                                                  timeout=self.http_timeout)
-
-                    self._check_artifact_permissions(remove_resp, method)
-
-                    resp = requests.put(file_url,
-                                        auth=(BuildConfig.settings.get('artifactory', 'user'),
-                                              os.getenv('ARTIFACTORY_TOKEN')),
-                                        headers=headers,
-                                        data=zip_file,
-                                        timeout=self.http_timeout)
-
-                # token only and assumed to be api key
-                elif os.getenv('ARTIFACTORY_TOKEN'):
-                    commons.print_msg(Artifactory.clazz, method, 'Found artifactory token.  Assuming it\'s API key.')
-
-                    headers = {'X-Api-Key': os.getenv('ARTIFACTORY_TOKEN'),
-                               'Content-type': commons.content_oct_stream,
-                               'Accept': commons.content_json}
-
-                    remove_resp = requests.delete(file_url,
-                                                  headers=headers,
-                                                  timeout=self.http_timeout)
-
-                    self._check_artifact_permissions(remove_resp, method)
-
-                    resp = requests.put(file_url,
-                                        headers=headers,
-                                        data=zip_file,
-                                        timeout=self.http_timeout)
 
+                auth, headers = self._get_publish_auth_and_headers(method)
+
+                checksums = commons.compute_checksums(zip_file, Artifactory.checksum_chunk_size)
+
+                resp = self._deploy_by_checksum(file_url, file_name, checksums, auth, headers, method)
+                if resp is None:
+                    commons.print_msg(Artifactory.clazz, method, 'end')
+                    return
+
+                if resp.status_code == 201:
+                    commons.print_msg(Artifactory.clazz, method, "Published {} with checksum deploy".format(file_name))
                 else:
-                    commons.print_msg(Artifactory.clazz, method, 'No artifactory user specified.  This operation may '
-                                                                 'fail if anonymous access is not allowed. To specify '
-                                                                 'user, set environment variable \'ARTIFACTORY_TOKEN\' '
-                                                                 'and \'ARTIFACTORY_USER\'.',
-                                      'WARN')
-
-                    remove_resp = requests.delete(file_url,
-                                                  headers=headers,
-                                                  timeout=self.http_timeout)
-
-                    self._check_artifact_permissions(remove_resp, method)
-                    resp = requests.put(file_url, headers=headers, data=zip_file, timeout=self.http_timeout)
+                    commons.print_msg(Artifactory.clazz, method, "Checksum deploy not possible (status {}), "
+                                                                 "uploading content".format(resp.status_code))
+                    zip_file.seek(0)
+                    resp = httpclient.put(file_url, auth=auth, headers=headers, data=zip_file,
+                                          timeout=self.http_timeout)
         except requests.ConnectionError as e:
             error = str(e)
             commons.print_msg(Artifactory.clazz, method, "Request to Artifactory raised a ConnectionError: {}"
@@ -194,13 +288,88 @@ class Artifactory(Artifact_Storage):
 
         commons.print_msg(Artifactory.clazz, method, 'end')
 
+    def publish_stream(self, chunks, file_name, checksums):
+        """
+        Publish content that is still being produced, e.g. a tar written by another thread.
+
+        The body is sent with chunked transfer encoding as the chunks arrive, so it can only be sent once and is
+        never retried.  checksums is called once the body has been sent and must return the sha1 and md5 of
+        everything that was uploaded.  They are compared with the checksums artifactory calculated.
+        """
+        method = 'publish_stream'
+        commons.print_msg(Artifactory.clazz, method, 'begin')
+
+        # failures producing the content surface through the http client, keep them apart from upload failures
+        produce_errors = []
+
+        def _body():
+            try:
+                yield from chunks
+            except Exception as e:
+                produce_errors.append(e)
+                raise
+
+        try:
+            file_url = "{artifact_home}/{file}".format(artifact_home=self.get_artifact_home_url(), file=file_name)
+
+            auth, headers = self._get_publish_auth_and_headers(method)
+
+            commons.print_msg(Artifactory.clazz, method, "Streaming to {}".format(file_url))
+
+            remove_resp = httpclient.delete(file_url, auth=auth, headers=headers, timeout=self.http_timeout)
+
+            self._check_artifact_permissions(remove_resp, method)
+
+            resp = httpclient.put(file_url, auth=auth, headers=headers, data=_body(), retry=False,
+                                  timeout=self.http_timeout)
+        except Exception as ex:
+            if produce_errors:
+                commons.print_msg(Artifactory.clazz, method, "Failed producing {} while uploading it: {}".format(
+                    file_name, produce_errors[0]), 'ERROR')
+            elif isinstance(ex, requests.ConnectionError):
+                commons.print_msg(Artifactory.clazz, method, "Request to Artifactory raised a ConnectionError: {}"
+                                  .format(ex), "ERROR")
+            else:
+                commons.print_msg(Artifactory.clazz, method, "Failed publishing to artifactory: {}. Sometimes this can "
+                                                             "be due to an invalid user name/password.".format(ex),
+                                  'ERROR')
+            exit(1)
+
+        # noinspection PyUnboundLocalVariable
+        commons.print_msg(Artifactory.clazz, method, "resp status code: {}".format(resp.status_code))
+
+        if resp.status_code != 201:
+            commons.print_msg(Artifactory.clazz,
+                              method,
+                              "Publish to artifactory failed to {url} Response: {response}".format(url=file_url,
+                                                                                                   response=resp.text),
+                              'ERROR')
+            exit(1)
+
+        try:
+            stored_checksums = resp.json().get('checksums', {})
+        except ValueError:
+            stored_checksums = {}
+
+        sent_checksums = checksums()
+        for algorithm in ['sha1', 'md5']:
+            if algorithm in stored_checksums and stored_checksums[algorithm] != sent_checksums[algorithm]:
+                commons.print_msg(Artifactory.clazz, method, "Artifactory stored {} {} but {} was sent for "
+                                                             "{}".format(algorithm, stored_checksums[algorithm],
+                                                                         sent_checksums[algorithm], file_url),
+                                  'ERROR')
+                exit(1)
+
+        commons.print_msg(Artifactory.clazz, method, "Published {} with sha1 {}".format(file_name,
+                                                                                       sent_checksums['sha1']))
+        commons.print_msg(Artifactory.clazz, method, 'end')
+
     def publish_build_artifact(self):
         method = 'publish_build_artifact'
         commons.print_msg(Artifactory.clazz, method, 'begin')
 
         self._get_artifactory_files_name_from_build_dir()
-        for file in Artifactory.artifactory_files:
-            self.publish(file["artifactory_file"], file["artifactory_filename"])
+        artifacts = [(file["artifactory_file"], file["artifactory_filename"]) for file in Artifactory.artifactory_files]
 
         if 'artifactoryConfig' in self.config.json_config:
             artifactory_json_config = self.config.json_config['artifactoryConfig']
@@ -209,7 +378,26 @@ class Artifactory(Artifact_Storage):
 
         if 'includePom' in artifactory_json_config:
             commons.print_msg(Artifactory.clazz, method, 'POM needed, publishing to artifactory')
-            self.publish(Artifactory.pom_file, Artifactory.pom_filename)
+            artifacts.append((Artifactory.pom_file, Artifactory.pom_filename))
+
+        results = {}
+
+        def _publish(artifact):
+            file, file_name = artifact
+            results[file_name] = 'failed'
+            start_time = time.time()
+            self.publish(file, file_name)
+            results[file_name] = 'published in {:.1f}s'.format(time.time() - start_time)
+
+        max_workers = commons.get_int_setting(self.config.settings, 'artifactory', 'max_concurrent_uploads', 3)
+
+        try:
+            # the first failed upload cancels the ones that have not started yet
+            commons.map_concurrently(_publish, artifacts, max_workers, fail_fast=True)
+        finally:
+            for _, file_name in artifacts:
+                commons.print_msg(Artifactory.clazz, method, "{}: {}".format(file_name,
+                                                                            results.get(file_name, 'cancelled')))
 
         commons.print_msg(Artifactory.clazz, method, 'end')
 
@@ -300,8 +488,42 @@ class Artifactory(Artifact_Storage):
                        "/" + self.config.project_name + \
                        "/" + self.config.version_number
 
+        matching_files = self._get_artifact_index(arti_api_url).get(extension, [])
+
+        for artifact_to_deploy in matching_files:
+            commons.print_msg(Artifactory.clazz, method, ("Found match ", artifact_to_deploy))
+
+        if len(matching_files) == 1:
+            return "%s/%s/%s/%s/%s%s" % (self.artifactory_domain,
+                                         self.repo_key,
+                                         self.artifactory_group,
+                                         self.config.project_name,
+                                         self.config.version_number,
+                                         matching_files[0])
+        elif len(matching_files) > 1:
+            commons.print_msg(Artifactory.clazz, method, "Found more than 1 artifact in {}".format(arti_api_url), 'ERROR')
+            raise ArtifactException("Found more than 1 artifact in {}".format(arti_api_url))
+
+        else:
+            commons.print_msg(Artifactory.clazz,
+                              method,
+                             "Could not locate artifact {}".format(extension),
+                             "ERROR")
+            raise ArtifactException("Could not locate artifact {}".format(extension))
+
+    def _get_artifact_index(self, arti_api_url):
+        """
+        Folder listing for a version, indexed by every dotted suffix of each file name so that
+        'testproject-1.0.0.tar.gz' is found under both 'gz' and 'tar.gz'.  Fetched once per version and shared
+        by every extension lookup.
+        """
+        method = "_get_artifact_index"
+
+        if arti_api_url in self.artifact_indexes:
+            return self.artifact_indexes[arti_api_url]
+
         try:
-            resp = requests.get(arti_api_url, timeout=self.http_timeout)
+            resp = httpclient.get(arti_api_url, timeout=self.http_timeout)
         except requests.ConnectionError as e:
             commons.print_msg(Artifactory.clazz, method, "Request to Artifactory timed out.", "ERROR")
             raise ArtifactException(e)
@@ -321,62 +543,250 @@ class Artifactory(Artifact_Storage):
 
         json_data = json.loads(resp.text)
 
-        matching_file_count = 0
-
+        artifact_index = {}
         for child in json_data['children']:
             child_uri = child['uri']
-            if child_uri.endswith("." + extension):
-                matching_file_count += 1
-                artifact_to_deploy = child['uri']
-                commons.print_msg(Artifactory.clazz, method, ("Found match ", artifact_to_deploy))
+            file_name = child_uri.rsplit('/', 1)[-1]
+            position = file_name.find('.')
+            while position != -1:
+                artifact_index.setdefault(file_name[position + 1:], []).append(child_uri)
+                position = file_name.find('.', position + 1)
 
-        if matching_file_count == 1:
-            # noinspection PyUnboundLocalVariable
-            return "%s/%s/%s/%s/%s%s" % (self.artifactory_domain,
-                                         self.repo_key,
-                                         self.artifactory_group,
-                                         self.config.project_name,
-                                         self.config.version_number,
-                                         artifact_to_deploy)
-        elif matching_file_count > 1:
-            commons.print_msg(Artifactory.clazz, method, "Found more than 1 artifact in {}".format(arti_api_url), 'ERROR')
-            raise ArtifactException("Found more than 1 artifact in {}".format(arti_api_url))
-
-        else:
-            commons.print_msg(Artifactory.clazz,
-                              method,
-                             "Could not locate artifact {}".format(extension),
-                             "ERROR")
-            raise ArtifactException("Could not locate artifact {}".format(extension))
+        self.artifact_indexes[arti_api_url] = artifact_index
+        return artifact_index
 
     def download_artifact(self, artifact_url, download_path):
         """
         Download the artifact from artifactory. Really just a save a url to a file method.
+
+        Large artifacts are fetched as parallel byte ranges, smaller ones are streamed and resumed from the .part
+        file if the connection drops.  Either way the result is verified against the sha1 artifactory reports.
+        When the local artifact cache is enabled, an artifact with a known sha1 is only downloaded once per agent.
         :param artifact_url: obviously, the artifact url
         :param download_path: Where you want the file to go
         :return: nothing, exceptions raised if it fails
         """
         method = "download_artifact"
+
+        part_path = download_path + '.part'
+
         try:
-            with open(download_path, 'wb') as handle:
-                response = requests.get(artifact_url, stream=True)
-                if not response.ok:
-                    response.raise_for_status()
+            size = None
+            accepts_ranges = False
+            expected_sha1 = None
+
+            info = httpclient.head(artifact_url, timeout=self.http_timeout)
+            if info.ok:
+                size = int(info.headers['Content-Length']) if 'Content-Length' in info.headers else None
+                accepts_ranges = info.headers.get('Accept-Ranges') == 'bytes'
+                expected_sha1 = info.headers.get('X-Checksum-Sha1')
+
+            cache = self._get_artifact_cache()
+            if cache is not None and expected_sha1 and cache.fetch(expected_sha1, download_path, size):
+                commons.print_msg(Artifactory.clazz, method, "Using cached copy of {}".format(artifact_url))
+                return
+
+            threshold = commons.get_int_setting(self.config.settings, 'artifactory',
+                                                'parallel_download_threshold_mb', 100) * 1024 * 1024
+            segments = commons.get_int_setting(self.config.settings, 'artifactory', 'download_segments', 4)
+
+            if accepts_ranges and size is not None and size >= threshold and segments > 1:
+                commons.print_msg(Artifactory.clazz, method, "Downloading {} in {} parallel segments".format(
+                    artifact_url, segments))
+                self._download_segments(artifact_url, part_path, size, segments)
+                actual_sha1 = self._file_sha1(part_path)
+            else:
+                actual_sha1, response_sha1 = self._download_resumable(artifact_url, part_path, size, accepts_ranges)
+                expected_sha1 = expected_sha1 or response_sha1
+
+            if expected_sha1 and actual_sha1 != expected_sha1:
+                os.remove(part_path)
+                raise ArtifactDownloadException("Checksum mismatch for {url}.  Expected sha1 {expected} but "
+                                                "downloaded {actual}".format(url=artifact_url,
+                                                                             expected=expected_sha1,
+                                                                             actual=actual_sha1))
+
+            os.replace(part_path, download_path)
 
-                for block in response.iter_content(1024):
-                    handle.write(block)
+            if cache is not None and expected_sha1:
+                cache.store(expected_sha1, download_path)
 
         except Exception as e:
             commons.print_msg(Artifactory.clazz, method, 'Failed to download {}'.format(artifact_url), 'ERROR')
             commons.print_msg(Artifactory.clazz, method, "URLError is {msg}".format(msg=e))
+            if isinstance(e, ArtifactDownloadException):
+                raise
             raise ArtifactDownloadException(e)
 
+    def _get_artifact_cache(self):
+        cache_directory = commons.get_setting(self.config.settings, 'artifactory', 'cache_directory')
+        if not cache_directory:
+            return None
+
+        max_size_mb = commons.get_int_setting(self.config.settings, 'artifactory', 'cache_max_size_mb', 2048)
+        return ArtifactCache(os.path.expanduser(cache_directory), max_size_mb * 1024 * 1024)
+
+    def _get_download_chunk_size(self):
+        return commons.get_int_setting(self.config.settings, 'artifactory', 'download_chunk_size_kb', 1024) * 1024
+
+    def _write_stream(self, response, handle, sha1=None):
+        # read straight into a reusable buffer instead of allocating a new bytes object per chunk
+        buffer = bytearray(self._get_download_chunk_size())
+        view = memoryview(buffer)
+        written = 0
+
+        response.raw.decode_content = True
+        while True:
+            count = response.raw.readinto(buffer)
+            if not count:
+                break
+            handle.write(view[:count])
+            if sha1 is not None:
+                sha1.update(view[:count])
+            written += count
+
+        return written
+
+    def _file_sha1(self, path, sha1=None):
+        sha1 = sha1 or hashlib.sha1()
+        with open(path, 'rb') as handle:
+            for chunk in iter(lambda: handle.read(self._get_download_chunk_size()), b''):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def _download_resumable(self, artifact_url, part_path, size, accepts_ranges):
+        method = '_download_resumable'
+
+        retries = commons.get_int_setting(self.config.settings, 'artifactory', 'download_retries', 3)
+        attempts = 0
+
+        sha1 = hashlib.sha1()
+        offset = 0
+        # a .part that is already full size (or larger) cannot be resumed, it is downloaded again from byte 0
+        if accepts_ranges and os.path.isfile(part_path) and (size is None or os.path.getsize(part_path) < size):
+            offset = os.path.getsize(part_path)
+            self._file_sha1(part_path, sha1)
+            commons.print_msg(Artifactory.clazz, method, "Resuming {} at byte {}".format(artifact_url, offset))
+
+        while True:
+            headers = {'Range': 'bytes={}-'.format(offset)} if offset else {}
+
+            try:
+                response = httpclient.get(artifact_url, headers=headers, stream=True, timeout=self.http_timeout)
+                if offset and response.status_code == 416:
+                    response.close()
+                    commons.print_msg(Artifactory.clazz, method, "Cannot resume {} at byte {}.  Starting over".format(
+                        artifact_url, offset), 'WARN')
+                    offset = 0
+                    sha1 = hashlib.sha1()
+                    continue
+                if offset and response.status_code != 206:
+                    # range ignored, start over
+                    offset = 0
+                    sha1 = hashlib.sha1()
+                if not response.ok:
+                    response.raise_for_status()
+
+                with open(part_path, 'ab' if offset else 'wb') as handle:
+                    offset += self._write_stream(response, handle, sha1)
+
+                if size is not None and offset < size:
+                    raise requests.exceptions.ChunkedEncodingError("Connection closed after {} of {} bytes".format(
+                        offset, size))
+
+                return sha1.hexdigest(), response.headers.get('X-Checksum-Sha1')
+
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as e:
+                attempts += 1
+                if not accepts_ranges or attempts > retries:
+                    raise
+
+                offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+                sha1 = hashlib.sha1()
+                if offset:
+                    self._file_sha1(part_path, sha1)
+                commons.print_msg(Artifactory.clazz, method, "Download interrupted ({}).  Resuming at byte {}".format(
+                    e, offset), 'WARN')
+
+    def _download_segments(self, artifact_url, part_path, size, segments):
+        method = '_download_segments'
+
+        retries = commons.get_int_setting(self.config.settings, 'artifactory', 'download_retries', 3)
+
+        with open(part_path, 'wb') as handle:
+            handle.truncate(size)
+
+        segment_size = -(-size // segments)
+        byte_ranges = [(start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)]
+
+        def _fetch(byte_range):
+            position, end = byte_range
+            attempts = 0
+
+            while position <= end:
+                try:
+                    response = httpclient.get(artifact_url, headers={'Range': 'bytes={}-{}'.format(position, end)},
+                                              stream=True, timeout=self.http_timeout)
+                    if response.status_code != 206:
+                        response.raise_for_status()
+                        raise ArtifactDownloadException("Range request for {} was not honored".format(artifact_url))
+
+                    with open(part_path, 'r+b') as handle:
+                        handle.seek(position)
+                        position += self._write_stream(response, handle)
+
+                    if position <= end:
+                        raise requests.exceptions.ChunkedEncodingError("Connection closed at byte {}".format(position))
+
+                except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                        requests.exceptions.Timeout) as e:
+                    attempts += 1
+                    if attempts > retries:
+                        raise
+                    commons.print_msg(Artifactory.clazz, method, "Segment interrupted ({}).  Resuming at byte "
+                                                                 "{}".format(e, position), 'WARN')
+
+        commons.map_concurrently(_fetch, byte_ranges, segments, fail_fast=True)
+
     def download_and_extract_artifacts_locally(self, download_dir, extract=True):
-        for extension in self.artifactory_extensions:
-            self._download_and_extract_artifact_locally(download_dir, extension, extract=extract)
+        """
+        Downloads every configured extension concurrently.  Each archive is extracted in a worker process as soon
+        as its own download finishes, so decompression of one overlaps the transfer of the others.
+        """
+        method = 'download_and_extract_artifacts_locally'
+
+        commons.verify_version(self.config)
+
+        # concurrent downloads of the same extension would share a .part file
+        extensions = list(dict.fromkeys(self.artifactory_extensions))
+        max_workers = commons.get_int_setting(self.config.settings, 'artifactory', 'max_concurrent_downloads', 3)
+
+        results = {}
+
+        def _download_and_extract(extension):
+            results[extension] = 'failed'
+            results[extension] = self._download_and_extract_artifact_locally(download_dir, extension,
+                                                                             extract=extract,
+                                                                             extract_pool=extract_pool)
+
+        extract_pool = None
+        if extract and len(extensions) > 1 and max_workers > 1:
+            # spawned rather than forked, the workers start from a download thread while other threads are running
+            extract_pool = ProcessPoolExecutor(max_workers=min(len(extensions), os.cpu_count() or 1),
+                                               mp_context=multiprocessing.get_context('spawn'))
+
+        try:
+            commons.map_concurrently(_download_and_extract, extensions, max_workers, fail_fast=True)
+        finally:
+            if extract_pool is not None:
+                extract_pool.shutdown(wait=True)
+            for extension in extensions:
+                commons.print_msg(Artifactory.clazz, method, "{}: {}".format(extension,
+                                                                            results.get(extension, 'cancelled')))
 
     # noinspection PyUnboundLocalVariable
-    def _download_and_extract_artifact_locally(self, download_dir, extension, extract=True):
+    def _download_and_extract_artifact_locally(self, download_dir, extension, extract=True, extract_pool=None):
         method = "_download_and_extract_artifact_locally"
 
         commons.print_msg(Artifactory.clazz, method, 'begin')
@@ -386,7 +796,7 @@ class Artifactory(Artifact_Storage):
         artifact_to_download = self.config.project_name + '-' + self.config.version_number + '.' + extension
 
         try:
-            artifact = self.get_artifact_url()
+            artifact = self._get_artifact_url(extension)
 
             download_path = download_dir + artifact_to_download
 
@@ -399,6 +809,23 @@ class Artifactory(Artifact_Storage):
         except ArtifactException:
             exit(1)
 
+        start_time = time.time()
+
+        # a streamed archive never lands on disk, so it can't be cached.  the cache wins when both are enabled.
+        if extract and extension in tar_extensions and self._get_artifact_cache() is None and \
+                commons.get_bool_setting(self.config.settings, 'artifactory', 'stream_extract', False):
+            # unpack while the bytes arrive, the archive itself never touches the disk
+            try:
+                commons.print_msg(Artifactory.clazz, method, 'Streaming and extracting tar {}'.format(artifact))
+                self._stream_extract_artifact(artifact, download_dir)
+            except (ArtifactDownloadException, ArtifactException) as e:
+                commons.print_msg(Artifactory.clazz, method, 'Failed to download {}'.format(artifact), 'ERROR')
+                commons.print_msg(Artifactory.clazz, method, "URLError is {msg}".format(msg=e))
+                exit(1)
+
+            commons.print_msg(Artifactory.clazz, method, 'end')
+            return 'streamed and extracted in {:.1f}s'.format(time.time() - start_time)
+
         try:
             self.download_artifact(artifact, download_path)
         except ArtifactDownloadException as e:
@@ -407,21 +834,63 @@ class Artifactory(Artifact_Storage):
             os.system('stty sane')
             exit(1)
 
-        if extract:
+        timing = 'downloaded in {:.1f}s'.format(time.time() - start_time)
+
+        if extract and (extension in tar_extensions or extension == "zip"):
             # Unzip/untar file downloaded from Artifactory if required
-            if extension == "tar.gz" or extension == "tar" or extension == "tgz":
-                commons.print_msg(Artifactory.clazz, method, 'Extracting tar {}'.format(download_path))
-                tar = tarfile.open(download_path)
-                tar.extractall(download_dir)
-                tar.close()
-                os.remove(download_path)
-            if extension == "zip":
-                commons.print_msg(Artifactory.clazz, method, "Extracting zip {}".format(download_path))
-                with zipfile.ZipFile(download_path, "r") as z:
-                    z.extractall(download_dir)
-                os.remove(download_path)
+            commons.print_msg(Artifactory.clazz, method, 'Extracting {}'.format(download_path))
+            try:
+                if extract_pool is not None:
+                    extract_seconds = extract_pool.submit(_extract_archive, download_path, download_dir,
+                                                          extension).result()
+                else:
+                    extract_seconds = _extract_archive(download_path, download_dir, extension)
+            except ArtifactException as e:
+                commons.print_msg(Artifactory.clazz, method, "Refusing to extract {}".format(e), 'ERROR')
+                exit(1)
+
+            timing += ', extracted in {:.1f}s'.format(extract_seconds)
 
         commons.print_msg(Artifactory.clazz, method, 'end')
+        return timing
+
+    def _stream_extract_artifact(self, artifact_url, download_dir):
+        method = '_stream_extract_artifact'
+
+        try:
+            response = httpclient.get(artifact_url, stream=True, timeout=self.http_timeout)
+            if not response.ok:
+                response.raise_for_status()
+
+            response.raw.decode_content = True
+            reader = _HashingReader(response.raw)
+
+            with tarfile.open(fileobj=reader, mode='r|*') as tar:
+                self._extract_tar_members(tar, download_dir)
+
+            # consume the end-of-archive padding so the checksum covers every byte
+            reader.drain()
+        except ArtifactException:
+            raise
+        except Exception as e:
+            raise ArtifactDownloadException(e)
+
+        expected_sha1 = response.headers.get('X-Checksum-Sha1')
+        if expected_sha1 and reader.sha1.hexdigest() != expected_sha1:
+            raise ArtifactDownloadException("Checksum mismatch for {url}.  Expected sha1 {expected} but downloaded "
+                                            "{actual}".format(url=artifact_url, expected=expected_sha1,
+                                                              actual=reader.sha1.hexdigest()))
+
+        commons.print_msg(Artifactory.clazz, method, 'Extracted {} to {}'.format(artifact_url, download_dir))
+
+    def _extract_tar_members(self, tar, download_dir):
+        method = '_extract_tar_members'
+
+        try:
+            _extract_tar(tar, download_dir)
+        except ArtifactException as e:
+            commons.print_msg(Artifactory.clazz, method, "Refusing to extract {}".format(e), 'ERROR')
+            raise
 
     def _check_artifact_permissions(self, remove_resp, method):
         if remove_resp.status_code == 403:
@@ -2,9 +2,9 @@ import os
 import subprocess
 from abc import ABCMeta, abstractmethod
 
-import requests
 
 from flow.utils import commons
+import flow.utils.httpclient as httpclient
 
 
 class Cloud(metaclass=ABCMeta):
@@ -26,11 +26,11 @@ class Cloud(metaclass=ABCMeta):
                 if os.getenv("GITHUB_TOKEN"):
                     headers = {'Authorization': ("Bearer " + os.getenv("GITHUB_TOKEN"))}
 
-                    resp = requests.get(custom_deploy_script, headers=headers, timeout=self.http_timeout)
+                    resp = httpclient.get(custom_deploy_script, headers=headers, timeout=self.http_timeout)
                 else:
                     commons.print_msg(Cloud.clazz, 'No GITHUB_TOKEN detected in environment. Attempting to access '
                                                   'deploy script anonymously.', 'WARN')
-                    resp = requests.get(custom_deploy_script, timeout=self.http_timeout)
+                    resp = httpclient.get(custom_deploy_script, timeout=self.http_timeout)
 
             except:
                 commons.print_msg(Cloud.clazz, method, "Failed retrieving custom deploy script from GitHub {}".format(
@@ -55,7 +55,7 @@ class Cloud(metaclass=ABCMeta):
             resp = None
 
             try:
-                resp = requests.get(custom_deploy_script, timeout=self.http_timeout)
+                resp = httpclient.get(custom_deploy_script, timeout=self.http_timeout)
             except:
                 commons.print_msg(Cloud.clazz, method, "Failed retrieving custom web deploy script from {script}. "
                                                        "\r\n Response: {response}".format(script=custom_deploy_script,
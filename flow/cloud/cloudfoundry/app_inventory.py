@@ -0,0 +1,57 @@
+#!/usr/bin/python
+# app_inventory.py
+
+from flow.utils.commons import Object
+
+
+class AppInventory:
+    """Every version of one project in a space, with its state and routes, fetched once and indexed.
+
+    Apps come from a single paginated, name filtered /v2 listing and routes from a single /v3 listing limited to
+    those apps, so the phases of a deploy look apps and routes up here instead of querying again.
+    """
+    clazz = 'AppInventory'
+
+    def __init__(self, api, space_guid, project_name):
+        self.api = api
+        self.space_guid = space_guid
+        self.name_prefix = "{}-".format(project_name)
+        self.apps = []
+        self.apps_by_name = {}
+        self.apps_by_guid = {}
+        self.routes = []
+
+    def load(self):
+        self.apps = []
+        for resource in self.api.get_space_apps(self.space_guid, self.name_prefix):
+            # the server side filter may be case sensitive, so the prefix is checked again
+            if not resource['entity']['name'].lower().startswith(self.name_prefix.lower()):
+                continue
+            app = Object()
+            app.name = resource['entity']['name']
+            app.guid = resource['metadata']['guid']
+            app.state = resource['entity']['state'].lower()
+            app.routes = []
+            self.apps.append(app)
+
+        self.apps_by_name = {app.name.lower(): app for app in self.apps}
+        self.apps_by_guid = {app.guid: app for app in self.apps}
+
+        self.routes = []
+        if self.apps:
+            self.routes = self.api.get_routes(self.space_guid, app_guids=list(self.apps_by_guid),
+                                              app_names={app.guid: app.name for app in self.apps})
+
+        for route in self.routes:
+            for destination in route.destinations:
+                app = self.apps_by_guid.get(destination['app']['guid'])
+                if app is not None and route not in app.routes:
+                    app.routes.append(route)
+
+        return self
+
+    def get_app(self, name):
+        return self.apps_by_name.get(name.lower())
+
+    def apps_in_state(self, state):
+        return [app for app in self.apps if app.state == state]
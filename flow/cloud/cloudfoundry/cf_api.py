@@ -0,0 +1,236 @@
+#!/usr/bin/python
+# cf_api.py
+
+import time
+
+import flow.utils.commons as commons
+import flow.utils.httpclient as httpclient
+
+
+class CloudFoundryApiException(Exception):
+    pass
+
+
+class CloudFoundryApi:
+    """Client for the Cloud Foundry v3 api covering the app state, scaling and route operations flow performs.
+
+    Uses the token from CloudFoundry.api_login, so none of these operations need the cf cli.
+    """
+    clazz = 'CloudFoundryApi'
+    page_size = 5000
+    v2_page_size = 100
+    job_poll_interval = 1
+    job_timeout = 120
+    staging_timeout = 900
+
+    def __init__(self, api_endpoint, token, http_timeout=30, verify_ssl=True):
+        self.base_url = "https://{}".format(api_endpoint)
+        self.headers = {'Authorization': "bearer {}".format(token), 'Content-type': commons.content_json,
+                        'Accept': commons.content_json}
+        self.http_timeout = http_timeout
+        self.verify_ssl = verify_ssl
+
+    def _request(self, method, path, params=None, body=None, missing_ok=False):
+        url = path if path.startswith('https://') else self.base_url + path
+
+        try:
+            resp = httpclient.request(method, url, params=params, json=body, headers=self.headers,
+                                      verify=self.verify_ssl, timeout=self.http_timeout)
+        except Exception as e:
+            raise CloudFoundryApiException("{} {} failed: {}".format(method, url, e))
+
+        if missing_ok and resp.status_code == 404:
+            return None
+
+        if resp.status_code >= 300:
+            raise CloudFoundryApiException("{} {} returned {}: {}".format(method, url, resp.status_code, resp.text))
+
+        return resp
+
+    def _get_all(self, path, params=None):
+        params = dict(params or {}, per_page=CloudFoundryApi.page_size)
+        resources = []
+
+        resp = self._request('GET', path, params)
+        while True:
+            json_data = resp.json()
+            resources.extend(json_data['resources'])
+            next_page = (json_data.get('pagination') or {}).get('next')
+            if not next_page:
+                return resources
+            resp = self._request('GET', next_page['href'])
+
+    def _wait_for_job(self, resp):
+        # asynchronous operations (e.g. deleting an app) answer 202 with the job to poll
+        job_url = resp.headers.get('Location')
+        if resp.status_code != 202 or not job_url:
+            return
+
+        deadline = time.time() + CloudFoundryApi.job_timeout
+        while time.time() < deadline:
+            job = self._request('GET', job_url).json()
+            if job['state'] == 'COMPLETE':
+                return
+            if job['state'] == 'FAILED':
+                raise CloudFoundryApiException("Job {} failed: {}".format(job_url, job.get('errors')))
+            time.sleep(CloudFoundryApi.job_poll_interval)
+
+        raise CloudFoundryApiException("Timed out waiting for job {}".format(job_url))
+
+    def get_space_apps(self, space_guid, name_prefix):
+        """
+        Apps in the space whose name starts with name_prefix, as /v2 resources with their state.
+        The prefix is turned into a name range so the controller does the filtering.
+        """
+        name_upper_bound = name_prefix[:-1] + chr(ord(name_prefix[-1]) + 1)
+        params = {'q': ["name>={}".format(name_prefix), "name<{}".format(name_upper_bound)],
+                  'results-per-page': CloudFoundryApi.v2_page_size}
+
+        resources = []
+        resp = self._request('GET', "/v2/spaces/{}/apps".format(space_guid), params)
+        while True:
+            json_data = resp.json()
+            resources.extend(json_data['resources'])
+            if not json_data.get('next_url'):
+                return resources
+            resp = self._request('GET', json_data['next_url'])
+
+    def get_apps(self, space_guid):
+        return self._get_all('/v3/apps', {'space_guids': space_guid})
+
+    def get_app_guid(self, space_guid, name):
+        apps = self._get_all('/v3/apps', {'space_guids': space_guid, 'names': name})
+        if not apps:
+            raise CloudFoundryApiException("App {} not found".format(name))
+        return apps[0]['guid']
+
+    def get_current_droplet_guid(self, app_guid):
+        # an app pushed with --no-start has not been staged yet and has no current droplet
+        resp = self._request('GET', "/v3/apps/{}/droplets/current".format(app_guid), missing_ok=True)
+        return resp.json()['guid'] if resp is not None else None
+
+    def stage_app(self, app_guid):
+        """Stages the latest package of the app and makes the resulting droplet current, like cf start does."""
+        packages = self._request('GET', '/v3/packages', {'app_guids': app_guid, 'states': 'READY',
+                                                         'order_by': '-created_at', 'per_page': 1}).json()
+        if not packages['resources']:
+            raise CloudFoundryApiException("No package to stage for app {}".format(app_guid))
+
+        build = self._request('POST', '/v3/builds',
+                              body={'package': {'guid': packages['resources'][0]['guid']}}).json()
+
+        deadline = time.time() + CloudFoundryApi.staging_timeout
+        while build['state'] == 'STAGING':
+            if time.time() >= deadline:
+                raise CloudFoundryApiException("Timed out staging app {}".format(app_guid))
+            time.sleep(CloudFoundryApi.job_poll_interval)
+            build = self._request('GET', "/v3/builds/{}".format(build['guid'])).json()
+
+        if build['state'] != 'STAGED':
+            raise CloudFoundryApiException("Staging app {} failed: {}".format(app_guid, build.get('error')))
+
+        self._request('PATCH', "/v3/apps/{}/relationships/current_droplet".format(app_guid),
+                      body={'data': {'guid': build['droplet']['guid']}})
+
+    def start_app(self, app_guid):
+        self._request('POST', "/v3/apps/{}/actions/start".format(app_guid))
+
+    def stop_app(self, app_guid):
+        self._request('POST', "/v3/apps/{}/actions/stop".format(app_guid))
+
+    def restart_app(self, app_guid):
+        self._request('POST', "/v3/apps/{}/actions/restart".format(app_guid))
+
+    def scale_app(self, app_guid, instances, process_type='web'):
+        self._request('POST', "/v3/apps/{}/processes/{}/actions/scale".format(app_guid, process_type),
+                      body={'instances': instances})
+
+    def delete_app(self, app_guid):
+        self._wait_for_job(self._request('DELETE', "/v3/apps/{}".format(app_guid)))
+
+    def get_domain_guid(self, name):
+        domains = self._get_all('/v3/domains', {'names': name})
+        if not domains:
+            raise CloudFoundryApiException("Domain {} not found".format(name))
+        return domains[0]['guid']
+
+    def get_routes(self, space_guid, app_guids=None, app_names=None):
+        """
+        Routes in the space as objects with host, domain, path, destinations and the names of the apps mapped to
+        it, limited to routes of app_guids when given.  host and path are None when empty, matching what the cf
+        cli reports.  Apps missing from app_names are listed by guid.
+        """
+        if app_names is None:
+            app_names = {app['guid']: app['name'] for app in self.get_apps(space_guid)}
+
+        params = {'space_guids': space_guid, 'include': 'domain', 'per_page': CloudFoundryApi.page_size}
+        if app_guids is not None:
+            params['app_guids'] = ','.join(app_guids)
+
+        resp = self._request('GET', '/v3/routes', params)
+        resources = []
+        domain_names = {}
+        while True:
+            json_data = resp.json()
+            resources.extend(json_data['resources'])
+            for domain in json_data.get('included', {}).get('domains', []):
+                domain_names[domain['guid']] = domain['name']
+            next_page = (json_data.get('pagination') or {}).get('next')
+            if not next_page:
+                break
+            resp = self._request('GET', next_page['href'])
+
+        routes = []
+        for resource in resources:
+            route = commons.Object()
+            route.guid = resource['guid']
+            route.host = resource['host'] or None
+            route.path = resource['path'] or None
+            route.domain = domain_names.get(resource['relationships']['domain']['data']['guid'])
+            route.destinations = resource['destinations']
+            route.apps = [app_names.get(destination['app']['guid'], destination['app']['guid'])
+                          for destination in resource['destinations']]
+            routes.append(route)
+
+        return routes
+
+    def get_app_route_guids(self, app_guid):
+        return [route['guid'] for route in self._get_all("/v3/apps/{}/routes".format(app_guid))]
+
+    def _find_route(self, space_guid, domain_guid, host, path):
+        for route in self._get_all('/v3/routes', {'space_guids': space_guid, 'domain_guids': domain_guid}):
+            if (route['host'] or None) == (host or None) and (route['path'] or None) == (path or None):
+                return route
+        return None
+
+    def map_route(self, space_guid, app_guid, domain, host=None, path=None):
+        # like cf map-route, the route is created when it does not exist yet
+        domain_guid = self.get_domain_guid(domain)
+        route = self._find_route(space_guid, domain_guid, host, path)
+
+        if route is None:
+            body = {'relationships': {'space': {'data': {'guid': space_guid}},
+                                      'domain': {'data': {'guid': domain_guid}}}}
+            if host:
+                body['host'] = host
+            if path:
+                body['path'] = path
+            route = self._request('POST', '/v3/routes', body=body).json()
+
+        self._request('POST', "/v3/routes/{}/destinations".format(route['guid']),
+                      body={'destinations': [{'app': {'guid': app_guid}}]})
+
+    def unmap_route(self, space_guid, app_guid, domain, host=None, path=None):
+        route = self._find_route(space_guid, self.get_domain_guid(domain), host, path)
+        if route is None:
+            return
+
+        self.unmap_route_guid(route['guid'], app_guid, route['destinations'])
+
+    def unmap_route_guid(self, route_guid, app_guid, destinations=None):
+        if destinations is None:
+            destinations = self._request('GET', "/v3/routes/{}/destinations".format(route_guid)).json()['destinations']
+
+        for destination in destinations:
+            if destination['app']['guid'] == app_guid:
+                self._request('DELETE', "/v3/routes/{}/destinations/{}".format(route_guid, destination['guid']))
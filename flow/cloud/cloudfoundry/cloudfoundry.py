@@ -1,7 +1,5 @@
 import os
 import subprocess
-import tarfile
-import urllib.request
 import requests
 import json
 
@@ -12,9 +10,12 @@ import platform
 
 from flow.buildconfig import BuildConfig
 from flow.cloud.cloud_abc import Cloud
+from flow.cloud.cloudfoundry.app_inventory import AppInventory
+from flow.cloud.cloudfoundry.cf_api import CloudFoundryApi, CloudFoundryApiException
+from flow.cloud.toolchain_cache import ToolchainCache, ToolchainException
 from requests.auth import HTTPBasicAuth
 import flow.utils.commons as commons
-from flow.utils.commons import Object
+import flow.utils.httpclient as httpclient
 
 
 class CloudFoundry(Cloud):
@@ -34,6 +35,9 @@ class CloudFoundry(Cloud):
     api_token = None
     space_guid = None
     cf_api_login_endpoint = None
+    cli_logged_in = False
+    # apps and routes of the project, loaded once and shared by every phase of deploy, cutover and promote
+    app_inventory = None
 
 
     def __init__(self, config_override=None):
@@ -64,8 +68,8 @@ class CloudFoundry(Cloud):
         login_url = "https://{}/oauth/token".format(CloudFoundry.cf_api_login_endpoint)
 
         try:
-            resp = requests.post(login_url, auth=HTTPBasicAuth('cf', ''), params=payload,
-                                 headers=pcf_login_headers, verify=False)
+            resp = httpclient.post(login_url, auth=HTTPBasicAuth('cf', ''), params=payload,
+                                   headers=pcf_login_headers, verify=self._verify_ssl())
             json_data = json.loads(resp.text)
 
             CloudFoundry.api_token = json_data['access_token']
@@ -94,15 +98,24 @@ class CloudFoundry(Cloud):
             commons.print_msg(CloudFoundry.clazz, method, 'cf cli already installed')
         else:
             commons.print_msg(CloudFoundry.clazz, method, "cf CLI was not installed on this image. "
-                                                        "Downloading CF CLI from {}".format(
+                                                        "Installing CF CLI from {}".format(
                 self.config.settings.get('cloudfoundry', 'cli_download_path')))
 
-            urllib.request.urlretrieve(self.config.settings.get('cloudfoundry', 'cli_download_path'), # nosec
-                                           './cf-linux-amd64.tgz')
-            tar = tarfile.open('./cf-linux-amd64.tgz')
-            CloudFoundry.path_to_cf = "./"
-            tar.extractall()
-            tar.close()
+            toolchain_cache = ToolchainCache(commons.get_setting(self.config.settings, 'toolchains',
+                                                                 'cache_directory') or '.',
+                                             commons.get_int_setting(self.config.settings, 'toolchains',
+                                                                     'max_age_hours', 24))
+            try:
+                install_directory = toolchain_cache.install('cf', self.config.settings.get('cloudfoundry',
+                                                                                            'cli_download_path'),
+                                                            commons.get_setting(self.config.settings, 'cloudfoundry',
+                                                                                'cli_sha256'))
+            except ToolchainException as e:
+                commons.print_msg(CloudFoundry.clazz, method, str(e), 'ERROR')
+                exit(1)
+
+            # noinspection PyUnboundLocalVariable
+            CloudFoundry.path_to_cf = install_directory + '/'
 
         commons.print_msg(CloudFoundry.clazz, method, 'end')
 
@@ -117,7 +130,7 @@ class CloudFoundry(Cloud):
         spaces_url = "https://{api}/v2/spaces".format(api=CloudFoundry.cf_api_endpoint)
 
         try:
-            resp = requests.get(spaces_url, headers=pcf_spaces_headers, verify=False)
+            resp = httpclient.get(spaces_url, headers=pcf_spaces_headers, verify=self._verify_ssl())
         except requests.ConnectionError:
             commons.print_msg(CloudFoundry.clazz, method, 'Request to Cloud Foundry timed out.', 'ERROR')
             exit(1)
@@ -212,39 +225,33 @@ class CloudFoundry(Cloud):
 
         commons.print_msg(CloudFoundry.clazz, method, 'end')
 
-    def _get_stopped_apps(self):
-        method = '_get_stopped_apps'
-        commons.print_msg(CloudFoundry.clazz, method, 'begin')
-
-        bearer_token = "bearer {access_token}".format(access_token=self.api_token)
+    def _get_app_inventory(self, refresh=False):
+        method = '_get_app_inventory'
+
+        if CloudFoundry.app_inventory is None or refresh:
+            commons.print_msg(CloudFoundry.clazz, method, "Loading {} apps in space {}".format(
+                self.config.project_name, CloudFoundry.space_guid))
+            try:
+                CloudFoundry.app_inventory = AppInventory(self._get_api(), CloudFoundry.space_guid,
+                                                          self.config.project_name).load()
+            except CloudFoundryApiException as e:
+                commons.print_msg(CloudFoundry.clazz, method, "Failed loading apps: {}".format(e), 'ERROR')
+                self._cf_logout()
+                exit(1)
 
-        pcf_apps_headers = {'Authorization': bearer_token}
+        return CloudFoundry.app_inventory
 
-        apps_url = "https://{api}/v2/spaces/{space_guid}/apps".format(api=CloudFoundry.cf_api_endpoint,
-                                                                      space_guid=CloudFoundry.space_guid)
+    def _get_app_guid(self, api, app):
+        inventory_app = CloudFoundry.app_inventory.get_app(app) if CloudFoundry.app_inventory else None
+        if inventory_app is not None:
+            return inventory_app.guid
+        return api.get_app_guid(CloudFoundry.space_guid, app)
 
-        commons.print_msg(CloudFoundry.clazz, method, apps_url)
-        stopped_apps = []
+    def _get_stopped_apps(self):
+        method = '_get_stopped_apps'
+        commons.print_msg(CloudFoundry.clazz, method, 'begin')
 
-        try:
-            resp = requests.get(apps_url, headers=pcf_apps_headers, verify=False)
-        except requests.ConnectionError:
-            commons.print_msg(CloudFoundry.clazz, method, 'Request to Cloud Foundry timed out.', 'ERROR')
-            exit(1)
-        except:
-            commons.print_msg(CloudFoundry.clazz, method, "The cloud foundry get stopped apps has failed {}".
-                              format(apps_url), 'ERROR')
-            exit(1)
-
-        json_data = json.loads(resp.text)
-        
-        for i, app in enumerate(json_data['resources']):
-            if app['entity']['name'].lower().startswith("{}-".format(self.config.project_name.lower())) \
-                    and app['entity']['state'].lower() == 'stopped':
-                app_obj = Object()
-                app_obj.name = app['entity']['name']
-                app_obj.guid = app['metadata']['guid']
-                stopped_apps.append(app_obj)
+        stopped_apps = self._get_app_inventory().apps_in_state('stopped')
 
         commons.print_msg(CloudFoundry.clazz, method, "found {} stopped apps".format(len(stopped_apps)))
 
@@ -260,37 +267,9 @@ class CloudFoundry(Cloud):
         method = '_get_started_apps'
         commons.print_msg(CloudFoundry.clazz, method, 'begin')
 
-        bearer_token = "bearer {access_token}".format(access_token=self.api_token)
-
-        pcf_apps_headers = {'Authorization': bearer_token}
-
-        apps_url = "https://{api}/v2/spaces/{space_guid}/apps".format(api=CloudFoundry.cf_api_endpoint,
-                                                                      space_guid=CloudFoundry.space_guid)
-        started_apps = []
-
         version_to_look_for = "{proj}-{ver}".format(proj=self.config.project_name.lower(), ver=self.config.version_number)
 
-        try:
-            resp = requests.get(apps_url, headers=pcf_apps_headers, verify=False)
-        except requests.ConnectionError:
-            commons.print_msg(CloudFoundry.clazz, method, 'Request to Cloud Foundry timed out.', 'ERROR')
-            self._cf_logout()
-            exit(1)
-        except:
-            commons.print_msg(CloudFoundry.clazz, method, "The cloud foundry api login call failed to {} has failed".
-                              format(apps_url), 'ERROR')
-            self._cf_logout()
-            exit(1)
-
-        json_data = json.loads(resp.text)
-
-        for i, app in enumerate(json_data['resources']):
-            if app['entity']['name'].lower().startswith("{}-".format(self.config.project_name.lower())) \
-                    and app['entity']['state'].lower() == 'started':
-                app_obj = Object()
-                app_obj.name = app['entity']['name']
-                app_obj.guid = app['metadata']['guid']
-                started_apps.append(app_obj)
+        started_apps = self._get_app_inventory().apps_in_state('started')
 
         for i, started_app in enumerate(started_apps):
             if started_app.name.lower() == version_to_look_for and not force_deploy:
@@ -387,73 +366,60 @@ class CloudFoundry(Cloud):
             self._cf_logout()
             exit(1)
 
+        # the pushed version is a new app, load the inventory again the next time it is needed
+        CloudFoundry.app_inventory = None
+
         commons.print_msg(CloudFoundry.clazz, method, 'end')
 
+    def _verify_ssl(self):
+        return commons.get_bool_setting(self.config.settings, 'cloudfoundry', 'verify_ssl', True)
+
     # noinspection PyUnboundLocalVariable
+    def _get_api(self):
+        return CloudFoundryApi(CloudFoundry.cf_api_endpoint, CloudFoundry.api_token, self.http_timeout,
+                               self._verify_ssl())
+
+    def _for_each_app(self, func, apps):
+        # independent per-app cleanup runs on a bounded pool.  each func keeps its own commands in order.
+        max_workers = commons.get_int_setting(self.config.settings, 'cloudfoundry', 'max_concurrent_commands', 4)
+        return commons.map_concurrently(func, apps, max_workers)
+
     def _stop_old_app_servers(self):
         method = '_stop_old_app_servers'
         commons.print_msg(CloudFoundry.clazz, method, 'begin')
 
-        stop_old_apps_failed = False
-
         version_to_look_for = "{name}-{version}".format(name=self.config.project_name.lower(),
                                                         version=self.config.version_number)
 
-        for line in CloudFoundry.started_apps:
-            if line.name.lower() != version_to_look_for:
-                commons.print_msg(CloudFoundry.clazz, method, "Scaling down {}".format(line.name))
-
-                cmd = "{path}cf scale {app} -i 1".format(path=CloudFoundry.path_to_cf,
-                                                         app=line.name)
-
-                commons.print_msg(CloudFoundry.clazz, method, cmd)
-                cf_scale = subprocess.Popen(cmd.split(), shell=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-
-                try:
-                    cf_scale_output, errs = cf_scale.communicate(timeout=120)
+        api = self._get_api()
 
-                    for scale_line in cf_scale_output.splitlines():
-                        commons.print_msg(CloudFoundry.clazz, method, scale_line.decode('utf-8'))
+        def _stop_old_app_server(line):
+            if line.name.lower() == version_to_look_for:
+                commons.print_msg(CloudFoundry.clazz, method, "Skipping scale down for {}".format(line.name))
+                return []
 
-                    if cf_scale.returncode != 0:
-                        commons.print_msg(CloudFoundry.clazz, method, "Failed calling {command}. Return code of {rtn}"
-                                                                     "".format(command=cmd, rtn=cf_scale.returncode),
-                                         'WARN')
-                        stop_old_apps_failed = True
+            commons.print_msg(CloudFoundry.clazz, method, "Scaling down {}".format(line.name))
 
-                except TimeoutExpired:
-                    commons.print_msg(CloudFoundry.clazz, method, "Timed out calling {}".format(cmd), 'WARN')
-                    stop_old_apps_failed = True
+            errors = []
+            try:
+                api.scale_app(line.guid, 1)
+            except CloudFoundryApiException as e:
+                errors.append("Failed scaling down {}: {}".format(line.name, e))
 
-                stop_cmd = "{path}cf stop {project}".format(path=CloudFoundry.path_to_cf,
-                                                            project=line.name)
+            commons.print_msg(CloudFoundry.clazz, method, "Stopping {}".format(line.name))
+            try:
+                api.stop_app(line.guid)
+            except CloudFoundryApiException as e:
+                errors.append("Failed stopping {}: {}".format(line.name, e))
 
-                commons.print_msg(CloudFoundry.clazz, method, stop_cmd)
-                cf_stop = subprocess.Popen(stop_cmd.split(), shell=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            return errors
 
-                try:
-                    cf_stop_output, errs = cf_stop.communicate(timeout=120)
+        stop_old_apps_errors = [error for errors in self._for_each_app(_stop_old_app_server,
+                                                                       CloudFoundry.started_apps)
+                                for error in errors]
 
-                    for stop_line in cf_stop_output.splitlines():
-                        commons.print_msg(CloudFoundry.clazz, method, stop_line.decode("utf-8"))
-
-                    if cf_scale.returncode != 0:
-                        commons.print_msg(CloudFoundry.clazz, method, "Failed calling {command}. Return code of {rtn}"
-                                                                     "".format(command=cmd, rtn=cf_stop.returncode),
-                                         'WARN')
-                        stop_old_apps_failed = True
-
-                except TimeoutExpired:
-                    commons.print_msg(CloudFoundry.clazz, method, "Timed out calling".format(cmd), 'WARN')
-                    stop_old_apps_failed = True
-            else:
-                commons.print_msg(CloudFoundry.clazz, method, "Skipping scale down for {}".format(line.name))
-
-        # if stop_old_apps_failed:
-        #     cf_stop.kill()
-        #     # cf_stop.communicate()
-        #     os.system('stty sane')
-        #     self._cf_logout()
+        for error in stop_old_apps_errors:
+            commons.print_msg(CloudFoundry.clazz, method, error, 'WARN')
 
         commons.print_msg(CloudFoundry.clazz, method, 'end')
 
@@ -461,102 +427,48 @@ class CloudFoundry(Cloud):
         method = '_unmap_delete_previous_versions'
         commons.print_msg(CloudFoundry.clazz, method, 'begin')
 
-        unmap_delete_previous_versions_failed = False
+        api = self._get_api()
 
-        for line in CloudFoundry.stopped_apps:
+        def _unmap_delete_previous_version(line):
             if "{proj}-{ver}".format(proj=self.config.project_name,
                                      ver=self.config.version_number).lower() == line.name.lower():
                 commons.print_msg(CloudFoundry.clazz, method, "{} exists. Not removing routes for it.".format(
                     line.name.lower()))
-            else:
-                bearer_token = "bearer {access_token}".format(access_token=self.api_token)
+                return [], []
 
-                pcf_route_headers = {'Authorization': bearer_token}
-
-                apps_url = "https://{api}/v2/apps/{guid}/routes".format(api=CloudFoundry.cf_api_endpoint, guid=line.guid)
+            unmap_errors = []
+            # routes are only removed when the environment names a cf domain
+            for route in line.routes if CloudFoundry.cf_domain is not None else []:
+                commons.print_msg(CloudFoundry.clazz, method, "Removing route {route} from {line}".format(
+                    route=route.guid, line=line.name))
                 try:
-                    resp = requests.get(apps_url, headers=pcf_route_headers, verify=False)
-                except requests.ConnectionError:
-                    commons.print_msg(CloudFoundry.clazz, method, 'Request to Cloud Foundry timed out.', 'ERROR')
-                    exit(1)
-                except:
-                    commons.print_msg(CloudFoundry.clazz, method,
-                                      "The cloud foundry api routes call failed to {} has failed".
-                                      format(apps_url), 'ERROR')
-                    exit(1)
-
-                json_data = json.loads(resp.text)
-
-                if CloudFoundry.cf_domain is not None:
-                    try:
-                        for i, route in enumerate(json_data['resources']):
-                            commons.print_msg(CloudFoundry.clazz, method, "Removing route {route} from {line}".format(
-                                route=route['entity']['host'], line=line.name))
-
-                            cmd = "{path}cf unmap-route {old_app} {cf_domain} -n {route_line}".format(
-                                path=CloudFoundry.path_to_cf,
-                                old_app=line.name,
-                                cf_domain=CloudFoundry.cf_domain,
-                                route_line=route['entity']['host'])
-
-                            commons.print_msg(CloudFoundry.clazz, method, cmd)
-
-                            unmap_route = subprocess.Popen(cmd.split(), shell=False, stdout=subprocess.PIPE,
-                                                           stderr=subprocess.STDOUT)
-
-                            try:
-                                unmap_route_output, errs = unmap_route.communicate(timeout=120)
-
-                                for unmapped_route in unmap_route_output.splitlines():
-                                    commons.print_msg(CloudFoundry.clazz, method, unmapped_route.decode("utf-8"))
-
-                                if unmap_route.returncode != 0:
-                                    unmap_delete_previous_versions_failed = True
-                                    commons.print_msg(CloudFoundry.clazz, method, "Failed calling {command}. Return "
-                                                                                  "code of {rtn}".format(
-                                        command=cmd,
-                                        rtn=unmap_route.returncode),
-                                                      'ERROR')
-
-                            except TimeoutExpired:
-                                unmap_delete_previous_versions_failed = True
-                                commons.print_msg(CloudFoundry.clazz, method, "Timed out calling {}".format(cmd),
-                                                  'ERROR')
-
-                    except TimeoutExpired:
-                        commons.print_msg(CloudFoundry.clazz, method, "Timed out calling {}".format(cmd), 'ERROR')
-                        unmap_delete_previous_versions_failed = True
-
-                if unmap_delete_previous_versions_failed is False:
-                    delete_cmd = "{path}cf delete {project} -f".format(project=line.name,
-                                                                       path=CloudFoundry.path_to_cf)
-
-                    commons.print_msg(CloudFoundry.clazz, method, delete_cmd)
-
-                    delete_app = subprocess.Popen(delete_cmd.split(), shell=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-
-                    try:
-                        delete_app_output, errs = delete_app.communicate(timeout=120)
-
-                        for deleted_app in delete_app_output.splitlines():
-                            commons.print_msg(CloudFoundry.clazz, method, deleted_app.decode("utf-8"))
-
-                        if delete_app.returncode != 0:
-                            commons.print_msg(CloudFoundry.clazz, method, "Failed calling {command}. Return code of {rtn}"
-                                              .format(command=cmd,
-                                                     rtn=delete_app.returncode),
-                                             'ERROR')
-
-                    except TimeoutExpired:
-                        commons.print_msg(CloudFoundry.clazz, method, "Timed out calling".format(delete_cmd), 'ERROR')
-                        delete_app.kill()
-                        delete_app.communicate()
-                        os.system('stty sane')
-
-                if unmap_delete_previous_versions_failed:
-                    os.system('stty sane')
-                    self._cf_logout()
-                    exit(1)
+                    api.unmap_route_guid(route.guid, line.guid, route.destinations)
+                except CloudFoundryApiException as e:
+                    unmap_errors.append("Failed removing route {} from {}: {}".format(route.guid, line.name, e))
+
+            # an app is only deleted once every one of its routes is unmapped
+            if unmap_errors:
+                return unmap_errors, []
+
+            commons.print_msg(CloudFoundry.clazz, method, "Deleting {}".format(line.name))
+            try:
+                api.delete_app(line.guid)
+            except CloudFoundryApiException as e:
+                return [], ["Failed deleting {}: {}".format(line.name, e)]
+
+            return [], []
+
+        results = self._for_each_app(_unmap_delete_previous_version, CloudFoundry.stopped_apps)
+
+        unmap_errors = [error for errors, _ in results for error in errors]
+        delete_errors = [error for _, errors in results for error in errors]
+
+        for error in unmap_errors + delete_errors:
+            commons.print_msg(CloudFoundry.clazz, method, error, 'ERROR')
+
+        if unmap_errors:
+            self._cf_logout()
+            exit(1)
 
         commons.print_msg(CloudFoundry.clazz, method, 'end')
 
@@ -564,6 +476,11 @@ class CloudFoundry(Cloud):
         method = '_cf_logout'
         commons.print_msg(CloudFoundry.clazz, method, 'begin')
 
+        # api operations hold no cli session, only a cf login needs a logout
+        if not CloudFoundry.cli_logged_in:
+            commons.print_msg(CloudFoundry.clazz, method, 'end')
+            return
+
         cmd = "{}cf logout".format(CloudFoundry.path_to_cf)
 
         cf_logout = subprocess.Popen(cmd.split(), shell=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
@@ -592,6 +509,8 @@ class CloudFoundry(Cloud):
             os.system('stty sane')
             exit(1)
 
+        CloudFoundry.cli_logged_in = False
+
         commons.print_msg(CloudFoundry.clazz, method, 'end')
 
     def _cf_login(self):
@@ -655,6 +574,8 @@ class CloudFoundry(Cloud):
             os.system('stty sane')
             exit(1)
 
+        CloudFoundry.cli_logged_in = True
+
         commons.print_msg(CloudFoundry.clazz, method, 'end')
 
     def _cf_login_check(self):
@@ -786,132 +707,52 @@ class CloudFoundry(Cloud):
         method = '_map_route'
         commons.print_msg(CloudFoundry.clazz, method, 'begin')
 
-        cmd = "{path}cf map-route {app} {cf_domain} {host} {route_path}".format(
-            path=CloudFoundry.path_to_cf,
-            app=app,
-            cf_domain=domain,
-            host="--hostname {}".format(host) if host is not None else "",
-            route_path="--path {}".format(route_path) if route_path is not None else "")
-
-        commons.print_msg(CloudFoundry.clazz, method, cmd)
-
-        map_route = subprocess.Popen(cmd.split(), shell=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-
-        map_route_failed = False
+        commons.print_msg(CloudFoundry.clazz, method, "Mapping {host}{domain}{path} to {app}".format(
+            host="{}.".format(host) if host is not None else "", domain=domain, path=route_path or "", app=app))
 
         try:
-            map_route_output, errs = map_route.communicate(timeout=120)
-
-            for mapped_route in map_route_output.splitlines():
-                commons.print_msg(CloudFoundry.clazz, method, mapped_route.decode("utf-8"))
-
-            if map_route.returncode != 0:
-                map_route_failed = True
-                commons.print_msg(CloudFoundry.clazz, method, "Failed calling {command}. Return "
-                                                              "code of {rtn}".format(command=cmd,
-                                                                                     rtn=map_route.returncode),
-                                  'ERROR')
-
-        except TimeoutExpired:
-            map_route_failed = True
-            commons.print_msg(CloudFoundry.clazz, method, "Timed out calling {}".format(cmd), 'ERROR')
-
-        if map_route_failed:
-            os.system('stty sane')
+            api = self._get_api()
+            api.map_route(CloudFoundry.space_guid, self._get_app_guid(api, app), domain, host,
+                          route_path)
+        except CloudFoundryApiException as e:
+            commons.print_msg(CloudFoundry.clazz, method, "Failed mapping route to {}: {}".format(app, e), 'ERROR')
             self._cf_logout()
             exit(1)
 
+        commons.print_msg(CloudFoundry.clazz, method, 'end')
+
     def _unmap_route(self, app, domain, host=None, route_path=None):
         method = '_unmap_route'
         commons.print_msg(CloudFoundry.clazz, method, 'begin')
 
-        cmd = "{path}cf unmap-route {app} {cf_domain} {host} {route_path}".format(
-            path=CloudFoundry.path_to_cf,
-            app=app,
-            cf_domain=domain,
-            host="--hostname {}".format(host) if host is not None else "",
-            route_path = "--path {}".format(route_path) if route_path is not None else "")
-
-        commons.print_msg(CloudFoundry.clazz, method, cmd)
-
-        unmap_route = subprocess.Popen(cmd.split(), shell=False, stdout=subprocess.PIPE,
-                                       stderr=subprocess.STDOUT)
-
-        unmap_delete_previous_versions_failed = False
+        commons.print_msg(CloudFoundry.clazz, method, "Unmapping {host}{domain}{path} from {app}".format(
+            host="{}.".format(host) if host is not None else "", domain=domain, path=route_path or "", app=app))
 
         try:
-            unmap_route_output, errs = unmap_route.communicate(timeout=120)
-
-            for unmapped_route in unmap_route_output.splitlines():
-                commons.print_msg(CloudFoundry.clazz, method, unmapped_route.decode("utf-8"))
-
-            if unmap_route.returncode != 0:
-                unmap_delete_previous_versions_failed = True
-                commons.print_msg(CloudFoundry.clazz, method, "Failed calling {command}. Return "
-                                                              "code of {rtn}".format( command=cmd,
-                                                                                      rtn=unmap_route.returncode),
-                                  'ERROR')
-
-        except TimeoutExpired:
-            unmap_delete_previous_versions_failed = True
-            commons.print_msg(CloudFoundry.clazz, method, "Timed out calling {}".format(cmd), 'ERROR')
-
-        if unmap_delete_previous_versions_failed:
-            os.system('stty sane')
+            api = self._get_api()
+            api.unmap_route(CloudFoundry.space_guid, self._get_app_guid(api, app), domain, host,
+                            route_path)
+        except CloudFoundryApiException as e:
+            commons.print_msg(CloudFoundry.clazz, method, "Failed unmapping route from {}: {}".format(app, e),
+                              'ERROR')
             self._cf_logout()
             exit(1)
 
+        commons.print_msg(CloudFoundry.clazz, method, 'end')
+
     def _get_routes(self, app_name=None, app_version=None, cold_routes=False):
         method = '_get_routes'
         commons.print_msg(CloudFoundry.clazz, method, 'begin')
 
-        all_routes_cmd = "{path}cf routes".format(path=CloudFoundry.path_to_cf)
-        all_routes = subprocess.Popen(all_routes_cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        existing_routes_output, err = all_routes.communicate(timeout=120)
-        route_header = existing_routes_output.splitlines()[2].decode("utf-8")
-
-        space_pos = route_header.index('space')
-        host_pos = route_header.index('host')
-        domain_pos = route_header.index('domain')
-        port_pos = route_header.index('port')
-        path_pos = route_header.index('path')
-        type_pos = route_header.index('type')
-        apps_pos = route_header.index('apps')
-        service_pos = route_header.index('service')
-
-        all_routes_cmd = "{path}cf routes".format(path=CloudFoundry.path_to_cf)
+        all_routes = self._get_app_inventory().routes
 
         app_search_string = "{app}{version}".format(app="{}-".format(app_name) if app_name is not None else "",
                                                     version=app_version if app_version is not None else "")
-        filtered_application_cmd = "grep {}".format(app_search_string)
-        all_routes = subprocess.Popen(all_routes_cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        filtered_applications = subprocess.Popen(filtered_application_cmd.split(), stdin=all_routes.stdout,
-                                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        if cold_routes:
-            filter_cold_routes_cmd = "grep \\cold"
-            filtered_applications_cold = subprocess.Popen(filter_cold_routes_cmd.split(), stdin=filtered_applications.stdout, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
 
-            existing_routes_output, err = filtered_applications_cold.communicate(timeout=120)
-        else:
-            existing_routes_output, err = filtered_applications.communicate(timeout=120)
-        
-        routes = []
-
-        for route_line in existing_routes_output.splitlines():
-            route = commons.Object()
-            route.apps = route_line.decode("utf-8")[apps_pos:(service_pos - 1)].rstrip().split(',')
-            host = route_line.decode("utf-8")[host_pos:(domain_pos - 1)].rstrip()
-            route.domain = route_line.decode("utf-8")[domain_pos:(port_pos - 1)].rstrip()
-            path = route_line.decode("utf-8")[path_pos:(type_pos - 1)].rstrip()
-            if not path:
-                route.path = None
-            else: 
-                route.path = path
-            if not host:
-                route.host = None
-            else:
-                route.host = host
-            routes.append(route)
+        routes = [route for route in all_routes if any(app_search_string in app for app in route.apps)]
+
+        if cold_routes:
+            routes = [route for route in routes if route.path is not None and 'cold' in route.path]
 
         for route in routes:
             commons.print_msg(CloudFoundry.clazz, method, "{host}.{domain}/{path}".format(host=route.host,
@@ -924,15 +765,9 @@ class CloudFoundry(Cloud):
         method = 'cutover'
         commons.print_msg(CloudFoundry.clazz, method, 'begin')
 
-        self._verify_required_attributes()
-
-        self.download_cf_cli()
-
-        self._cf_login_check()
-
-        self._cf_login()
+        self.api_login()
 
-        self._check_cf_version()
+        self._get_space_guid()
 
         self._get_stopped_apps()
 
@@ -946,16 +781,10 @@ class CloudFoundry(Cloud):
         method = 'promote'
         commons.print_msg(CloudFoundry.clazz, method, 'begin')
 
-        self._verify_required_attributes()
-
-        self.download_cf_cli()
-
-        self._cf_login_check()
+        self.api_login()
 
-        self._cf_login()
+        self._get_space_guid()
 
-        self._check_cf_version()
-        
         cold_routes=self._get_routes(app_name=self.config.project_name, cold_routes=True)
 
         for route in cold_routes:
@@ -1029,24 +858,17 @@ class CloudFoundry(Cloud):
         method = '_start_app'
         commons.print_msg(CloudFoundry.clazz, method, 'begin')
 
-        cmd = "{path}cf start {app_name}".format(path=CloudFoundry.path_to_cf, app_name=app)
-        cf_start = subprocess.Popen(cmd.split(), shell=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        commons.print_msg(CloudFoundry.clazz, method, "Starting {}".format(app))
 
         try:
-            cf_start_output, errs = cf_start.communicate(timeout=120)
-
-            if cf_start.returncode != 0:
-                commons.print_msg(CloudFoundry.clazz, method, "Failed calling {command}. Return code of {rtn}".format(
-                    command=cmd, rtn=cf_start.returncode), 'ERROR')
-
-                os.system('stty sane')
-                self._cf_logout()
-                exit(1)
-
-        except TimeoutExpired:
-            commons.print_msg(CloudFoundry.clazz, method, "Timed out calling {}".format(cmd), 'ERROR')
-            cf_start.kill()
-            os.system('stty sane')
+            api = self._get_api()
+            app_guid = self._get_app_guid(api, app)
+            if api.get_current_droplet_guid(app_guid) is None:
+                commons.print_msg(CloudFoundry.clazz, method, "Staging {}".format(app))
+                api.stage_app(app_guid)
+            api.start_app(app_guid)
+        except CloudFoundryApiException as e:
+            commons.print_msg(CloudFoundry.clazz, method, "Failed starting {}: {}".format(app, e), 'ERROR')
             self._cf_logout()
             exit(1)
 
@@ -1056,24 +878,13 @@ class CloudFoundry(Cloud):
         method = '_restart_app'
         commons.print_msg(CloudFoundry.clazz, method, 'begin')
 
-        cmd = "{path}cf restart {app_name}".format(path=CloudFoundry.path_to_cf, app_name=app)
-        cf_start = subprocess.Popen(cmd.split(), shell=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        commons.print_msg(CloudFoundry.clazz, method, "Restarting {}".format(app))
 
         try:
-            cf_start_output, errs = cf_start.communicate(timeout=120)
-
-            if cf_start.returncode != 0:
-                commons.print_msg(CloudFoundry.clazz, method, "Failed calling {command}. Return code of {rtn}".format(
-                    command=cmd, rtn=cf_start.returncode), 'ERROR')
-
-                os.system('stty sane')
-                self._cf_logout()
-                exit(1)
-
-        except TimeoutExpired:
-            commons.print_msg(CloudFoundry.clazz, method, "Timed out calling {}".format(cmd), 'ERROR')
-            cf_start.kill()
-            os.system('stty sane')
+            api = self._get_api()
+            api.restart_app(self._get_app_guid(api, app))
+        except CloudFoundryApiException as e:
+            commons.print_msg(CloudFoundry.clazz, method, "Failed restarting {}: {}".format(app, e), 'ERROR')
             self._cf_logout()
             exit(1)
 
@@ -1,14 +1,12 @@
 import os
 import platform
 import subprocess
-import tarfile
-import urllib.request
-import ssl
 
 from subprocess import TimeoutExpired
 
 from flow.buildconfig import BuildConfig
 from flow.cloud.cloud_abc import Cloud
+from flow.cloud.toolchain_cache import ToolchainCache, ToolchainException
 
 import flow.utils.commons as commons
 
@@ -37,11 +35,6 @@ class GCAppEngine(Cloud):
         method = '_download_google_sdk'
         commons.print_msg(GCAppEngine.clazz, method, 'begin')
 
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        # noinspection PyUnresolvedReferences
-        ctx.verify_mode = ssl.CERT_NONE
-
         cmd = "where" if platform.system() == "Windows" else "which"
         rtn = subprocess.call([cmd, 'gcloud'])
 
@@ -51,16 +44,23 @@ class GCAppEngine(Cloud):
             commons.print_msg(GCAppEngine.clazz, method, 'gcloud already installed')
         else:
             commons.print_msg(GCAppEngine.clazz, method, "gcloud CLI was not installed on this image. "
-                                                        "Downloading Google Cloud SDK from {}".format(
+                                                        "Installing Google Cloud SDK from {}".format(
                 gcloud_location))
 
-            with urllib.request.urlopen(gcloud_location, context=ctx) as u, open(self.config.settings.get('googlecloud', 'gcloud_version'), 'wb') as f: # nosec
-                f.write(u.read())
-
-            tar = tarfile.open('./' + self.config.settings.get('googlecloud', 'gcloud_version'))
-            GCAppEngine.path_to_google_sdk = 'google-cloud-sdk/bin/'
-            tar.extractall()
-            tar.close()
+            toolchain_cache = ToolchainCache(commons.get_setting(self.config.settings, 'toolchains',
+                                                                 'cache_directory') or '.',
+                                             commons.get_int_setting(self.config.settings, 'toolchains',
+                                                                     'max_age_hours', 24))
+            try:
+                install_directory = toolchain_cache.install('google-cloud-sdk', gcloud_location,
+                                                            commons.get_setting(self.config.settings, 'googlecloud',
+                                                                                'gcloud_sha256'), verify=False)
+            except ToolchainException as e:
+                commons.print_msg(GCAppEngine.clazz, method, str(e), 'ERROR')
+                exit(1)
+
+            # noinspection PyUnboundLocalVariable
+            GCAppEngine.path_to_google_sdk = install_directory + '/google-cloud-sdk/bin/'
 
         commons.print_msg(GCAppEngine.clazz, method, 'end')
 
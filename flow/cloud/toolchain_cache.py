@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# toolchain_cache.py
+
+import hashlib
+import json
+import os
+import glob
+import shutil
+import tarfile
+import tempfile
+import time
+
+import flow.utils.commons as commons
+import flow.utils.httpclient as httpclient
+
+
+class ToolchainException(Exception):
+    pass
+
+
+class ToolchainCache:
+    """Versioned install directory for downloaded command line tools such as the cf cli and the Google Cloud SDK.
+
+    Each tool is installed under <cache_directory>/toolchains/<name>/<url key>-<sha256 key>, so a new download url
+    or new archive content installs next to the old one.  With an expected sha256 the install is reused for as long
+    as it exists.  Without one, e.g. for the versionless cf cli 'stable' url, the newest install for the url is only
+    reused for max_age_hours, after which the archive is downloaded again.  Archives are hashed while they download,
+    checked against the expected sha256 when one is configured and unpacked into a staging directory that is renamed
+    into place, so builds sharing the cache never see a partial install.
+    """
+    clazz = 'ToolchainCache'
+    marker_file = '.toolchain.json'
+    download_chunk_size = 1024 * 1024
+
+    def __init__(self, cache_directory, max_age_hours=24):
+        self.cache_directory = os.path.join(os.path.expanduser(cache_directory), 'toolchains')
+        self.max_age_seconds = max_age_hours * 60 * 60
+
+    @staticmethod
+    def _key(value):
+        return hashlib.sha256(value.encode('utf-8')).hexdigest()[:16]
+
+    def install_directory(self, name, url, sha256):
+        return os.path.join(self.cache_directory, name, "{}-{}".format(ToolchainCache._key(url),
+                                                                       ToolchainCache._key(sha256.lower())))
+
+    def _is_installed(self, install_directory):
+        return os.path.isfile(os.path.join(install_directory, ToolchainCache.marker_file))
+
+    def _find_recent_install(self, name, url):
+        pattern = os.path.join(self.cache_directory, name, ToolchainCache._key(url) + '-*')
+        installs = [directory for directory in glob.glob(pattern) if self._is_installed(directory)]
+        if not installs:
+            return None
+
+        newest = max(installs, key=lambda directory: os.path.getmtime(
+            os.path.join(directory, ToolchainCache.marker_file)))
+        if time.time() - os.path.getmtime(os.path.join(newest, ToolchainCache.marker_file)) > self.max_age_seconds:
+            return None
+        return newest
+
+    def install(self, name, url, sha256=None, verify=True):
+        """Returns the directory the archive at url is unpacked in, downloading it only if it is not cached."""
+        method = 'install'
+
+        cached_directory = self.install_directory(name, url, sha256) if sha256 else self._find_recent_install(name,
+                                                                                                              url)
+        if cached_directory is not None and self._is_installed(cached_directory):
+            commons.print_msg(ToolchainCache.clazz, method, "Using cached {} in {}".format(name, cached_directory))
+            return cached_directory
+
+        os.makedirs(os.path.join(self.cache_directory, name), exist_ok=True)
+        staging_directory = tempfile.mkdtemp(prefix='.staging-', dir=os.path.join(self.cache_directory, name))
+
+        try:
+            archive = os.path.join(staging_directory, 'download.tgz')
+            actual_sha256 = self._download(url, archive, verify)
+
+            if sha256 and actual_sha256 != sha256.lower():
+                raise ToolchainException("Checksum mismatch for {}. Expected sha256 {} but got {}".format(
+                    url, sha256.lower(), actual_sha256))
+
+            install_directory = self.install_directory(name, url, actual_sha256)
+            marker = os.path.join(install_directory, ToolchainCache.marker_file)
+            if self._is_installed(install_directory):
+                # the same archive was downloaded again, keep using it for another max_age_hours
+                os.utime(marker)
+            else:
+                self._extract(archive, staging_directory)
+                os.remove(archive)
+
+                with open(os.path.join(staging_directory, ToolchainCache.marker_file), 'w') as marker_handle:
+                    json.dump({'name': name, 'url': url, 'sha256': actual_sha256}, marker_handle)
+
+                try:
+                    os.rename(staging_directory, install_directory)
+                except OSError:
+                    # another build installed the same version first
+                    if not self._is_installed(install_directory):
+                        raise
+        finally:
+            shutil.rmtree(staging_directory, ignore_errors=True)
+
+        commons.print_msg(ToolchainCache.clazz, method, "Installed {} in {}".format(name, install_directory))
+        return install_directory
+
+    def _download(self, url, destination, verify):
+        digest = hashlib.sha256()
+
+        try:
+            resp = httpclient.get(url, stream=True, verify=verify)  # nosec
+            resp.raise_for_status()
+            with open(destination, 'wb') as f:
+                for chunk in resp.iter_content(chunk_size=ToolchainCache.download_chunk_size):
+                    digest.update(chunk)
+                    f.write(chunk)
+        except Exception as e:
+            raise ToolchainException("Failed downloading {}: {}".format(url, e))
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def _extract(archive, destination):
+        destination = os.path.realpath(destination)
+
+        try:
+            with tarfile.open(archive) as tar:
+                # members, including link targets, are checked before anything is written
+                for member in tar.getmembers():
+                    if not commons.is_safe_tar_member(member, destination):
+                        raise ToolchainException("Refusing to extract unsafe member {}".format(member.name))
+                tar.extractall(destination)  # nosec
+        except tarfile.TarError as e:
+            raise ToolchainException("Failed extracting {}: {}".format(archive, e))
@@ -7,14 +7,17 @@ import re
 import shutil
 import subprocess
 import tarfile
-import time
 
 import requests
 from flow.buildconfig import BuildConfig
 from flow.coderepo.code_repo_abc import Code_Repo
+from flow.coderepo.github.github_cache import GitHubCache
+from flow.coderepo.github.github_graphql import GitHubGraphQL
+from flow.coderepo.github.local_git import LocalGit
 
 import flow.utils.commons as cicommons
 import flow.utils.commons as commons
+import flow.utils.httpclient as httpclient
 from flow.utils.commons import Object
 from flow.projecttracking.story import Story
 
@@ -31,6 +34,8 @@ class GitHub(Code_Repo):
     all_tags_and_shas = []
     all_commits = []
     found_all_commits = False
+    cache = None
+    local_git = None
 
     def __init__(self, config_override=None, verify_repo=True):
         method = '__init__'
@@ -107,28 +112,15 @@ class GitHub(Code_Repo):
 
         commons.print_msg(GitHub.clazz, method, repo_url)
 
-        retries = 0
-        finished = False
-        while not finished:
-            try:
-                resp = requests.get(repo_url, headers=headers, timeout=self.http_timeout)
-                finished = True
-            except requests.ConnectionError:
-                commons.print_msg(GitHub.clazz, method, "Request to GitHub timed out, retrying...")
-                if retries < 2:
-                    time.sleep(retries * 5)
-                    retries += 1
-                    continue
-                commons.print_msg(GitHub.clazz, method, "Request to GitHub timed out.", "ERROR")
-                exit(1)
-            except Exception as e:
-                commons.print_msg(GitHub.clazz, method, "Failed to access github location {}, retrying".format(e))
-                if retries < 2:
-                    time.sleep(retries * 5)
-                    retries += 1
-                    continue
-                commons.print_msg(GitHub.clazz, method, "Failed to access github location {}".format(e), "ERROR")
-                exit(1)
+        # connection failures and 5xx responses are retried with backoff by httpclient
+        try:
+            resp = httpclient.get(repo_url, headers=headers, timeout=self.http_timeout)
+        except requests.ConnectionError:
+            commons.print_msg(GitHub.clazz, method, "Request to GitHub timed out.", "ERROR")
+            exit(1)
+        except Exception as e:
+            commons.print_msg(GitHub.clazz, method, "Failed to access github location {}".format(e), "ERROR")
+            exit(1)
 
         # noinspection PyUnboundLocalVariable
         commons.print_msg(GitHub.clazz, method, resp)
@@ -185,7 +177,7 @@ class GitHub(Code_Repo):
             headers = {'Content-type': cicommons.content_json, 'Accept': cicommons.content_json}
 
         try:
-            resp = requests.post(release_url, tag_and_release_note_payload, headers=headers, params=url_params, timeout=self.http_timeout)
+            resp = httpclient.post(release_url, tag_and_release_note_payload, headers=headers, params=url_params, timeout=self.http_timeout)
         except requests.ConnectionError:
             commons.print_msg(GitHub.clazz, method, 'Request to GitHub timed out.', 'ERROR')
             exit(1)
@@ -204,6 +196,9 @@ class GitHub(Code_Repo):
         else:
             commons.print_msg(GitHub.clazz, method, resp.text)
 
+        # a new tag shifts every page of the tag list, so anything we cached is stale now
+        self._invalidate_cached_tags()
+
         commons.print_msg(GitHub.clazz, method, 'end')
 
     def format_github_specific_release_notes_from_tracker_story_details(self, story_details):
@@ -247,7 +242,7 @@ class GitHub(Code_Repo):
         headers = {'Content-type': cicommons.content_json, 'Accept': cicommons.content_json, 'Authorization': ('token ' + self.token)}
 
         try:
-            resp = requests.get(release_url_api, headers=headers, timeout=self.http_timeout)
+            resp = httpclient.get(release_url_api, headers=headers, timeout=self.http_timeout)
         except requests.ConnectionError:
             commons.print_msg(GitHub.clazz, method, 'Request to GitHub timed out.', 'ERROR')
             exit(1)
@@ -267,7 +262,7 @@ class GitHub(Code_Repo):
         }
         release_url_api = self.url + '/' + self.org + '/' + self.repo + '/releases/' + str(git_release_id)
         try:
-            requests.patch(release_url_api, json=jsonMessage, headers=headers, timeout=self.http_timeout)
+            httpclient.patch(release_url_api, json=jsonMessage, headers=headers, timeout=self.http_timeout)
         except requests.ConnectionError:
             commons.print_msg(GitHub.clazz, method, 'Request to GitHub timed out.', 'ERROR')
             exit(1)
@@ -425,11 +420,36 @@ class GitHub(Code_Repo):
                 return GitHub.all_commits
             commons.print_msg(GitHub.clazz, method, 'Beginning sha is not in our cached list, pulling more commits')
 
+        branch = self.config.build_env_info['associatedBranchName']
+
+        local_git = self._get_local_git()
+        branch_sha = local_git.resolve_branch(str(branch)) if local_git is not None else None
+        if branch_sha is not None:
+            if start_from_sha and local_git.is_ancestor(start_from_sha, branch_sha):
+                # everything after the beginning sha, plus the beginning sha itself
+                commits = local_git.get_commits(branch_sha, '--not', start_from_sha + '^@')
+            else:
+                commits = local_git.get_commits(branch_sha)
+                GitHub.found_all_commits = commits is not None
+
+            if commits is not None:
+                commons.print_msg(GitHub.clazz, method, '{} total commits from local clone'.format(len(commits)))
+                commons.print_msg(GitHub.clazz, method, 'end')
+                GitHub.all_commits = commits
+                return commits
+
+        graphql = self._get_graphql()
+        if graphql is not None:
+            commits = self._get_all_commits_from_graphql(graphql, branch, start_from_sha)
+            commons.print_msg(GitHub.clazz, method, '{} total commits'.format(len(commits)))
+            commons.print_msg(GitHub.clazz, method, 'end')
+            GitHub.all_commits = commits
+            return commits
+
         per_page = 100
         start_page = (len(GitHub.all_commits)//per_page)+1
         finished = False
         output = GitHub.all_commits
-        branch = self.config.build_env_info['associatedBranchName']
             
         repo_url = GitHub.url + '/' + GitHub.org + '/' + GitHub.repo + '/commits?per_page=' + str(per_page) + '&page=' + str(start_page) + '&sha=' + str(branch)
         token = GitHub.token
@@ -439,47 +459,25 @@ class GitHub(Code_Repo):
         else:
             headers = {'Content-type': cicommons.content_json, 'Accept': cicommons.content_json}
         
-        retries = 0
-
         while not finished:
+            commits, next_url = self._get_github_page(repo_url, headers, '/commits',
+                                                      lambda page: [{'sha': commit['sha'],
+                                                                     'commit': {'message': commit['commit']['message']}}
+                                                                    for commit in page])
 
-            commons.print_msg(GitHub.clazz, method, repo_url)
-
-            try:
-                resp = requests.get(repo_url, headers=headers, timeout=self.http_timeout)
-            except Exception as e:
-                commons.print_msg(GitHub.clazz, method, "Failed to access github location {}".format(e))
-                if retries < 2:
-                    time.sleep(retries * 5)
-                    retries += 1
-                    continue
-                commons.print_msg(GitHub.clazz, method, "Failed to access github location {}".format(e), "ERROR")
-                exit(1)
-
-            retries = 0
-
-            if 'next' in resp.links:
-                repo_url = resp.links['next']['url']
+            if next_url is not None:
+                repo_url = next_url
             else:
                 GitHub.found_all_commits = True
                 finished = True
 
-            if resp.status_code != 200:
-                commons.print_msg(GitHub.clazz, method, "Failed to access github location {url}\r\n Response: {rsp}"
-                                  .format(url=repo_url,
-                                         rsp=resp.text),
-                                 "ERROR")
-                exit(1)
-            else:
-                #commons.print_msg(GitHub.clazz, method, resp.text)
-                #commons.print_msg(GitHub.clazz, method, resp.json())
-                simplified = []
-                for commit in resp.json():
-                    simplified.append({'sha': commit['sha'], 'commit': { 'message': commit['commit']['message'] } })
-                    if commit['sha'] == start_from_sha:
-                        commons.print_msg(GitHub.clazz, method, 'Found the beginning sha, stopping lookup')
-                        finished = True
-                output.extend(simplified)
+            for commit in commits:
+                if commit['sha'] == start_from_sha:
+                    commons.print_msg(GitHub.clazz, method, 'Found the beginning sha, stopping lookup')
+                    finished = True
+            output.extend(commits)
+
+        self._save_cache()
 
         commons.print_msg(GitHub.clazz, method, '{} total commits'.format(len(output)))
         commons.print_msg(GitHub.clazz, method, 'end')
@@ -490,6 +488,145 @@ class GitHub(Code_Repo):
 
         return output
 
+    def _get_cache(self):
+        cache_directory = commons.get_setting(self.config.settings, 'github', 'cache_directory')
+
+        if not cache_directory or GitHub.org is None or GitHub.repo is None:
+            return None
+
+        cache = GitHubCache(os.path.expanduser(cache_directory), GitHub.org, GitHub.repo)
+        if GitHub.cache is None or GitHub.cache.cache_file != cache.cache_file:
+            GitHub.cache = cache
+
+        return GitHub.cache
+
+    def _get_local_git(self):
+        if not commons.get_bool_setting(self.config.settings, 'github', 'local_git') or GitHub.org is None or \
+                GitHub.repo is None:
+            return None
+
+        if GitHub.local_git is None or (GitHub.local_git.org, GitHub.local_git.repo) != (GitHub.org, GitHub.repo):
+            GitHub.local_git = LocalGit(GitHub.org, GitHub.repo)
+
+        return GitHub.local_git if GitHub.local_git.is_usable() else None
+
+    def _get_graphql(self):
+        method = '_get_graphql'
+
+        if commons.get_setting(self.config.settings, 'github', 'api', 'rest').strip().lower() != 'graphql' or \
+                GitHub.org is None or GitHub.repo is None:
+            return None
+
+        if GitHub.token is None:
+            commons.print_msg(GitHub.clazz, method, 'The GitHub GraphQL api requires a token, using the REST api',
+                              'WARN')
+            return None
+
+        graphql_url = commons.get_setting(self.config.settings, 'github', 'graphql_url') or \
+            GitHubGraphQL.graphql_url_from_rest_url(GitHub.url)
+
+        return GitHubGraphQL(graphql_url, GitHub.org, GitHub.repo, GitHub.token, self.http_timeout)
+
+    def _get_all_commits_from_graphql(self, graphql, branch, start_from_sha):
+        method = '_get_all_commits_from_graphql'
+
+        # walk the history back to the beginning sha like the rest api does.  filtering by date would drop merged
+        # commits that are older than the beginning sha.
+        output = []
+        cursor = None
+        finished = False
+        while not finished:
+            commits, cursor = graphql.get_history_page(str(branch), cursor)
+            if cursor is None:
+                GitHub.found_all_commits = True
+                finished = True
+
+            for commit in commits:
+                if commit['sha'] == start_from_sha:
+                    commons.print_msg(GitHub.clazz, method, 'Found the beginning sha, stopping lookup')
+                    finished = True
+            output.extend(commits)
+
+        return output
+
+    def _get_all_tags_and_shas_from_graphql(self, graphql, need_snapshot, need_release, need_tag, need_base):
+        method = '_get_all_tags_and_shas_from_graphql'
+
+        output = []
+        cursor = None
+        finished = False
+        while not finished:
+            tags, cursor = graphql.get_tags_page(cursor)
+            finished = cursor is None
+
+            output.extend(tags)
+            if self._verify_tags_found(output, need_snapshot, need_release, need_tag, need_base):
+                commons.print_msg(GitHub.clazz, method, 'Found necessary tags, stopping lookup')
+                finished = True
+
+        return output
+
+    def _save_cache(self):
+        cache = self._get_cache()
+        if cache is not None:
+            cache.save()
+
+    def _invalidate_cached_tags(self):
+        GitHub.all_tags_and_shas = []
+
+        if GitHub.local_git is not None:
+            GitHub.local_git.reset()
+
+        cache = self._get_cache()
+        if cache is not None:
+            cache.invalidate('/tags')
+            cache.save()
+
+    def _get_github_page(self, page_url, headers, resource, simplify):
+        """Fetch one page of a paged GitHub api, revalidating against the on-disk cache when one is configured.
+
+        Returns the simplified page and the url of the next page (None on the last page).
+        """
+        method = '_get_github_page'
+
+        cache = self._get_cache()
+        cached_page = cache.get(page_url) if cache is not None else None
+
+        request_headers = dict(headers)
+        if cached_page is not None:
+            request_headers['If-None-Match'] = cached_page['etag']
+
+        commons.print_msg(GitHub.clazz, method, page_url)
+
+        try:
+            resp = httpclient.get(page_url, headers=request_headers, timeout=self.http_timeout)
+        except Exception as e:
+            commons.print_msg(GitHub.clazz, method, "Failed to access github location {}".format(e), "ERROR")
+            exit(1)
+
+        # noinspection PyUnboundLocalVariable
+        if resp.status_code == 304 and cached_page is not None:
+            commons.print_msg(GitHub.clazz, method, 'Not modified, using cached page')
+            return cached_page['data'], cached_page['next']
+
+        if resp.status_code != 200:
+            commons.print_msg(GitHub.clazz, method, "Failed to access github location {url}\r\n Response: {rsp}"
+                              .format(url=page_url,
+                                      rsp=resp.text),
+                              "ERROR")
+            exit(1)
+
+        next_url = resp.links['next']['url'] if 'next' in resp.links else None
+        page = simplify(resp.json())
+
+        if cache is not None:
+            if cached_page is not None and re.search(r'[?&]page=1(&|$)', page_url):
+                # the first page changed, so the rest of the pages have shifted as well
+                cache.invalidate(resource)
+            cache.put(page_url, resp.headers.get('ETag'), next_url, page)
+
+        return page, next_url
+
     def _verify_tags_found(self, tag_list, need_snapshot, need_release, need_tag, need_base):
         found_snapshot = 0
         found_release = 0
@@ -523,6 +660,22 @@ class GitHub(Code_Repo):
                 return GitHub.all_tags_and_shas
             commons.print_msg(GitHub.clazz, method, 'Necessary tags are not in our cached list, pulling more tags')
        
+        local_git = self._get_local_git()
+        tags = local_git.get_tags() if local_git is not None else None
+        if tags is not None:
+            commons.print_msg(GitHub.clazz, method, '{} total tags from local clone'.format(len(tags)))
+            commons.print_msg(GitHub.clazz, method, 'end')
+            GitHub.all_tags_and_shas = tags
+            return tags
+
+        graphql = self._get_graphql()
+        if graphql is not None:
+            tags = self._get_all_tags_and_shas_from_graphql(graphql, need_snapshot, need_release, need_tag, need_base)
+            commons.print_msg(GitHub.clazz, method, '{} total tags'.format(len(tags)))
+            commons.print_msg(GitHub.clazz, method, 'end')
+            GitHub.all_tags_and_shas = tags
+            return tags
+
         per_page = 100
         start_page = (len(GitHub.all_tags_and_shas)//per_page)+1
         finished = False
@@ -536,43 +689,22 @@ class GitHub(Code_Repo):
         else:
             headers = {'Content-type': cicommons.content_json, 'Accept': cicommons.content_json}
 
-        retries = 0
-
         while not finished:
-            commons.print_msg(GitHub.clazz, method, repo_url)
-
-            try:
-                resp = requests.get(repo_url, headers=headers, timeout=self.http_timeout)
-            except Exception as e:
-                commons.print_msg(GitHub.clazz, method, "Failed to access github location {}".format(e))
-                if retries < 2:
-                    time.sleep(retries * 5)
-                    retries += 1
-                    continue
-                commons.print_msg(GitHub.clazz, method, "Failed to access github location {}".format(e), "ERROR")
-                exit(1)
-
-            retries = 0
+            tags, next_url = self._get_github_page(repo_url, headers, '/tags',
+                                                   lambda page: [(tag['name'], tag['commit']['sha']) for tag in page])
 
-            if 'next' in resp.links:
-                repo_url = resp.links['next']['url']
+            if next_url is not None:
+                repo_url = next_url
             else:
                 finished = True
 
-            if resp.status_code != 200:
-                commons.print_msg(GitHub.clazz, method, "Failed to access github location {url}\r\n Response: {rsp}"
-                                  .format(url=repo_url,
-                                         rsp=resp.text),
-                                 "ERROR")
-                exit(1)
-            else:
-                #commons.print_msg(GitHub.clazz, method, resp.text)
-                #commons.print_msg(GitHub.clazz, method, resp.json())
-                simplified = list(map(lambda obj: (obj['name'], obj['commit']['sha']), resp.json()))
-                output.extend(simplified)
-                if self._verify_tags_found(output, need_snapshot, need_release, need_tag, need_base):
-                    commons.print_msg(GitHub.clazz, method, 'Found necessary tags, stopping lookup')
-                    finished = True
+            # pages served from the disk cache come back from json as lists
+            output.extend([tuple(tag) for tag in tags])
+            if self._verify_tags_found(output, need_snapshot, need_release, need_tag, need_base):
+                commons.print_msg(GitHub.clazz, method, 'Found necessary tags, stopping lookup')
+                finished = True
+
+        self._save_cache()
 
         #commons.print_msg(GitHub.clazz, method, output)
 
@@ -764,34 +896,44 @@ class GitHub(Code_Repo):
 
         commons.print_msg(GitHub.clazz, method, ending_sha + ' , ' + beginning_sha)
 
-        # get all commits here
-        commits = self.get_all_commits_from_github(beginning_sha)
-        trimmed_commits = []
-        found_beginning = False
+        local_git = self._get_local_git()
+        branch_sha = None
+        if local_git is not None:
+            branch_sha = local_git.resolve_branch(str(self.config.build_env_info['associatedBranchName']))
 
-        if semver_array_beginning_version is None and semver_array_ending_version is None:  # Everything!
-            commons.print_msg(GitHub.clazz, method, "No tag present. Pulling all git commit statements instead.")
-            trimmed_commits = commits[:]
-            found_beginning = True
-        elif semver_array_ending_version is None:  # Everything since tag
-            commons.print_msg(GitHub.clazz, method, "The first tag: {}".format(semver_array_beginning_version))
-            for commit in commits:
-                if commit['sha'] == beginning_sha:
-                    found_beginning = True
-                    break
-                trimmed_commits.append(commit)
-        else:  # Between two tags.  Mostly used when re-deploying old versions to send release notes
-            commons.print_msg(GitHub.clazz, method, "The first tag: ".format(semver_array_beginning_version))
-            commons.print_msg(GitHub.clazz, method, "The last tag: ".format(semver_array_ending_version))
-            found_end = False
-            for commit in commits:
-                if commit['sha'] == ending_sha:
-                    found_end = True
-                if commit['sha'] == beginning_sha:
-                    found_beginning = True
-                    break
-                if found_end:
+        if branch_sha is not None:
+            # a single git log over the range instead of walking api pages
+            trimmed_commits, found_beginning = self._get_local_commit_history(local_git, branch_sha, beginning_sha,
+                                                                               ending_sha)
+        else:
+            # get all commits here
+            commits = self.get_all_commits_from_github(beginning_sha)
+            trimmed_commits = []
+            found_beginning = False
+
+            if semver_array_beginning_version is None and semver_array_ending_version is None:  # Everything!
+                commons.print_msg(GitHub.clazz, method, "No tag present. Pulling all git commit statements instead.")
+                trimmed_commits = commits[:]
+                found_beginning = True
+            elif semver_array_ending_version is None:  # Everything since tag
+                commons.print_msg(GitHub.clazz, method, "The first tag: {}".format(semver_array_beginning_version))
+                for commit in commits:
+                    if commit['sha'] == beginning_sha:
+                        found_beginning = True
+                        break
                     trimmed_commits.append(commit)
+            else:  # Between two tags.  Mostly used when re-deploying old versions to send release notes
+                commons.print_msg(GitHub.clazz, method, "The first tag: ".format(semver_array_beginning_version))
+                commons.print_msg(GitHub.clazz, method, "The last tag: ".format(semver_array_ending_version))
+                found_end = False
+                for commit in commits:
+                    if commit['sha'] == ending_sha:
+                        found_end = True
+                    if commit['sha'] == beginning_sha:
+                        found_beginning = True
+                        break
+                    if found_end:
+                        trimmed_commits.append(commit)
 
         trimmed_commits = list(map(lambda current_sommit: "{} {}".format(current_sommit['sha'][0:7], current_sommit['commit']['message']), trimmed_commits))
 
@@ -804,6 +946,20 @@ class GitHub(Code_Repo):
         commons.print_msg(GitHub.clazz, method, 'end')
         return trimmed_commits
 
+    def _get_local_commit_history(self, local_git, branch_sha, beginning_sha, ending_sha):
+        method = '_get_local_commit_history'
+
+        end_of_range = ending_sha or branch_sha
+
+        if not beginning_sha:
+            commons.print_msg(GitHub.clazz, method, "No tag present. Pulling all git commit statements instead.")
+            return local_git.get_commits(end_of_range) or [], True
+
+        if not local_git.is_ancestor(beginning_sha, end_of_range):
+            return [], False
+
+        return local_git.get_commits(beginning_sha + '..' + end_of_range) or [], True
+
     def _is_semver_tag_array_release_or_snapshot(self, semver_array):
         # check the 0.0.0.x position.
         # if x == 0 then it is release
@@ -837,7 +993,7 @@ class GitHub(Code_Repo):
             headers = {'Content-type': cicommons.content_json, 'Accept': cicommons.content_json}
 
         try:
-            download_resp = requests.get(artifact_to_download, headers=headers)
+            download_resp = httpclient.get(artifact_to_download, headers=headers)
 
             with open(download_path, 'wb') as f:
                 for chunk in download_resp.iter_content(chunk_size=1024):
@@ -872,7 +1028,7 @@ class GitHub(Code_Repo):
 
         commons.print_msg(GitHub.clazz, method, ("Retrieving Github information from " + tag_information_url))
 
-        resp = requests.get(tag_information_url, headers=headers)
+        resp = httpclient.get(tag_information_url, headers=headers)
 
         if resp.status_code != 200:
             commons.print_msg(GitHub.clazz, method, ("Failed to access github tag information at " + tag_information_url + "\r\n Response: " + resp.text), "ERROR")
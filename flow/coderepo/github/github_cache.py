@@ -0,0 +1,79 @@
+#!/usr/bin/python
+# github_cache.py
+
+import json
+import os
+import tempfile
+
+import flow.utils.commons as commons
+
+
+class GitHubCache:
+    """On-disk cache of GitHub api pages for a single repo, keyed by request url.
+
+    Each entry keeps the ETag of the page, the simplified body that flow uses and the url of the next page so
+    that a 304 from GitHub can be answered entirely from disk.
+    """
+    clazz = 'GitHubCache'
+
+    def __init__(self, cache_directory, org, repo):
+        self.cache_file = os.path.join(cache_directory, 'github', org, repo + '.json')
+        self.entries = None
+        self.dirty = False
+
+    def _load(self):
+        method = '_load'
+
+        if self.entries is not None:
+            return
+
+        self.entries = {}
+        if os.path.isfile(self.cache_file):
+            try:
+                with open(self.cache_file, 'r') as cache:
+                    self.entries = json.load(cache)
+            except (IOError, ValueError) as e:
+                commons.print_msg(GitHubCache.clazz, method, "Ignoring unreadable cache file {}: {}".format(
+                    self.cache_file, e), 'WARN')
+
+    def get(self, url):
+        self._load()
+        return self.entries.get(url)
+
+    def put(self, url, etag, next_url, data):
+        self._load()
+
+        if etag is None:
+            self.entries.pop(url, None)
+        else:
+            self.entries[url] = {'etag': etag, 'next': next_url, 'data': data}
+
+        self.dirty = True
+
+    def invalidate(self, resource):
+        # resource is the path segment of the api being dropped, e.g. '/tags' or '/commits'
+        self._load()
+
+        for url in [url for url in self.entries if resource + '?' in url]:
+            del self.entries[url]
+            self.dirty = True
+
+    def save(self):
+        method = 'save'
+
+        if not self.dirty:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+
+            # write to a temp file and swap it in so concurrent pipeline stages never read a partial file
+            handle, temp_file = tempfile.mkstemp(dir=os.path.dirname(self.cache_file))
+            with os.fdopen(handle, 'w') as cache:
+                json.dump(self.entries, cache)
+            os.replace(temp_file, self.cache_file)
+
+            self.dirty = False
+        except (IOError, OSError) as e:
+            commons.print_msg(GitHubCache.clazz, method, "Unable to write cache file {}: {}".format(
+                self.cache_file, e), 'WARN')
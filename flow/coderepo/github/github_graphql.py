@@ -0,0 +1,106 @@
+#!/usr/bin/python
+# github_graphql.py
+
+import json
+
+import flow.utils.commons as commons
+import flow.utils.httpclient as httpclient
+
+
+class GitHubGraphQL:
+    """Fetches tags and commit history through the GitHub GraphQL api, asking only for the fields flow uses."""
+    clazz = 'GitHubGraphQL'
+    page_size = 100
+
+    tags_query = """
+        query($owner: String!, $name: String!, $first: Int!, $cursor: String) {
+          repository(owner: $owner, name: $name) {
+            refs(refPrefix: "refs/tags/", first: $first, after: $cursor,
+                 orderBy: {field: ALPHABETICAL, direction: DESC}) {
+              pageInfo { hasNextPage endCursor }
+              nodes { name target { oid ... on Tag { target { oid } } } }
+            }
+          }
+        }"""
+
+    history_query = """
+        query($owner: String!, $name: String!, $expression: String!, $first: Int!, $cursor: String) {
+          repository(owner: $owner, name: $name) {
+            object(expression: $expression) {
+              ... on Commit {
+                history(first: $first, after: $cursor) {
+                  pageInfo { hasNextPage endCursor }
+                  nodes { oid message }
+                }
+              }
+            }
+          }
+        }"""
+
+    def __init__(self, graphql_url, org, repo, token, http_timeout):
+        self.graphql_url = graphql_url
+        self.org = org
+        self.repo = repo
+        self.token = token
+        self.http_timeout = http_timeout
+
+    @staticmethod
+    def graphql_url_from_rest_url(rest_url):
+        # https://api.github.com/repos -> https://api.github.com/graphql
+        # https://github.example.com/api/v3/repos -> https://github.example.com/api/graphql
+        base_url = rest_url.rstrip('/')
+        if base_url.endswith('/repos'):
+            base_url = base_url[:-len('/repos')]
+        if base_url.endswith('/api/v3'):
+            return base_url[:-len('/v3')] + '/graphql'
+        return base_url + '/graphql'
+
+    def _query(self, query, variables):
+        method = '_query'
+
+        headers = {'Content-type': commons.content_json, 'Accept': commons.content_json,
+                   'Authorization': ('bearer ' + self.token)}
+
+        variables = dict(variables, owner=self.org, name=self.repo, first=GitHubGraphQL.page_size)
+
+        commons.print_msg(GitHubGraphQL.clazz, method, "{} {}".format(self.graphql_url, variables))
+
+        try:
+            resp = httpclient.post(self.graphql_url, json.dumps({'query': query, 'variables': variables}),
+                                   headers=headers, timeout=self.http_timeout)
+        except Exception as e:
+            commons.print_msg(GitHubGraphQL.clazz, method, "Failed to access github location {}".format(e), 'ERROR')
+            exit(1)
+
+        # noinspection PyUnboundLocalVariable
+        if resp.status_code != 200 or 'errors' in resp.json():
+            commons.print_msg(GitHubGraphQL.clazz, method, "Failed to access github location {url}\r\n Response: {rsp}"
+                              .format(url=self.graphql_url,
+                                      rsp=resp.text),
+                              'ERROR')
+            exit(1)
+
+        return resp.json()['data']['repository']
+
+    def get_tags_page(self, cursor=None):
+        refs = self._query(GitHubGraphQL.tags_query, {'cursor': cursor})['refs']
+
+        tags = []
+        for node in refs['nodes']:
+            target = node['target']
+            # annotated tags point at a tag object, the commit is one level down
+            tags.append((node['name'], target['target']['oid'] if 'target' in target else target['oid']))
+
+        next_cursor = refs['pageInfo']['endCursor'] if refs['pageInfo']['hasNextPage'] else None
+        return tags, next_cursor
+
+    def get_history_page(self, expression, cursor=None):
+        commit = self._query(GitHubGraphQL.history_query, {'expression': expression, 'cursor': cursor})['object']
+        if commit is None:
+            return [], None
+
+        history = commit['history']
+        commits = [{'sha': node['oid'], 'commit': {'message': node['message']}} for node in history['nodes']]
+
+        next_cursor = history['pageInfo']['endCursor'] if history['pageInfo']['hasNextPage'] else None
+        return commits, next_cursor
@@ -0,0 +1,123 @@
+#!/usr/bin/python
+# local_git.py
+
+import os
+import subprocess
+
+import flow.utils.commons as commons
+
+
+class LocalGit:
+    """Answers tag and commit history questions from the local clone instead of the GitHub api.
+
+    Only used when the working directory is a full (non-shallow) clone of the configured repo.
+    """
+    clazz = 'LocalGit'
+    git_timeout = 300
+    fetch_timeout = 30
+
+    def __init__(self, org, repo, directory=None):
+        self.org = org
+        self.repo = repo
+        self.directory = directory
+        self.usable = None
+
+    def _git(self, *args, timeout=None):
+        # never wait at a credential prompt, a fetch that needs credentials fails and flow uses the api instead
+        env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+        try:
+            process = subprocess.run(['git'] + list(args), cwd=self.directory, stdin=subprocess.DEVNULL,
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+                                     timeout=timeout or LocalGit.git_timeout)
+        except (OSError, subprocess.SubprocessError):
+            return 1, ''
+
+        return process.returncode, process.stdout.decode('utf-8', 'replace')
+
+    def is_usable(self):
+        method = 'is_usable'
+
+        if self.usable is not None:
+            return self.usable
+
+        self.usable = False
+
+        return_code, git_dir = self._git('rev-parse', '--git-dir')
+        if return_code != 0:
+            commons.print_msg(LocalGit.clazz, method, 'No local clone found, using the GitHub api')
+            return False
+
+        git_dir = git_dir.strip()
+        if self.directory is not None:
+            git_dir = os.path.join(self.directory, git_dir)
+
+        if os.path.isfile(os.path.join(git_dir, 'shallow')):
+            commons.print_msg(LocalGit.clazz, method, 'Local clone is shallow, using the GitHub api')
+            return False
+
+        return_code, origin_url = self._git('config', '--get', 'remote.origin.url')
+        origin_url = origin_url.strip().lower()
+        if origin_url.endswith('.git'):
+            origin_url = origin_url[:-len('.git')]
+        expected = '{}/{}'.format(self.org, self.repo).lower()
+        if return_code != 0 or not (origin_url.endswith('/' + expected) or origin_url.endswith(':' + expected)):
+            commons.print_msg(LocalGit.clazz, method, 'Local clone is not {}, using the GitHub api'.format(expected))
+            return False
+
+        # tags may have been created through the api by an earlier stage, so make sure we have them all
+        return_code, _ = self._git('fetch', '--tags', '--quiet', 'origin', timeout=LocalGit.fetch_timeout)
+        if return_code != 0:
+            commons.print_msg(LocalGit.clazz, method, 'Unable to fetch tags from origin, using the GitHub api', 'WARN')
+            return False
+
+        commons.print_msg(LocalGit.clazz, method, 'Using local clone for tags and commit history')
+        self.usable = True
+        return True
+
+    def reset(self):
+        # forces a fresh tag fetch on next use, e.g. after a tag was created through the api
+        self.usable = None
+
+    def get_tags(self):
+        # descending by name, the order the GitHub rest and graphql apis hand back.  version order would let
+        # v1.9.0 come before v1.10.0 here but not there, and the first matching tag would depend on the backend.
+        return_code, output = self._git('for-each-ref', '--sort=-refname',
+                                        '--format=%(refname)%09%(objectname)%09%(*objectname)', 'refs/tags')
+        if return_code != 0:
+            return None
+
+        tags = []
+        for line in output.splitlines():
+            ref, sha, peeled_sha = line.split('\t')
+            # annotated tags point at a tag object, the peeled sha is the commit behind it
+            tags.append((ref[len('refs/tags/'):], peeled_sha or sha))
+
+        return tags
+
+    def resolve_branch(self, branch):
+        for ref in ['refs/remotes/origin/' + branch, 'refs/heads/' + branch]:
+            return_code, sha = self._git('rev-parse', '--verify', '--quiet', ref + '^{commit}')
+            if return_code == 0:
+                return sha.strip()
+
+        return None
+
+    def is_ancestor(self, ancestor_sha, descendant_sha):
+        return_code, _ = self._git('merge-base', '--is-ancestor', ancestor_sha, descendant_sha)
+        return return_code == 0
+
+    def get_commits(self, *revisions):
+        # unit and record separators keep multi-line commit messages intact
+        return_code, output = self._git('log', '--format=%H%x1f%B%x1e', *revisions)
+        if return_code != 0:
+            return None
+
+        commits = []
+        for record in output.split('\x1e'):
+            record = record.strip('\n')
+            if not record:
+                continue
+            sha, message = record.split('\x1f', 1)
+            commits.append({'sha': sha, 'commit': {'message': message.strip('\n')}})
+
+        return commits
@@ -9,6 +9,7 @@ from flow.buildconfig import BuildConfig
 from flow.communications.communications_abc import communications
 
 import flow.utils.commons as commons
+import flow.utils.httpclient as httpclient
 from flow.utils.commons import Object
 
 
@@ -168,7 +169,7 @@ class Slack(communications):
         resp = None  # instantiated so it can be logged outside of the try below the except
 
         try:
-            resp = requests.post(Slack.slack_url, slack_message.to_JSON(), headers=headers, timeout=self.http_timeout)
+            resp = httpclient.post(Slack.slack_url, slack_message.to_JSON(), headers=headers, timeout=self.http_timeout)
         except requests.ConnectionError:
             commons.print_msg(Slack.clazz, method, "Request to Slack timed out.", "ERROR")
             exit(1)
@@ -306,8 +307,8 @@ class Slack(communications):
             commons.print_msg(Slack.clazz, method, Slack.slack_url)
 
             try:
-                resp = requests.post(Slack.slack_url, slack_message.to_JSON(), headers=headers,
-                                     timeout=Slack.http_timeout)
+                resp = httpclient.post(Slack.slack_url, slack_message.to_JSON(), headers=headers,
+                                       timeout=Slack.http_timeout)
 
                 if resp.status_code == 200:
                     commons.print_msg(Slack.clazz, method,
@@ -410,8 +411,8 @@ class Slack(communications):
         commons.print_msg(Slack.clazz, method, Slack.slack_url)
 
         try:
-            resp = requests.post(Slack.slack_url, slack_message.to_JSON(), headers=headers,
-                                 timeout=Slack.http_timeout)
+            resp = httpclient.post(Slack.slack_url, slack_message.to_JSON(), headers=headers,
+                                   timeout=Slack.http_timeout)
             if resp.status_code == 200:
                 commons.print_msg(Slack.clazz, method, "Successfully sent to slack. \r\n resp: {}".format(resp.text),
                                  "DEBUG")
@@ -1,19 +1,151 @@
+#!/usr/bin/python
+# logger.py
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+
+
+class LogMessage:
+    """A message that is only turned into a string when a handler needs it.
+
+    With args, message is a str.format template, e.g. LogMessage('Story list: {}', (story_list,)).
+    """
+    __slots__ = ('message', 'args', 'text')
+
+    def __init__(self, message, args=()):
+        self.message = message
+        self.args = args
+        self.text = None
+
+    def __str__(self):
+        # the console and the log file share one rendering
+        if self.text is None:
+            self.text = str(self.message).format(*self.args) if self.args else '{!s:s}'.format(self.message)
+        return self.text
+
+
+class TextFormatter(logging.Formatter):
+    level_names = {logging.WARNING: 'WARN'}
+
+    def format(self, record):
+        log_level = '[' + TextFormatter.level_names.get(record.levelno, record.levelname) + ']'
+        return '{:7s} {:11s}  {:35s} {!s:s}'.format(log_level, getattr(record, 'class_name', record.name),
+                                                    getattr(record, 'method', record.funcName), record.getMessage())
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        return json.dumps({'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+                           'level': TextFormatter.level_names.get(record.levelno, record.levelname),
+                           'class': getattr(record, 'class_name', record.name),
+                           'method': getattr(record, 'method', record.funcName),
+                           'thread': record.threadName,
+                           'message': record.getMessage()})
+
+
+class ConsoleHandler(logging.Handler):
+    # sys.stdout is looked up for every message so redirected output is honored
+
+    def emit(self, record):
+        log_message = self.format(record)
+        try:
+            print(log_message)
+        except:
+            print(log_message.encode('utf-8'))
+
+
 class Logger:
+    """The flow logger: console output plus a rotating log file written by a background thread.
+
+    Messages below the configured level are dropped before they are formatted.  Records bound for the log file
+    go through a queue to a QueueListener thread, so the rotation and file writes stay off the threads doing the
+    work.  Configured from the [logging] section of settings.ini once BuildConfig is loaded and with the defaults
+    before that.
+    """
+    name = 'flow'
+    levels = {'DEBUG': logging.DEBUG, 'INFO': logging.INFO, 'WARN': logging.WARNING, 'WARNING': logging.WARNING,
+              'ERROR': logging.ERROR}
+    default_level = 'DEBUG'
+    default_file = '.flow.log.txt'
+    default_max_size_mb = 10
+    default_backup_count = 3
+
+    logger = None
+    listener = None
+    lock = threading.Lock()
+
+    @staticmethod
+    def get():
+        if Logger.logger is None:
+            Logger.configure()
+        return Logger.logger
+
+    @staticmethod
+    def configure(settings=None):
+        # imported here, commons imports this module
+        import flow.utils.commons as commons
+
+        level = commons.get_setting(settings, 'logging', 'level', Logger.default_level).strip().upper()
+        log_file = commons.get_setting(settings, 'logging', 'file', Logger.default_file).strip()
+        log_format = commons.get_setting(settings, 'logging', 'format', 'text').strip().lower()
+        max_size_mb = commons.get_int_setting(settings, 'logging', 'max_size_mb', Logger.default_max_size_mb)
+        backup_count = commons.get_int_setting(settings, 'logging', 'backup_count', Logger.default_backup_count)
+
+        with Logger.lock:
+            Logger._stop_listener()
+
+            logger = logging.getLogger(Logger.name)
+            logger.propagate = False
+            logger.setLevel(Logger.levels.get(level, logging.DEBUG))
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+
+            console_handler = ConsoleHandler()
+            console_handler.setFormatter(TextFormatter())
+            logger.addHandler(console_handler)
+
+            if log_file:
+                file_handler = logging.handlers.RotatingFileHandler(os.path.expanduser(log_file),
+                                                                    maxBytes=max_size_mb * 1024 * 1024,
+                                                                    backupCount=backup_count, encoding='utf-8',
+                                                                    delay=True)
+                file_handler.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+
+                records = queue.Queue()
+                logger.addHandler(logging.handlers.QueueHandler(records))
+                Logger.listener = logging.handlers.QueueListener(records, file_handler)
+                Logger.listener.start()
+
+            Logger.logger = logger
+
+    @staticmethod
+    def _stop_listener():
+        if Logger.listener is not None:
+            # writes out whatever is still queued and closes the file
+            Logger.listener.stop()
+            for handler in Logger.listener.handlers:
+                handler.close()
+            Logger.listener = None
 
-    instance = None
+    @staticmethod
+    def shutdown():
+        with Logger.lock:
+            Logger._stop_listener()
 
-    class __Logger:
-        log_file = None
+    @staticmethod
+    def log(level, class_name, method, message, args=()):
+        logger = Logger.get()
+        log_level = Logger.levels.get(level.upper(), logging.INFO)
 
-        def __init__(self, message):
-            self.log_file = open(".flow.log.txt", "a")
-            self.log_file.write('\r\n' + message)
+        if logger.isEnabledFor(log_level):
+            logger.log(log_level, LogMessage(message, args), extra={'class_name': class_name, 'method': method})
 
-    def __init__(self, message):
-        if not Logger.instance:
-            Logger.instance = Logger.__Logger(message)
-        else:
-            Logger.instance.log_file.write('\r\n' + message)
 
-    def __getattr__(self, name):
-        return getattr(self.instance, name)
+atexit.register(Logger.shutdown)
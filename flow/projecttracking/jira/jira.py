@@ -7,6 +7,7 @@ from flow.buildconfig import BuildConfig
 from flow.projecttracking.project_tracking_abc import Project_Tracking
 
 import flow.utils.commons as commons
+import flow.utils.httpclient as httpclient
 from flow.projecttracking.story import Story
 from flow.utils.commons import Object
 
@@ -19,6 +20,9 @@ class Jira(Project_Tracking):
     jira_url = None
     config = BuildConfig
     http_timeout = 30
+    search_batch_size = 50
+    search_page_size = 100
+    search_fields = ['summary', 'labels', 'fixVersions', 'issuetype']
 
     def __init__(self, config_override=None):
         method = '__init__'
@@ -63,18 +67,99 @@ class Jira(Project_Tracking):
         method = 'get_details_for_all_stories'
         commons.print_msg(Jira.clazz, method, 'begin')
 
-        story_details = []
+        found_stories = self._search_story_details(story_list)
 
-        for i, story_id in enumerate(story_list):
-            story_detail = self._retrieve_story_detail(story_id)
+        missing_story_ids = [story_id for story_id in story_list if story_id.upper() not in found_stories]
+        if missing_story_ids:
+            commons.print_msg(Jira.clazz, method, "Search did not return {}.  Retrieving them individually.".format(
+                missing_story_ids))
 
-            if story_detail is not None:
-                story_details.append(story_detail)
+            max_workers = commons.get_int_setting(self.config.settings, 'project', 'max_concurrent_requests', 8)
+            retrieved_stories = commons.map_concurrently(self._retrieve_story_detail, missing_story_ids, max_workers)
+
+            for story_id, story in zip(missing_story_ids, retrieved_stories):
+                found_stories[story_id.upper()] = story
+
+        story_details = [found_stories.get(story_id.upper()) for story_id in story_list]
+        story_details = [story_detail for story_detail in story_details if story_detail is not None]
 
         commons.print_msg(Jira.clazz, method, story_details)
         commons.print_msg(Jira.clazz, method, 'end')
         return story_details
 
+    def _search_story_details(self, story_list):
+        method = '_search_story_details'
+        commons.print_msg(Jira.clazz, method, 'begin')
+
+        jira_search_url = Jira.jira_url + '/rest/api/2/search'
+
+        headers = {'Content-type': 'application/json', 'Accept': 'application/json'}
+
+        found_stories = {}
+
+        story_ids = []
+        for story_id in story_list:
+            if story_id.upper() not in story_ids:
+                story_ids.append(story_id.upper())
+
+        for batch_start in range(0, len(story_ids), Jira.search_batch_size):
+            batch = story_ids[batch_start:batch_start + Jira.search_batch_size]
+            start_at = 0
+
+            while True:
+                params = {'jql': 'key in ({})'.format(','.join(batch)),
+                          'fields': ','.join(Jira.search_fields),
+                          'startAt': start_at,
+                          'maxResults': Jira.search_page_size}
+
+                commons.print_msg(Jira.clazz, method, "{url} {jql} startAt={start}".format(url=jira_search_url,
+                                                                                          jql=params['jql'],
+                                                                                          start=start_at))
+
+                try:
+                    resp = httpclient.get(jira_search_url, params=params, auth=(os.getenv('JIRA_USER'),
+                                                                                os.getenv('JIRA_PWD')),
+                                          headers=headers, timeout=self.http_timeout)
+                except Exception as e:
+                    # anything not found here gets retrieved one at a time by the caller
+                    commons.print_msg(Jira.clazz, method, "Failed searching story details from call to {}: "
+                                                          "{}".format(jira_search_url, e), 'WARN')
+                    break
+
+                if resp.status_code != 200:
+                    # jira rejects the whole query if any key in it does not exist
+                    commons.print_msg(Jira.clazz, method, "Failed searching story details from call to {url}. \r\n "
+                                                          "Response: {response}".format(url=jira_search_url,
+                                                                                        response=resp.text), 'WARN')
+                    break
+
+                json_data = json.loads(resp.text)
+                issues = json_data.get('issues', [])
+
+                for issue in issues:
+                    found_stories[issue.get('key').upper()] = self._build_story(issue)
+
+                start_at += len(issues)
+                if not issues or start_at >= json_data.get('total', 0):
+                    break
+
+        commons.print_msg(Jira.clazz, method, 'end')
+        return found_stories
+
+    def _build_story(self, json_data):
+        story = Story()
+        story.id = json_data.get('id')
+        story.description = json_data['fields']['summary'].lower()
+        story.url = Jira.jira_url + '/browse/' + json_data.get('key')
+        story.name = json_data.get('key')
+        story.story_type = json_data['fields']['issuetype']['name'].lower()
+        story.labels = json_data['fields']['labels']
+        story.versions = []
+        for version in json_data['fields']['fixVersions']:
+            story.versions.append(version["name"])
+
+        return story
+
     def _retrieve_story_detail(self, story_id):
         method = '_retrieve_story_detail'
         commons.print_msg(Jira.clazz, method, 'begin')
@@ -87,8 +172,8 @@ class Jira(Project_Tracking):
 
         try:
             # TODO: Remove auth from below...
-            resp = requests.get(jira_story_details_url, auth=(os.getenv('JIRA_USER'), os.getenv('JIRA_PWD')), headers=headers,
-                                timeout=self.http_timeout)
+            resp = httpclient.get(jira_story_details_url, auth=(os.getenv('JIRA_USER'), os.getenv('JIRA_PWD')), headers=headers,
+                                  timeout=self.http_timeout)
         except requests.ConnectionError:
             commons.print_msg(Jira.clazz, method, 'Request to Jira timed out.', 'ERROR')
             exit(1)
@@ -108,16 +193,7 @@ class Jira(Project_Tracking):
             commons.print_msg(Jira.clazz, method, json_data)
             commons.print_msg(Jira.clazz, method, resp.text)
 
-            story = Story()
-            story.id = json_data.get('id')
-            story.description = json_data['fields']['summary'].lower()
-            story.url = Jira.jira_url + '/browse/' + json_data.get('key')
-            story.name = json_data.get('key')
-            story.story_type = json_data['fields']['issuetype']['name'].lower()
-            story.labels = json_data['fields']['labels']
-            story.versions = []
-            for version in json_data['fields']['fixVersions']:
-                story.versions.append(version["name"])
+            story = self._build_story(json_data)
 
         else:
             commons.print_msg(Jira.clazz, method, "Failed retrieving story detail from call to {url}. \r\n "
@@ -162,7 +238,7 @@ class Jira(Project_Tracking):
 
         try:
             # TODO: Remove auth from below...
-            resp = requests.post(jira_url, new_version.to_JSON(), headers=headers, auth=(os.getenv('JIRA_USER'), os.getenv('JIRA_PWD')), timeout=self.http_timeout)
+            resp = httpclient.post(jira_url, new_version.to_JSON(), headers=headers, auth=(os.getenv('JIRA_USER'), os.getenv('JIRA_PWD')), timeout=self.http_timeout)
 
             if resp.status_code != 201:
                 commons.print_msg(Jira.clazz, method, "Unable to add version {version} \r\n "
@@ -207,7 +283,7 @@ class Jira(Project_Tracking):
 
         try:
             # TODO: Remove auth from below...
-            resp = requests.put(jira_url, add_version_story.to_JSON(), auth=(os.getenv('JIRA_USER'), os.getenv('JIRA_PWD')), headers=headers, timeout=self.http_timeout)
+            resp = httpclient.put(jira_url, add_version_story.to_JSON(), auth=(os.getenv('JIRA_USER'), os.getenv('JIRA_PWD')), headers=headers, timeout=self.http_timeout)
 
             if resp.status_code != 204:
                 commons.print_msg(Jira.clazz, method, "Unable to tag story {story} with label {lbl} \r\n "
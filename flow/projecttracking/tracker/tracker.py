@@ -6,6 +6,7 @@ from flow.buildconfig import BuildConfig
 from flow.projecttracking.project_tracking_abc import Project_Tracking
 
 import flow.utils.commons as commons
+import flow.utils.httpclient as httpclient
 from flow.projecttracking.story import Story
 from flow.utils.commons import Object
 
@@ -60,13 +61,10 @@ class Tracker(Project_Tracking):
         method = 'get_details_for_all_stories'
         commons.print_msg(Tracker.clazz, method, 'begin')
 
-        story_details = []
+        max_workers = commons.get_int_setting(self.config.settings, 'project', 'max_concurrent_requests', 8)
 
-        for i, story_id in enumerate(story_list):
-            story_detail = self._retrieve_story_detail(story_id)
-
-            if story_detail is not None:
-                story_details.append(story_detail)
+        story_details = commons.map_concurrently(self._retrieve_story_detail, story_list, max_workers)
+        story_details = [story_detail for story_detail in story_details if story_detail is not None]
 
         commons.print_msg(Tracker.clazz, method, story_details)
         commons.print_msg(Tracker.clazz, method, 'end')
@@ -83,7 +81,7 @@ class Tracker(Project_Tracking):
         commons.print_msg(Tracker.clazz, method, tracker_story_details_url)
 
         try:
-            resp = requests.get(tracker_story_details_url, headers=headers, timeout=self.http_timeout)
+            resp = httpclient.get(tracker_story_details_url, headers=headers, timeout=self.http_timeout)
         except requests.ConnectionError:
             commons.print_msg(Tracker.clazz, method, 'Request to Tracker timed out.', 'ERROR')
             exit(1)
@@ -145,7 +143,7 @@ class Tracker(Project_Tracking):
         commons.print_msg(Tracker.clazz, method, label_to_post.to_JSON())
 
         try:
-            resp = requests.post(tracker_url, label_to_post.to_JSON(), headers=headers, timeout=self.http_timeout)
+            resp = httpclient.post(tracker_url, label_to_post.to_JSON(), headers=headers, timeout=self.http_timeout)
 
             if resp.status_code != 200:
                 commons.print_msg(Tracker.clazz, method, "Unable to tag story {story} with label {lbl} \r\n "
@@ -1,6 +1,6 @@
 import json
-import requests
 import flow.utils.commons as commons
+import flow.utils.httpclient as httpclient
 from flow.buildconfig import BuildConfig
 from flow.utils.commons import Object
 import os
@@ -59,7 +59,7 @@ class ServiceNow():
         headers = {'Content-type': 'application/json', 'Accept': 'application/json'}
 
         print(servicenow_create_chg_url)
-        resp = requests.post(servicenow_create_chg_url, cr.to_JSON(), headers=headers, auth=(os.getenv('SERVICENOW_USER'), os.getenv('SERVICENOW_PWD')),)
+        resp = httpclient.post(servicenow_create_chg_url, cr.to_JSON(), headers=headers, auth=(os.getenv('SERVICENOW_USER'), os.getenv('SERVICENOW_PWD')),)
         resp_obj = json.loads(resp.text)
         print(resp)
         print(resp.text)
@@ -1,11 +1,14 @@
 #!/usr/bin/python
 #commons.py
 
+import configparser
+import hashlib
 import json
 import os
 import re
 import subprocess
 import sys
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 from enum import Enum
 
 from pydispatch import dispatcher
@@ -77,26 +80,22 @@ def extract_story_id_from_commit_messages(commit_messages, numeric_only=True):
                         if story not in story_list:
                             story_list.append(story)
 
-    print_msg(clazz, method, "Story list: {}".format(story_list))
+    print_msg(clazz, method, "Story list: {}", 'DEBUG', story_list)
     return story_list
 
 
-def print_msg(class_name, method, message, level='DEBUG'):
+def print_msg(class_name, method, message, level='DEBUG', *args):
+    # with args, message is a str.format template that is only filled in when the level is logged, e.g.
+    # print_msg(clazz, method, 'Story list: {}', 'DEBUG', story_list)
     if level.lower() != 'error' and Commons.quiet:
         return
 
-    log_level = '[' + level + ']'
-    log_message = '{:7s} {:11s}  {:35s} {!s:s}'.format(log_level, class_name, method, message)
-    try:
-        print(log_message)
-        Logger(log_message)
-    except:
-        print(log_message.encode('utf-8'))
+    Logger.log(level, class_name, method, message, args)
 
     if level == 'ERROR':
         SIGNAL = 'publish-error-signal'
         sender = {}
-        new_message = ''.join(str(v) for v in message)
+        new_message = ''.join(str(v) for v in (message.format(*args) if args else message))
         dispatcher.send(signal=SIGNAL, sender=sender, message=new_message, class_name=class_name, method_name=method)
 
 
@@ -114,6 +113,41 @@ def get_files_of_type_from_directory(file_type, directory):
     return out
 
 
+def is_safe_tar_member(member, destination):
+    # destination must be a realpath.  rejects devices and members or link targets that resolve outside of it.
+    def _inside(path):
+        return os.path.realpath(path) == destination or \
+               os.path.realpath(path).startswith(destination + os.sep)
+
+    if member.isdev() or os.path.isabs(member.name) or not _inside(os.path.join(destination, member.name)):
+        return False
+
+    if member.issym() or member.islnk():
+        if os.path.isabs(member.linkname):
+            return False
+        link_base = os.path.dirname(member.name) if member.issym() else ''
+        if not _inside(os.path.join(destination, link_base, member.linkname)):
+            return False
+
+    return True
+
+
+def compute_checksums(file_handle, chunk_size=1024 * 1024):
+    # the sha1, sha256 and md5 artifactory checks uploads against.  leaves file_handle back at the start.
+    sha1 = hashlib.sha1()
+    sha256 = hashlib.sha256()
+    md5 = hashlib.md5()  # nosec
+
+    for chunk in iter(lambda: file_handle.read(chunk_size), b''):
+        sha1.update(chunk)
+        sha256.update(chunk)
+        md5.update(chunk)
+
+    file_handle.seek(0)
+
+    return {'sha1': sha1.hexdigest(), 'sha256': sha256.hexdigest(), 'md5': md5.hexdigest()}
+
+
 # TODO convert all popens that need decoding to call this
 def execute_command(cmd):
     process = subprocess.Popen(cmd, shell=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
@@ -123,6 +157,67 @@ def execute_command(cmd):
     return output
 
 
+def get_setting(settings, section, option, default=None):
+    # settings.ini is optional in some contexts (and mocked in tests), so only trust real string values
+    try:
+        if settings is not None and settings.has_option(section, option):
+            value = settings.get(section, option)
+            if isinstance(value, str):
+                return value
+    except (configparser.NoSectionError, configparser.NoOptionError, AttributeError):
+        pass
+    return default
+
+
+def get_int_setting(settings, section, option, default):
+    method = 'get_int_setting'
+
+    value = get_setting(settings, section, option)
+    if value is None or value.strip() == '':
+        return default
+
+    try:
+        return int(value)
+    except ValueError:
+        print_msg(clazz, method, 'Invalid value \'{}\' for {} in [{}] of settings.ini.  Using default of '
+                                 '{}'.format(value, option, section, default), 'WARN')
+        return default
+
+
+def get_bool_setting(settings, section, option, default=False):
+    value = get_setting(settings, section, option)
+    if value is None or value.strip() == '':
+        return default
+
+    return value.strip().lower() in ('true', 'yes', 'on', '1')
+
+
+def map_concurrently(func, items, max_workers, fail_fast=False):
+    # results come back in the same order as items.  exceptions (including exit() calls) raised by func
+    # are re-raised in the calling thread so callers keep the same failure behavior as a serial loop.
+    # with fail_fast, the first failure cancels every item that has not started yet.
+    items = list(items)
+    if max_workers is None or max_workers < 1:
+        max_workers = 1
+
+    if max_workers == 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        futures = [executor.submit(func, item) for item in items]
+
+        if fail_fast:
+            done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+            failed = [future for future in futures if future in done and future.exception() is not None]
+            if failed:
+                for future in not_done:
+                    future.cancel()
+                wait([future for future in not_done if not future.cancelled()])
+                raise failed[0].exception()
+
+        return [future.result() for future in futures]
+
+
 def verify_version(config):
     method = 'verify_version'
 
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+# httpclient.py
+#
+# Shared http layer for every integration.  Keeps one pooled requests.Session per host so connections (and TLS
+# handshakes) are reused for the whole flow run, retries 429/5xx responses with backoff while honoring Retry-After,
+# and applies default timeouts from settings.ini when a caller does not pass one.
+
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import flow.utils.commons as commons
+from flow.buildconfig import BuildConfig
+
+clazz = 'httpclient'
+
+retry_status_codes = (429, 500, 502, 503, 504)
+
+# callables invoked as hook(method, url, status_code, elapsed_seconds) after every response
+timing_hooks = []
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _settings():
+    return BuildConfig.settings
+
+
+def _host_key(url):
+    parsed = urlparse(url)
+    return '{}://{}'.format(parsed.scheme, parsed.netloc.lower())
+
+
+def get_timeout(url):
+    """Timeout for a host, from [http_timeouts] in settings.ini, falling back to http_timeout_default_seconds."""
+    host = urlparse(url).hostname or ''
+    default_timeout = commons.get_int_setting(_settings(), 'project', 'http_timeout_default_seconds', 60)
+    return commons.get_int_setting(_settings(), 'http_timeouts', host.lower(), default_timeout)
+
+
+def _build_retry(retry=True):
+    if not retry:
+        # for bodies that can only be sent once, e.g. a generator streaming an upload
+        return Retry(total=0, raise_on_status=False)
+
+    retries = commons.get_int_setting(_settings(), 'project', 'http_retries', 3)
+    backoff_factor = commons.get_setting(_settings(), 'project', 'http_backoff_factor', '0.5')
+
+    try:
+        backoff_factor = float(backoff_factor)
+    except ValueError:
+        backoff_factor = 0.5
+
+    # status retries only apply to idempotent methods, so a POST that reached the server is never replayed
+    return Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff_factor,
+                 status_forcelist=retry_status_codes, respect_retry_after_header=True, raise_on_status=False)
+
+
+def _record_timing(response, *args, **kwargs):
+    # nothing is logged per response, a ranged download alone would add a line for every segment
+    if not timing_hooks:
+        return
+
+    request = response.request
+    elapsed = response.elapsed.total_seconds()
+
+    for hook in timing_hooks:
+        hook(request.method, request.url, response.status_code, elapsed)
+
+
+def get_session(url, retry=True):
+    """The pooled session for the host of url, created on first use.  retry=False gets one that never retries."""
+    host_key = (_host_key(url), retry)
+
+    with _sessions_lock:
+        session = _sessions.get(host_key)
+
+        if session is None:
+            pool_size = commons.get_int_setting(_settings(), 'project', 'http_pool_size', 10)
+
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=_build_retry(retry))
+
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.hooks['response'].append(_record_timing)
+
+            _sessions[host_key] = session
+
+    return session
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def request(method, url, retry=True, **kwargs):
+    if kwargs.get('timeout') is None:
+        kwargs['timeout'] = get_timeout(url)
+
+    return get_session(url, retry).request(method, url, **kwargs)
+
+
+def get(url, params=None, **kwargs):
+    return request('GET', url, params=params, **kwargs)
+
+
+def head(url, **kwargs):
+    return request('HEAD', url, **kwargs)
+
+
+def post(url, data=None, json=None, **kwargs):
+    return request('POST', url, data=data, json=json, **kwargs)
+
+
+def put(url, data=None, **kwargs):
+    return request('PUT', url, data=data, **kwargs)
+
+
+def patch(url, data=None, **kwargs):
+    return request('PATCH', url, data=data, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request('DELETE', url, **kwargs)
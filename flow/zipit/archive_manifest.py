@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# archive_manifest.py
+
+import hashlib
+import json
+import os
+import tempfile
+
+import flow.utils.commons as commons
+
+
+class ArchiveManifest:
+    """Record of what went into a reproducible zipit archive, kept next to the output.
+
+    Holds path -> size, mtime and sha256 for every file along with the options the archive was built with and
+    the checksums of the archive itself.  Files whose size and mtime are unchanged since the last run are not
+    hashed again.
+    """
+    clazz = 'ArchiveManifest'
+    hash_chunk_size = 1024 * 1024
+
+    def __init__(self, manifest_file):
+        self.manifest_file = manifest_file
+
+    def load(self):
+        method = 'load'
+
+        if not os.path.isfile(self.manifest_file):
+            return None
+
+        try:
+            with open(self.manifest_file, 'r') as manifest:
+                return json.load(manifest)
+        except (IOError, ValueError) as e:
+            commons.print_msg(ArchiveManifest.clazz, method, "Ignoring unreadable manifest {}: {}".format(
+                self.manifest_file, e), 'WARN')
+            return None
+
+    def save(self, files, options, checksums):
+        handle, temp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.manifest_file)))
+        with os.fdopen(handle, 'w') as manifest:
+            json.dump({'options': options, 'checksums': checksums, 'files': files}, manifest, indent=1,
+                      sort_keys=True)
+        os.replace(temp_file, self.manifest_file)
+
+    def _hash_file(self, path):
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as handle:
+            for chunk in iter(lambda: handle.read(ArchiveManifest.hash_chunk_size), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def scan(self, contents, previous=None):
+        previous_files = previous['files'] if previous else {}
+
+        if os.path.isdir(contents) and not os.path.islink(contents):
+            paths = []
+            for directory, directories, file_names in os.walk(contents):
+                directories.sort()
+                for entry_name in sorted(directories + file_names):
+                    paths.append(os.path.join(directory, entry_name))
+        else:
+            paths = [contents]
+
+        files = {}
+        for path in paths:
+            relative_path = os.path.relpath(path, contents)
+            stat = os.lstat(path)
+
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'executable': bool(stat.st_mode & 0o111)}
+            if os.path.islink(path):
+                entry['link'] = os.readlink(path)
+            elif os.path.isdir(path):
+                entry['size'] = 0
+                entry['directory'] = True
+            else:
+                known = previous_files.get(relative_path)
+                if known and known.get('size') == stat.st_size and known.get('mtime') == stat.st_mtime_ns:
+                    entry['sha256'] = known['sha256']
+                else:
+                    entry['sha256'] = self._hash_file(path)
+
+            files[relative_path] = entry
+
+        return files
+
+    @staticmethod
+    def archived(files, name, digests):
+        # digests maps tar member name -> size and sha256 of the bytes written into the archive under name
+        root = name.replace(os.sep, '/').lstrip('/')
+
+        for member, digest in digests.items():
+            relative_path = '.' if member == root else os.path.normpath(member[len(root) + 1:])
+            if relative_path in files:
+                files[relative_path].update(digest)
+
+        return files
+
+    @staticmethod
+    def unchanged(previous, files, options):
+        # mtimes are normalized in a reproducible archive so only content and layout matter
+        def _content(entries):
+            return {path: {key: value for key, value in entry.items() if key != 'mtime'}
+                    for path, entry in entries.items()}
+
+        return previous is not None and previous.get('options') == options and \
+            'checksums' in previous and _content(previous.get('files', {})) == _content(files)
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# parallel_compressor.py
+
+import lzma
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class ParallelCompressor:
+    """Writable file object that compresses fixed size blocks on every core.
+
+    Each block becomes an independent gzip member, xz stream or zstd frame and they are written out in order.
+    Concatenated members are a valid file for all three formats, so any standard tool can decompress the result.
+    zlib, lzma and zstandard release the GIL while compressing, which is what lets plain threads scale.
+    """
+    clazz = 'ParallelCompressor'
+
+    compressions = ['gzip', 'xz', 'zstd']
+    default_levels = {'gzip': 6, 'xz': 6, 'zstd': 3}
+    extensions = {'gzip': '.gz', 'xz': '.xz', 'zstd': '.zst'}
+
+    def __init__(self, file_obj, compression, level=None, block_size=1024 * 1024, workers=None):
+        if compression not in ParallelCompressor.compressions:
+            raise ValueError("Unsupported compression {}".format(compression))
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+
+        self.file_obj = file_obj
+        self.compression = compression
+        self.level = ParallelCompressor.default_levels[compression] if level is None else level
+        self.block_size = block_size
+        self.workers = workers or os.cpu_count() or 1
+
+        self.buffer = bytearray()
+        self.pending = []
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.closed = False
+
+    def _compress_block(self, block):
+        if self.compression == 'gzip':
+            # wbits 31 writes a gzip header and trailer, with a zero mtime
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+            return compressor.compress(block) + compressor.flush()
+        if self.compression == 'xz':
+            return lzma.compress(block, preset=self.level)
+        return zstandard.ZstdCompressor(level=self.level).compress(block)
+
+    def _submit(self, block):
+        self.pending.append(self.executor.submit(self._compress_block, block))
+
+        # keep a bounded number of blocks in memory, writing finished ones in order
+        while len(self.pending) > self.workers * 2:
+            self.file_obj.write(self.pending.pop(0).result())
+
+    def write(self, data):
+        self.buffer += data
+
+        while len(self.buffer) >= self.block_size:
+            self._submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            if self.buffer or not self.pending:
+                self._submit(bytes(self.buffer))
+                self.buffer = bytearray()
+
+            for future in self.pending:
+                self.file_obj.write(future.result())
+            self.pending = []
+        finally:
+            self.executor.shutdown(wait=True)
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            for future in self.pending:
+                future.cancel()
+            self.executor.shutdown(wait=True)
+            self.closed = True
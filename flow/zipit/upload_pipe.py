@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# upload_pipe.py
+
+import hashlib
+import queue
+
+
+class UploadPipe:
+    """Bounded in-memory pipe from a writer thread to a chunked http upload.
+
+    The writer side is a file object (tarfile or ParallelCompressor write into it) and the reader side is an
+    iterable of chunks that requests sends with chunked transfer encoding.  Once max_chunks are waiting the writer
+    blocks, so memory stays bounded however large the archive gets.  Checksums are computed as the bytes go by.
+    """
+    clazz = 'UploadPipe'
+
+    def __init__(self, chunk_size=1024 * 1024, max_chunks=16):
+        self.chunk_size = chunk_size
+        self.chunks = queue.Queue(maxsize=max_chunks)
+        self.buffer = bytearray()
+        self.size = 0
+        self.error = None
+        self.aborted = False
+        self.sha1 = hashlib.sha1()
+        self.sha256 = hashlib.sha256()
+        self.md5 = hashlib.md5()  # nosec
+
+    def _put(self, chunk):
+        self.sha1.update(chunk)
+        self.sha256.update(chunk)
+        self.md5.update(chunk)
+        self.size += len(chunk)
+
+        while True:
+            if self.aborted:
+                raise BrokenPipeError("Upload stopped reading from the pipe")
+            try:
+                self.chunks.put(chunk, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def write(self, data):
+        self.buffer += data
+
+        while len(self.buffer) >= self.chunk_size:
+            self._put(bytes(self.buffer[:self.chunk_size]))
+            del self.buffer[:self.chunk_size]
+
+        return len(data)
+
+    def close(self):
+        if self.buffer:
+            self._put(bytes(self.buffer))
+            self.buffer = bytearray()
+        self._put_end()
+
+    def fail(self, error):
+        # called by the writer, makes the upload raise instead of finishing with a truncated body
+        self.error = error
+        self._put_end()
+
+    def abort(self):
+        # called by the reader when the upload ended early so a blocked writer can give up
+        self.aborted = True
+
+    def _put_end(self):
+        while not self.aborted:
+            try:
+                self.chunks.put(None, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def __iter__(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                if self.error is not None:
+                    raise IOError("Failed writing the upload stream: {}".format(self.error))
+                return
+            yield chunk
+
+    def checksums(self):
+        return {'sha1': self.sha1.hexdigest(), 'sha256': self.sha256.hexdigest(), 'md5': self.md5.hexdigest()}
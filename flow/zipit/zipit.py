@@ -1,39 +1,79 @@
 #!/usr/bin/python
 # zipit.py
 
+import hashlib
 import tarfile
+import threading
 
 import flow.utils.commons as commons
 
 from flow.artifactstorage.artifactory.artifactory import Artifactory
+from flow.buildconfig import BuildConfig
+from flow.zipit.archive_manifest import ArchiveManifest
+from flow.zipit.parallel_compressor import ParallelCompressor
+from flow.zipit.upload_pipe import UploadPipe
+
+
+class _DigestReader:
+    # passes reads through while hashing them, so the digest is of exactly the bytes tarfile archived
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.sha256.update(data)
+        return data
+
+
+class _DigestTarFile(tarfile.TarFile):
+    # digests maps member name -> size and sha256 of every regular file added
+    digests = None
+
+    def addfile(self, tarinfo, fileobj=None):
+        if fileobj is None or self.digests is None:
+            return super().addfile(tarinfo, fileobj)
+
+        reader = _DigestReader(fileobj)
+        super().addfile(tarinfo, reader)
+        self.digests[tarinfo.name] = {'size': tarinfo.size, 'sha256': reader.sha256.hexdigest()}
 
 
 class ZipIt:
     clazz = 'ZipIt'
+    config = BuildConfig
+    reproducible = False
 
-    def __init__(self, mode, name, contents):
+    def __init__(self, mode, name, contents, compression=None, level=None, stream=False, reproducible=False):
         method = '__init__'
         commons.print_msg(ZipIt.clazz, method, 'begin')
 
         ZipIt.file_name = name
+        self.reproducible = reproducible
 
-        if mode == 'artifactory':
+        if mode == 'artifactory' and reproducible:
+            ZipIt.zip_contents = contents
+            self._ship_it_if_changed(name, contents, compression, level, stream)
+        elif mode == 'artifactory' and stream:
+            ZipIt.zip_contents = contents
+            self._stream_it_artifactory(name, contents, compression, level)
+        elif mode == 'artifactory':
             ZipIt.zip_contents = contents
-            self._zip_it(name, contents)
+            self._zip_it(name, contents, compression, level)
             self._ship_it_artifactory(name)
 
         commons.print_msg(ZipIt.clazz, method, 'end')
 
-    def _zip_it(self, name, contents):
+    def _zip_it(self, name, contents, compression=None, level=None, digests=None):
         method = '_zip_it'
         commons.print_msg(ZipIt.clazz, method, 'begin')
 
         file_with_path = name.split('/')
-        print('yoyoyo')
-        print(name.split('/'))
+
         try:
-            with tarfile.open(file_with_path[-1], 'w') as tar:
-                tar.add(contents, name)
+            with open(file_with_path[-1], 'wb') as output:
+                self._write_tar(output, name, contents, compression, level, digests)
         except FileNotFoundError as e:
             commons.print_msg(Artifactory.clazz, method, "Could not locate files to zip. {}".format(e), 'ERROR')
             exit(1)
@@ -43,13 +83,127 @@ class ZipIt:
 
         commons.print_msg(ZipIt.clazz, method, 'end')
 
+    def _write_tar(self, output, name, contents, compression=None, level=None, digests=None):
+        method = '_write_tar'
+
+        if compression is None or compression == 'none':
+            self._add_to_tar(output, name, contents, digests)
+            return
+
+        block_size = commons.get_int_setting(self.config.settings, 'zipit', 'compression_block_size_kb', 1024) * 1024
+        commons.print_msg(ZipIt.clazz, method, "Compressing with {} using {} kb blocks".format(compression,
+                                                                                             block_size // 1024))
+
+        # the tar stream goes straight into the compressor, no uncompressed copy is written
+        with ParallelCompressor(output, compression, level, block_size) as compressor:
+            self._add_to_tar(compressor, name, contents, digests)
+
+    def _add_to_tar(self, fileobj, name, contents, digests=None):
+        tar_filter = ZipIt._normalize_tar_info if self.reproducible else None
+
+        with _DigestTarFile.open(fileobj=fileobj, mode='w|') as tar:
+            tar.digests = digests
+            tar.add(contents, name, filter=tar_filter)
+
+    @staticmethod
+    def _normalize_tar_info(tar_info):
+        # tarfile already adds directory entries in sorted order, so this is all it takes for identical bytes
+        tar_info.mtime = 0
+        tar_info.uid = 0
+        tar_info.gid = 0
+        tar_info.uname = ''
+        tar_info.gname = ''
+        tar_info.mode = 0o755 if tar_info.isdir() or tar_info.mode & 0o111 else 0o644
+        return tar_info
+
+    def _ship_it_if_changed(self, name, contents, compression=None, level=None, stream=False):
+        method = '_ship_it_if_changed'
+        commons.print_msg(ZipIt.clazz, method, 'begin')
+
+        file_with_path = name.split('/')
+
+        manifest = ArchiveManifest(file_with_path[-1] + '.manifest.json')
+        previous = manifest.load()
+
+        try:
+            files = manifest.scan(contents, previous)
+        except OSError as e:
+            commons.print_msg(ZipIt.clazz, method, "Could not locate files to zip. {}".format(e), 'ERROR')
+            exit(1)
+
+        options = {'name': name, 'compression': compression or 'none', 'level': level,
+                   'block_size_kb': commons.get_int_setting(self.config.settings, 'zipit', 'compression_block_size_kb',
+                                                            1024)}
+
+        if ArchiveManifest.unchanged(previous, files, options):
+            checksums = previous['checksums']
+            commons.print_msg(ZipIt.clazz, method, "Contents of {} are unchanged since the last archive".format(
+                contents))
+
+            # a reproducible archive of the same files has the same bytes, so artifactory may already hold it
+            if Artifactory().deploy_by_checksum(name, checksums):
+                commons.print_msg(ZipIt.clazz, method, "Skipped archiving and upload of {}.  Unchanged artifact "
+                                                       "sha1 {}".format(name, checksums['sha1']))
+                commons.print_msg(ZipIt.clazz, method, 'end')
+                return
+
+            commons.print_msg(ZipIt.clazz, method, "Artifactory no longer holds the archive, rebuilding", 'WARN')
+
+        # files can change between the scan and the archive, so the manifest records what was actually archived
+        digests = {}
+        if stream:
+            checksums = self._stream_it_artifactory(name, contents, compression, level, digests)
+        else:
+            self._zip_it(name, contents, compression, level, digests)
+            checksums = self._ship_it_artifactory(name)
+
+        manifest.save(ArchiveManifest.archived(files, name, digests), options, checksums)
+
+        commons.print_msg(ZipIt.clazz, method, "Published {} with sha1 {}".format(name, checksums['sha1']))
+        commons.print_msg(ZipIt.clazz, method, 'end')
+
+    def _stream_it_artifactory(self, name, contents, compression=None, level=None, digests=None):
+        method = '_stream_it_artifactory'
+        commons.print_msg(ZipIt.clazz, method, 'begin')
+
+        buffer_mb = commons.get_int_setting(self.config.settings, 'zipit', 'stream_buffer_mb', 16)
+        pipe = UploadPipe(max_chunks=max(buffer_mb, 1))
+
+        def _pack():
+            try:
+                self._write_tar(pipe, name, contents, compression, level, digests)
+                pipe.close()
+            except BaseException as e:
+                pipe.fail(e)
+
+        # packing runs in its own thread and the upload reads from the pipe as it fills
+        packer = threading.Thread(target=_pack, name='zipit-pack', daemon=True)
+        packer.start()
+
+        try:
+            Artifactory().publish_stream(pipe, name, pipe.checksums)
+        finally:
+            pipe.abort()
+            packer.join()
+
+        if pipe.error is not None:
+            commons.print_msg(ZipIt.clazz, method, "Failure during zip process:  {}".format(pipe.error), 'ERROR')
+            exit(1)
+
+        commons.print_msg(ZipIt.clazz, method, "Streamed {} bytes".format(pipe.size))
+        commons.print_msg(ZipIt.clazz, method, 'end')
+        return pipe.checksums()
+
     def _ship_it_artifactory(self, name):
         method = '_ship_it_artifactory'
         commons.print_msg(ZipIt.clazz, method, 'begin')
 
         file_with_path = name.split('/')
 
-        ar = Artifactory()
-        ar.publish(file_with_path[-1], name)
+        Artifactory().publish(file_with_path[-1], name)
+
+        with open(file_with_path[-1], 'rb') as archive:
+            checksums = commons.compute_checksums(archive)
 
         commons.print_msg(ZipIt.clazz, method, 'end')
+        return checksums
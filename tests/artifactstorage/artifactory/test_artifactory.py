@@ -1,4 +1,9 @@
+import configparser
+import hashlib
+import io
 import os
+import tarfile
+import zipfile
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
@@ -7,7 +12,8 @@ import responses
 from flow.buildconfig import BuildConfig
 from requests.exceptions import HTTPError
 
-from flow.artifactstorage.artifactory.artifactory import Artifactory, ArtifactException
+from flow.artifactstorage.artifactory.artifact_cache import ArtifactCache
+from flow.artifactstorage.artifactory.artifactory import Artifactory, ArtifactDownloadException, ArtifactException
 
 mock_build_config_dict = {
     "projectInfo": {
@@ -169,6 +175,32 @@ def test_get_urls_of_artifacts():
     assert urls == ["https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject.bob", "https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject.vcl"]
 
 
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_get_urls_of_artifacts_lists_folder_once():
+    _b = MagicMock(BuildConfig)
+    _b.build_env_info = mock_build_config_dict['environments']['unittest']
+    _b.json_config = mock_build_config_dict
+    _b.project_name = mock_build_config_dict['projectInfo']['name']
+    _b.version_number = 'v1.0.0'
+    _b.artifact_extension = None
+    _b.artifact_extensions = ["bob", "vcl"]
+    art = Artifactory(config_override=_b)
+
+    test_url = "https://testdomain/artifactory/api/storage/release-repo/group/testproject/v1.0.0"
+
+    responses.add(responses.GET,
+                  test_url,
+                  body=response_body_artifactory,
+                  status=200,
+                  content_type="application/json")
+
+    art.get_urls_of_artifacts()
+    art.get_artifact_url()
+
+    assert len(responses.calls) == 1
+
+
 # noinspection PyUnresolvedReferences
 @responses.activate
 def test_get_artifact_url():
@@ -244,7 +276,7 @@ def test_get_artifact_url_failure():
             art.get_artifact_url()
 
         print(str(mock_printmsg_fn.mock_calls))
-        mock_printmsg_fn.assert_called_with('Artifactory', 'get_artifact_url', 'Unable to locate artifactory path https://testdomain/artifactory/api/storage/release-repo/group/testproject/v1.0.0', 'ERROR')
+        mock_printmsg_fn.assert_called_with('Artifactory', '_get_artifact_index', 'Unable to locate artifactory path https://testdomain/artifactory/api/storage/release-repo/group/testproject/v1.0.0', 'ERROR')
 
 
 # noinspection PyUnresolvedReferences
@@ -272,7 +304,7 @@ def test_get_artifact_url_not_found():
             art.get_artifact_url()
 
         print(str(mock_printmsg_fn.mock_calls))
-        mock_printmsg_fn.assert_called_with('Artifactory', 'get_artifact_url', 'Unable to locate artifactory path https://testdomain/artifactory/api/storage/release-repo/group/testproject/v1.0.0\r\n Response: \n{\n  "errors" : [ {\n    "status" : 404,\n    "message" : "Unable to find item"\n  } ]\n}\n', 'ERROR')
+        mock_printmsg_fn.assert_called_with('Artifactory', '_get_artifact_index', 'Unable to locate artifactory path https://testdomain/artifactory/api/storage/release-repo/group/testproject/v1.0.0\r\n Response: \n{\n  "errors" : [ {\n    "status" : 404,\n    "message" : "Unable to find item"\n  } ]\n}\n', 'ERROR')
 
 
 # noinspection PyUnresolvedReferences
@@ -434,3 +466,372 @@ def test_init_missing_artifactory():
         mock_printmsg_fn.assert_called_with('Artifactory', '__init__', "The build config associated with artifactory is missing key 'artifact'", 'ERROR')
 
 
+
+
+def _artifactory_with_build_dir(monkeypatch, tmpdir, extensions):
+    for extension in extensions:
+        tmpdir.join('testproject.' + extension).write('artifact contents')
+    monkeypatch.setenv('ARTIFACT_BUILD_DIRECTORY', str(tmpdir))
+    monkeypatch.setenv('ARTIFACTORY_TOKEN', 'fake_token')
+    monkeypatch.setenv('ARTIFACTORY_USER', 'fake_user')
+
+    _b = MagicMock(BuildConfig)
+    _b.build_env_info = mock_build_config_dict['environments']['unittest']
+    _b.json_config = mock_build_config_dict
+    _b.project_name = mock_build_config_dict['projectInfo']['name']
+    _b.version_number = 'v1.0.0'
+    _b.artifact_extension = None
+    _b.artifact_extensions = extensions
+
+    Artifactory.artifactory_files = []
+    Artifactory.artifactory_extensions = []
+    return Artifactory(config_override=_b)
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_publish_build_artifact_uploads_all_artifacts(monkeypatch, tmpdir):
+    art = _artifactory_with_build_dir(monkeypatch, tmpdir, ['jar', 'zip'])
+
+    for extension in ['jar', 'zip']:
+        url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject.' + extension
+        responses.add(responses.HEAD, url, status=404)
+        responses.add(responses.DELETE, url, status=404)
+        responses.add(responses.PUT, url, status=201)
+
+    with patch('flow.utils.commons.print_msg') as mock_printmsg_fn:
+        art.publish_build_artifact()
+
+    assert len([call for call in responses.calls if call.request.method == 'PUT']) == 2
+    report = [call[1][2] for call in mock_printmsg_fn.mock_calls if call[1][1] == 'publish_build_artifact']
+    assert any(message.startswith('testproject.jar: published in') for message in report)
+    assert any(message.startswith('testproject.zip: published in') for message in report)
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_publish_build_artifact_fails_fast(monkeypatch, tmpdir):
+    art = _artifactory_with_build_dir(monkeypatch, tmpdir, ['jar'])
+
+    url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject.jar'
+    responses.add(responses.HEAD, url, status=404)
+    responses.add(responses.DELETE, url, status=404)
+    responses.add(responses.PUT, url, status=403, body='forbidden')
+
+    with patch('flow.utils.commons.print_msg') as mock_printmsg_fn:
+        with pytest.raises(SystemExit):
+            art.publish_build_artifact()
+
+    mock_printmsg_fn.assert_any_call('Artifactory', 'publish_build_artifact', 'testproject.jar: failed')
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_publish_falls_back_to_upload_when_checksum_deploy_fails(monkeypatch, tmpdir):
+    art = _artifactory_with_build_dir(monkeypatch, tmpdir, ['jar'])
+
+    url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject.jar'
+    responses.add(responses.HEAD, url, status=404)
+    responses.add(responses.DELETE, url, status=404)
+    responses.add(responses.PUT, url, status=404)
+    responses.add(responses.PUT, url, status=201)
+
+    art.publish(str(tmpdir.join('testproject.jar')), 'testproject.jar')
+
+    checksum_deploy, upload = [call.request for call in responses.calls if call.request.method == 'PUT']
+    assert checksum_deploy.headers['X-Checksum-Deploy'] == 'true'
+    assert checksum_deploy.headers['X-Checksum-Sha1'] == hashlib.sha1(b'artifact contents').hexdigest()
+    assert not checksum_deploy.body
+    assert 'X-Checksum-Deploy' not in upload.headers
+    assert upload.headers['X-Checksum-Sha256'] == hashlib.sha256(b'artifact contents').hexdigest()
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_publish_skips_identical_artifact(monkeypatch, tmpdir):
+    art = _artifactory_with_build_dir(monkeypatch, tmpdir, ['jar'])
+
+    url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject.jar'
+    responses.add(responses.HEAD, url, status=200,
+                  headers={'X-Checksum-Sha1': hashlib.sha1(b'artifact contents').hexdigest()})
+
+    art.publish(str(tmpdir.join('testproject.jar')), 'testproject.jar')
+
+    assert [call.request.method for call in responses.calls] == ['HEAD']
+
+
+def _artifactory_for_download(settings=None):
+    _b = MagicMock(BuildConfig)
+    _b.build_env_info = mock_build_config_dict['environments']['unittest']
+    _b.json_config = mock_build_config_dict
+    _b.project_name = mock_build_config_dict['projectInfo']['name']
+    _b.version_number = 'v1.0.0'
+    _b.settings = configparser.ConfigParser()
+    _b.settings.read_dict({'artifactory': settings or {}})
+    return Artifactory(config_override=_b)
+
+
+def _range_callback(content):
+    def _callback(request):
+        if 'Range' not in request.headers:
+            return 200, {}, content
+        start, end = request.headers['Range'].split('=')[1].split('-')
+        if int(start) >= len(content):
+            return 416, {}, b''
+        end = int(end) if end else len(content) - 1
+        return 206, {}, content[int(start):end + 1]
+    return _callback
+
+
+artifact_download_url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject.tar'
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_download_artifact_verifies_checksum(tmpdir):
+    content = b'x' * 5000
+    responses.add(responses.HEAD, artifact_download_url, status=200,
+                  headers={'X-Checksum-Sha1': hashlib.sha1(content).hexdigest()})
+    responses.add(responses.GET, artifact_download_url, body=content, status=200)
+
+    download_path = str(tmpdir.join('testproject.tar'))
+    _artifactory_for_download().download_artifact(artifact_download_url, download_path)
+
+    assert tmpdir.join('testproject.tar').read_binary() == content
+    assert not tmpdir.join('testproject.tar.part').exists()
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_download_artifact_checksum_mismatch(tmpdir):
+    responses.add(responses.HEAD, artifact_download_url, status=200, headers={'X-Checksum-Sha1': 'notthesha'})
+    responses.add(responses.GET, artifact_download_url, body=b'corrupt', status=200)
+
+    with patch('flow.utils.commons.print_msg'):
+        with pytest.raises(ArtifactDownloadException):
+            _artifactory_for_download().download_artifact(artifact_download_url, str(tmpdir.join('testproject.tar')))
+
+    assert not tmpdir.join('testproject.tar').exists()
+    assert not tmpdir.join('testproject.tar.part').exists()
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_download_artifact_resumes_partial_file(tmpdir):
+    content = bytes(range(256)) * 40
+    tmpdir.join('testproject.tar.part').write_binary(content[:1000])
+    responses.add(responses.HEAD, artifact_download_url, status=200,
+                  headers={'Accept-Ranges': 'bytes', 'X-Checksum-Sha1': hashlib.sha1(content).hexdigest()})
+    responses.add_callback(responses.GET, artifact_download_url, callback=_range_callback(content))
+
+    _artifactory_for_download().download_artifact(artifact_download_url, str(tmpdir.join('testproject.tar')))
+
+    assert responses.calls[1].request.headers['Range'] == 'bytes=1000-'
+    assert tmpdir.join('testproject.tar').read_binary() == content
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_download_artifact_restarts_full_size_partial_file(tmpdir):
+    content = bytes(range(256)) * 40
+    tmpdir.join('testproject.tar.part').write_binary(b'stale' * (len(content) // 5))
+    responses.add(responses.HEAD, artifact_download_url, status=200,
+                  headers={'Accept-Ranges': 'bytes', 'Content-Length': str(len(content)),
+                           'X-Checksum-Sha1': hashlib.sha1(content).hexdigest()})
+    responses.add_callback(responses.GET, artifact_download_url, callback=_range_callback(content))
+
+    _artifactory_for_download().download_artifact(artifact_download_url, str(tmpdir.join('testproject.tar')))
+
+    assert 'Range' not in responses.calls[1].request.headers
+    assert tmpdir.join('testproject.tar').read_binary() == content
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_download_artifact_restarts_when_range_not_satisfiable(tmpdir):
+    content = bytes(range(256)) * 40
+    tmpdir.join('testproject.tar.part').write_binary(b'stale' * (len(content) // 5))
+    responses.add(responses.HEAD, artifact_download_url, status=200,
+                  headers={'Accept-Ranges': 'bytes', 'X-Checksum-Sha1': hashlib.sha1(content).hexdigest()})
+    responses.add_callback(responses.GET, artifact_download_url, callback=_range_callback(content))
+
+    with patch('flow.utils.commons.print_msg'):
+        _artifactory_for_download().download_artifact(artifact_download_url, str(tmpdir.join('testproject.tar')))
+
+    assert responses.calls[1].request.headers['Range'] == 'bytes={}-'.format(len(content))
+    assert 'Range' not in responses.calls[2].request.headers
+    assert tmpdir.join('testproject.tar').read_binary() == content
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_download_artifact_in_parallel_segments(tmpdir):
+    content = bytes(range(256)) * 8192
+    responses.add(responses.HEAD, artifact_download_url, status=200,
+                  headers={'Accept-Ranges': 'bytes', 'Content-Length': str(len(content)),
+                           'X-Checksum-Sha1': hashlib.sha1(content).hexdigest()})
+    responses.add_callback(responses.GET, artifact_download_url, callback=_range_callback(content))
+
+    art = _artifactory_for_download({'parallel_download_threshold_mb': '1', 'download_segments': '4'})
+    art.download_artifact(artifact_download_url, str(tmpdir.join('testproject.tar')))
+
+    ranges = sorted(call.request.headers['Range'] for call in responses.calls[1:])
+    assert ranges == ['bytes=0-524287', 'bytes=1048576-1572863', 'bytes=1572864-2097151', 'bytes=524288-1048575']
+    assert tmpdir.join('testproject.tar').read_binary() == content
+
+
+def _tar_gz(members):
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+        for name, content in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return archive.getvalue()
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_download_and_extract_streams_tar(tmpdir):
+    content = _tar_gz([('app/index.html', b'hello'), ('app/manifest.yml', b'applications: []')])
+    responses.add(responses.GET, 'https://testdomain/artifactory/api/storage/release-repo/group/testproject/v1.0.0',
+                  body='{"children": [{"uri": "/testproject.tar.gz", "folder": false}]}', status=200)
+    responses.add(responses.GET, 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/'
+                                 'testproject.tar.gz',
+                  body=content, headers={'X-Checksum-Sha1': hashlib.sha1(content).hexdigest()}, status=200)
+
+    Artifactory.artifactory_extensions = []
+    art = _artifactory_for_download({'stream_extract': 'true'})
+    art.artifactory_extensions.append('tar.gz')
+    art.download_and_extract_artifacts_locally(str(tmpdir) + '/')
+
+    assert tmpdir.join('app', 'index.html').read_binary() == b'hello'
+    assert sorted(os.listdir(str(tmpdir))) == ['app']
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_stream_extract_rejects_unsafe_members(tmpdir):
+    content = _tar_gz([('../escaped.txt', b'nope')])
+    responses.add(responses.GET, artifact_download_url, body=content, status=200)
+
+    with patch('flow.utils.commons.print_msg'):
+        with pytest.raises(ArtifactException):
+            _artifactory_for_download()._stream_extract_artifact(artifact_download_url, str(tmpdir.mkdir('deploy')))
+
+    assert not tmpdir.join('escaped.txt').exists()
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_stream_extract_checksum_mismatch(tmpdir):
+    content = _tar_gz([('index.html', b'hello')])
+    responses.add(responses.GET, artifact_download_url, body=content, headers={'X-Checksum-Sha1': 'notthesha'},
+                  status=200)
+
+    with pytest.raises(ArtifactDownloadException):
+        _artifactory_for_download()._stream_extract_artifact(artifact_download_url, str(tmpdir))
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_download_artifact_served_from_cache(tmpdir):
+    content = b'x' * 5000
+    responses.add(responses.HEAD, artifact_download_url, status=200,
+                  headers={'X-Checksum-Sha1': hashlib.sha1(content).hexdigest()})
+    responses.add(responses.GET, artifact_download_url, body=content, status=200)
+
+    art = _artifactory_for_download({'cache_directory': str(tmpdir.join('cache'))})
+    for environment in ['dev', 'qa', 'prod']:
+        tmpdir.mkdir(environment)
+        art.download_artifact(artifact_download_url, str(tmpdir.join(environment, 'testproject.tar')))
+        assert tmpdir.join(environment, 'testproject.tar').read_binary() == content
+
+    assert len([call for call in responses.calls if call.request.method == 'GET']) == 1
+
+
+def test_artifact_cache_evicts_least_recently_used(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join('cache')), 2500)
+    contents = [letter * 1000 for letter in [b'a', b'b', b'c']]
+    sha1s = [hashlib.sha1(content).hexdigest() for content in contents]
+
+    for index, (sha1, content) in enumerate(zip(sha1s, contents)):
+        source = tmpdir.join(sha1)
+        source.write_binary(content)
+        cache.store(sha1, str(source))
+        entry = tmpdir.join('cache', 'artifactory', sha1[:2], sha1)
+        if entry.exists():
+            os.utime(str(entry), (index, index))
+        if index == 1:
+            # touching the oldest entry keeps it over the newer one
+            cache.fetch(sha1s[0], str(tmpdir.join('restored')))
+
+    assert cache.fetch(sha1s[0], str(tmpdir.join('restored')))
+    assert not cache.fetch(sha1s[1], str(tmpdir.join('restored')))
+    assert cache.fetch(sha1s[2], str(tmpdir.join('restored')))
+
+
+def test_artifact_cache_eviction_skips_entries_being_stored(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join('cache')), 500)
+    in_progress = tmpdir.join('cache', 'artifactory', 'ab').ensure(dir=True).join(ArtifactCache.temp_prefix + 'copy')
+    in_progress.write_binary(b'x' * 1000)
+
+    with patch('flow.utils.commons.print_msg'):
+        cache.evict()
+
+    assert in_progress.exists()
+
+
+def test_artifact_cache_hands_out_copies_and_drops_corrupt_entries(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join('cache')), 10000)
+    content = b'x' * 1000
+    sha1 = hashlib.sha1(content).hexdigest()
+    tmpdir.join('source').write_binary(content)
+    cache.store(sha1, str(tmpdir.join('source')))
+    entry = tmpdir.join('cache', 'artifactory', sha1[:2], sha1)
+
+    assert cache.fetch(sha1, str(tmpdir.join('deployed')))
+    tmpdir.join('deployed').write_binary(b'changed after deploy')
+    assert entry.read_binary() == content
+    assert not os.stat(str(entry)).st_mode & 0o222
+
+    os.chmod(str(entry), 0o644)
+    entry.write_binary(b'y' * 1000)
+    with patch('flow.utils.commons.print_msg'):
+        assert not cache.fetch(sha1, str(tmpdir.join('deployed')))
+    assert not entry.exists()
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_download_and_extract_artifacts_locally_in_parallel(tmpdir):
+    tar_content = _tar_gz([('app/index.html', b'hello')])
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w') as z:
+        z.writestr('docs/readme.txt', 'docs')
+    zip_content = zip_buffer.getvalue()
+
+    responses.add(responses.GET, 'https://testdomain/artifactory/api/storage/release-repo/group/testproject/v1.0.0',
+                  body='{"children": [{"uri": "/testproject.tar.gz", "folder": false}, '
+                       '{"uri": "/testproject.zip", "folder": false}]}', status=200)
+    for extension, content in [('tar.gz', tar_content), ('zip', zip_content)]:
+        url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject.' + extension
+        responses.add(responses.HEAD, url, headers={'X-Checksum-Sha1': hashlib.sha1(content).hexdigest()},
+                      status=200)
+        responses.add(responses.GET, url, body=content, status=200)
+
+    Artifactory.artifactory_extensions = []
+    art = _artifactory_for_download({'stream_extract': 'false'})
+    art.artifactory_extensions.extend(['tar.gz', 'zip'])
+
+    with patch('flow.utils.commons.print_msg') as mock_printmsg_fn:
+        art.download_and_extract_artifacts_locally(str(tmpdir) + '/')
+
+    assert tmpdir.join('app', 'index.html').read_binary() == b'hello'
+    assert tmpdir.join('docs', 'readme.txt').read() == 'docs'
+    assert sorted(os.listdir(str(tmpdir))) == ['app', 'docs']
+
+    summary = [call[0][2] for call in mock_printmsg_fn.call_args_list
+               if call[0][1] == 'download_and_extract_artifacts_locally']
+    assert [line.split(':')[0] for line in summary] == ['tar.gz', 'zip']
+    assert all('downloaded in' in line and 'extracted in' in line for line in summary)
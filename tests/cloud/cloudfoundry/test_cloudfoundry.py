@@ -1,12 +1,16 @@
+import configparser
+import json
 import os
 import subprocess
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import pytest
+import responses
 from flow.cloud.cloudfoundry.cloudfoundry import CloudFoundry
 
 from flow.buildconfig import BuildConfig
+from flow.utils.commons import Object
 
 mock_build_config_dict = {
     "projectInfo": {
@@ -193,15 +197,28 @@ def test_verify_required_attributes_missing_org(monkeypatch):
     mock_printmsg_fn.assert_called_with('CloudFoundry', '_verify_required_attributes', "The build config associated with cloudfoundry is missing key 'org'", 'ERROR')
 
 
+def _offline_inventory(apps, status_code=200):
+    # answers the app inventory calls without going to the network: one page of v2 apps, then their v3 routes
+    def _request(method, url, **kwargs):
+        response = MagicMock(status_code=status_code, text='FAKE_ERR_OUTPUT')
+        if '/v2/spaces/' in url:
+            response.json.return_value = {'next_url': None, 'resources': apps}
+        else:
+            response.json.return_value = {'resources': [], 'included': {'domains': []}, 'pagination': {}}
+        return response
+
+    CloudFoundry.cf_api_endpoint = 'api.run-np.fake.com'
+    CloudFoundry.space_guid = 'space-guid'
+    CloudFoundry.app_inventory = None
+    return patch('flow.utils.httpclient.request', side_effect=_request)
+
+
 def test_get_started_apps_already_started():
 
         with patch('flow.utils.commons.print_msg') as mock_printmsg_fn:
 
-            with patch.object(subprocess, 'Popen') as mocked_popen:
+            with _offline_inventory([_v2_app(mock_started_apps_already_started, 'guid-1', 'STARTED')]):
                 with pytest.raises(SystemExit):
-                    mocked_popen.return_value.returncode = 0
-                    mocked_popen.return_value.communicate.return_value = (mock_started_apps_already_started.encode(),
-                                                                          'FAKE_ERR_OUTPUT')
                     _b = MagicMock(BuildConfig)
                     _b.project_name = 'CI-HelloWorld'
                     _b.version_number = 'v2.9.0+1'
@@ -220,9 +237,7 @@ def test_get_started_apps_already_started():
 def test_get_started_apps_already_started_force_deploy():
 
         with patch('flow.utils.commons.print_msg') as mock_printmsg_fn:
-            with patch.object(subprocess, 'Popen') as mocked_popen:
-                mocked_popen.return_value.returncode = 0
-                mocked_popen.return_value.communicate.return_value = (mock_started_apps_already_started.encode(), 'FAKE_ERR_OUTPUT')
+            with _offline_inventory([_v2_app(mock_started_apps_already_started, 'guid-1', 'STARTED')]):
                 _b = MagicMock(BuildConfig)
                 _b.project_name = 'CI-HelloWorld'
                 _b.version_number = 'v2.9.0+1'
@@ -237,9 +252,7 @@ def test_get_started_apps_already_started_failed_cmd():
 
         with patch('flow.utils.commons.print_msg') as mock_printmsg_fn:
             with pytest.raises(SystemExit):
-                with patch.object(subprocess, 'Popen') as mocked_popen:
-                    mocked_popen.return_value.returncode = 1
-                    mocked_popen.return_value.communicate.return_value = (mock_started_apps_already_started.encode(), 'FAKE_ERR_OUTPUT')
+                with _offline_inventory([], status_code=500):
                     _b = MagicMock(BuildConfig)
                     _b.project_name = 'CI-HelloWorld'
                     _b.version_number = 'v2.9.0+1'
@@ -247,7 +260,10 @@ def test_get_started_apps_already_started_failed_cmd():
 
                     with patch.object(_cf, '_cf_logout'):
                         _cf._get_started_apps('true')
-        mock_printmsg_fn.assert_any_call('CloudFoundry', '_get_started_apps', "Failed calling cf apps | grep CI-HelloWorld*-v\\d*\\.\\d*\\.\\d* | grep started | awk '{print $1}'. Return code of 1", 'ERROR')
+        mock_printmsg_fn.assert_any_call('CloudFoundry', '_get_app_inventory', "Failed loading apps: GET "
+                                                                               "https://api.run-np.fake.com/v2/spaces/"
+                                                                               "space-guid/apps returned 500: "
+                                                                               "FAKE_ERR_OUTPUT", 'ERROR')
 
 
 
@@ -315,3 +331,287 @@ def test_find_deployable_one_file():
 
     mock_printmsg_fn.assert_any_call('Cloud', 'find_deployable', 'Looking for a jar in fake_push_dir')
 
+
+
+def _old_version(name, guid, route_guids=()):
+    app = Object()
+    app.name = name
+    app.guid = guid
+    app.routes = []
+    for route_guid in route_guids:
+        route = Object()
+        route.guid = route_guid
+        route.destinations = [{'guid': route_guid + '-dest', 'app': {'guid': guid}}]
+        app.routes.append(route)
+    return app
+
+
+def _cf_api_calls():
+    return ["{} {}".format(call.request.method, call.request.url.split('?')[0]) for call in responses.calls]
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_unmap_delete_previous_versions_unmaps_before_delete():
+    for guid in ['guid-1', 'guid-2', 'guid-3']:
+        for route_guid in [guid + '-a', guid + '-b']:
+            responses.add(responses.DELETE, 'https://api.run-np.fake.com/v3/routes/{route}/destinations/{route}-dest'
+                          .format(route=route_guid), status=204)
+        responses.add(responses.DELETE, 'https://api.run-np.fake.com/v3/apps/{}'.format(guid), status=202)
+
+    _b = MagicMock(BuildConfig)
+    _b.project_name = 'CI-HelloWorld'
+    _b.version_number = 'v2.9.0+1'
+    _cf = CloudFoundry(_b)
+    CloudFoundry.cf_api_endpoint = 'api.run-np.fake.com'
+    CloudFoundry.cf_domain = 'apps-np.fake.com'
+    CloudFoundry.stopped_apps = [_old_version('CI-HelloWorld-v2.7.0', 'guid-1', ['guid-1-a', 'guid-1-b']),
+                                 _old_version('CI-HelloWorld-v2.8.0', 'guid-2', ['guid-2-a', 'guid-2-b']),
+                                 _old_version('CI-HelloWorld-v2.9.0+1', 'guid-3', ['guid-3-a', 'guid-3-b'])]
+
+    with patch('flow.utils.commons.print_msg'):
+        _cf._unmap_delete_previous_versions()
+
+    calls = _cf_api_calls()
+    for guid in ['guid-1', 'guid-2']:
+        delete_position = calls.index('DELETE https://api.run-np.fake.com/v3/apps/{}'.format(guid))
+        for route_guid in [guid + '-a', guid + '-b']:
+            assert calls.index('DELETE https://api.run-np.fake.com/v3/routes/{route}/destinations/{route}-dest'
+                               .format(route=route_guid)) < delete_position
+
+    # the version being deployed is left alone
+    assert not [call for call in calls if 'guid-3' in call]
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_unmap_delete_previous_versions_reports_all_failures():
+    responses.add(responses.DELETE, 'https://api.run-np.fake.com/v3/routes/guid-1-a/destinations/guid-1-a-dest',
+                  status=403, body='forbidden')
+    responses.add(responses.DELETE, 'https://api.run-np.fake.com/v3/routes/guid-2-a/destinations/guid-2-a-dest',
+                  status=204)
+    responses.add(responses.DELETE, 'https://api.run-np.fake.com/v3/apps/guid-2', status=404, body='not found')
+
+    _b = MagicMock(BuildConfig)
+    _b.project_name = 'CI-HelloWorld'
+    _b.version_number = 'v2.9.0+1'
+    _cf = CloudFoundry(_b)
+    CloudFoundry.cf_api_endpoint = 'api.run-np.fake.com'
+    CloudFoundry.cf_domain = 'apps-np.fake.com'
+    CloudFoundry.stopped_apps = [_old_version('CI-HelloWorld-v2.7.0', 'guid-1', ['guid-1-a']),
+                                 _old_version('CI-HelloWorld-v2.8.0', 'guid-2', ['guid-2-a'])]
+
+    with patch('flow.utils.commons.print_msg') as mock_printmsg_fn:
+        with patch.object(_cf, '_cf_logout'):
+            with pytest.raises(SystemExit):
+                _cf._unmap_delete_previous_versions()
+
+    # a failed unmap keeps that app from being deleted, the other app is still cleaned up
+    calls = _cf_api_calls()
+    assert 'DELETE https://api.run-np.fake.com/v3/apps/guid-1' not in calls
+    assert 'DELETE https://api.run-np.fake.com/v3/apps/guid-2' in calls
+
+    errors = [call[0][2] for call in mock_printmsg_fn.call_args_list
+              if call[0][1] == '_unmap_delete_previous_versions' and call[0][3:] == ('ERROR',)]
+    assert len(errors) == 2
+    assert errors[0].startswith('Failed removing route guid-1-a from CI-HelloWorld-v2.7.0')
+    assert errors[1].startswith('Failed deleting CI-HelloWorld-v2.8.0')
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_unmap_delete_previous_versions_keeps_routes_without_domain():
+    responses.add(responses.DELETE, 'https://api.run-np.fake.com/v3/apps/guid-1', status=202)
+
+    _b = MagicMock(BuildConfig)
+    _b.project_name = 'CI-HelloWorld'
+    _b.version_number = 'v2.9.0+1'
+    _cf = CloudFoundry(_b)
+    CloudFoundry.cf_api_endpoint = 'api.run-np.fake.com'
+    CloudFoundry.cf_domain = None
+    CloudFoundry.stopped_apps = [_old_version('CI-HelloWorld-v2.7.0', 'guid-1', ['guid-1-a'])]
+
+    with patch('flow.utils.commons.print_msg'):
+        _cf._unmap_delete_previous_versions()
+
+    assert _cf_api_calls() == ['DELETE https://api.run-np.fake.com/v3/apps/guid-1']
+
+
+@pytest.mark.parametrize('settings, verify', [({}, True), ({'cloudfoundry': {'verify_ssl': 'false'}}, False)])
+def test_api_calls_verify_tls_unless_disabled(settings, verify):
+    _b = MagicMock(BuildConfig)
+    _b.settings = configparser.ConfigParser()
+    _b.settings.read_dict(settings)
+    _cf = CloudFoundry(_b)
+    CloudFoundry.cf_api_endpoint = 'api.run-np.fake.com'
+
+    with patch('flow.utils.httpclient.request') as mock_request:
+        mock_request.return_value.status_code = 202
+        mock_request.return_value.headers = {}
+        _cf._get_api().stop_app('guid-1')
+
+    assert mock_request.call_args[1]['verify'] is verify
+
+
+def test_get_space_guid_verifies_tls():
+    _b = MagicMock(BuildConfig)
+    _b.settings = configparser.ConfigParser()
+    _cf = CloudFoundry(_b)
+    CloudFoundry.cf_api_endpoint = 'api.run-np.fake.com'
+    CloudFoundry.cf_space = 'development'
+    CloudFoundry.space_guid = None
+
+    with patch('flow.utils.httpclient.get') as mock_get:
+        mock_get.return_value.text = json.dumps({'resources': [{'entity': {'name': 'development'},
+                                                                'metadata': {'guid': 'space-guid'}}]})
+        with patch('flow.utils.commons.print_msg'):
+            _cf._get_space_guid()
+
+    assert CloudFoundry.space_guid == 'space-guid'
+    assert mock_get.call_args[1]['verify'] is True
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_stop_old_app_servers_scales_then_stops_each_app():
+    for minor in range(6):
+        responses.add(responses.POST, 'https://api.run-np.fake.com/v3/apps/guid-{}/processes/web/actions/scale'
+                      .format(minor), json={})
+        responses.add(responses.POST, 'https://api.run-np.fake.com/v3/apps/guid-{}/actions/stop'.format(minor),
+                      json={})
+
+    _b = MagicMock(BuildConfig)
+    _b.project_name = 'CI-HelloWorld'
+    _b.version_number = 'v2.9.0+1'
+    _cf = CloudFoundry(_b)
+    CloudFoundry.cf_api_endpoint = 'api.run-np.fake.com'
+    CloudFoundry.started_apps = [_old_version('CI-HelloWorld-v2.{}.0'.format(minor), 'guid-{}'.format(minor))
+                                 for minor in range(6)]
+
+    with patch('flow.utils.commons.print_msg'):
+        _cf._stop_old_app_servers()
+
+    calls = _cf_api_calls()
+    assert len(calls) == 12
+    for app in CloudFoundry.started_apps:
+        assert calls.index('POST https://api.run-np.fake.com/v3/apps/{}/processes/web/actions/scale'.format(
+            app.guid)) < calls.index('POST https://api.run-np.fake.com/v3/apps/{}/actions/stop'.format(app.guid))
+    assert json.loads(responses.calls[0].request.body) == {'instances': 1}
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_map_route_creates_missing_route():
+    responses.add(responses.GET, 'https://api.run-np.fake.com/v3/apps',
+                  json={'resources': [{'guid': 'app-guid', 'name': 'CI-HelloWorld-v2.9.0'}], 'pagination': {}})
+    responses.add(responses.GET, 'https://api.run-np.fake.com/v3/domains',
+                  json={'resources': [{'guid': 'domain-guid', 'name': 'apps-np.fake.com'}], 'pagination': {}})
+    responses.add(responses.GET, 'https://api.run-np.fake.com/v3/routes',
+                  json={'resources': [{'guid': 'other-route', 'host': 'ci-helloworld', 'path': '',
+                                       'destinations': []}], 'pagination': {}})
+    responses.add(responses.POST, 'https://api.run-np.fake.com/v3/routes', json={'guid': 'new-route'}, status=201)
+    responses.add(responses.POST, 'https://api.run-np.fake.com/v3/routes/new-route/destinations', json={})
+
+    _b = MagicMock(BuildConfig)
+    _cf = CloudFoundry(_b)
+    CloudFoundry.cf_api_endpoint = 'api.run-np.fake.com'
+    CloudFoundry.space_guid = 'space-guid'
+    CloudFoundry.app_inventory = None
+
+    with patch('flow.utils.commons.print_msg'):
+        _cf._map_route('CI-HelloWorld-v2.9.0', 'apps-np.fake.com', 'ci-helloworld', '/cold')
+
+    assert json.loads(responses.calls[3].request.body) == {
+        'host': 'ci-helloworld', 'path': '/cold',
+        'relationships': {'space': {'data': {'guid': 'space-guid'}}, 'domain': {'data': {'guid': 'domain-guid'}}}}
+    assert json.loads(responses.calls[4].request.body) == {'destinations': [{'app': {'guid': 'app-guid'}}]}
+
+
+def _v2_app(name, guid, state):
+    return {'metadata': {'guid': guid}, 'entity': {'name': name, 'state': state}}
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_app_inventory_is_loaded_once_and_shared():
+    responses.add(responses.GET, 'https://api.run-np.fake.com/v2/spaces/space-guid/apps',
+                  json={'next_url': '/v2/spaces/space-guid/apps?page=2',
+                        'resources': [_v2_app('CI-HelloWorld-v2.7.0', 'guid-1', 'STOPPED'),
+                                      _v2_app('CI-HelloWorld-v2.8.0', 'guid-2', 'STARTED')]})
+    responses.add(responses.GET, 'https://api.run-np.fake.com/v2/spaces/space-guid/apps?page=2',
+                  json={'next_url': None, 'resources': [_v2_app('ci-helloworld-v2.9.0', 'guid-3', 'STARTED')]})
+    responses.add(responses.GET, 'https://api.run-np.fake.com/v3/routes',
+                  json={'resources': [{'guid': 'route-1', 'host': 'ci-helloworld', 'path': '/cold',
+                                       'relationships': {'domain': {'data': {'guid': 'domain-guid'}}},
+                                       'destinations': [{'guid': 'dest-1', 'app': {'guid': 'guid-1'}},
+                                                        {'guid': 'dest-3', 'app': {'guid': 'guid-3'}}]}],
+                        'included': {'domains': [{'guid': 'domain-guid', 'name': 'apps-np.fake.com'}]},
+                        'pagination': {}})
+
+    _b = MagicMock(BuildConfig)
+    _b.project_name = 'CI-HelloWorld'
+    _b.version_number = 'v2.9.0'
+    _cf = CloudFoundry(_b)
+    CloudFoundry.cf_api_endpoint = 'api.run-np.fake.com'
+    CloudFoundry.space_guid = 'space-guid'
+    CloudFoundry.app_inventory = None
+
+    with patch('flow.utils.commons.print_msg'):
+        _cf._get_stopped_apps()
+        _cf._get_started_apps(True)
+        cold_routes = _cf._get_routes(app_name='CI-HelloWorld', cold_routes=True)
+
+    assert len(responses.calls) == 3
+    assert responses.calls[0].request.params['q'] == ['name>=CI-HelloWorld-', 'name<CI-HelloWorld.']
+    assert responses.calls[2].request.params['app_guids'] == 'guid-1,guid-2,guid-3'
+
+    assert [app.name for app in CloudFoundry.stopped_apps] == ['CI-HelloWorld-v2.7.0']
+    assert [app.name for app in CloudFoundry.started_apps] == ['CI-HelloWorld-v2.8.0', 'ci-helloworld-v2.9.0']
+    assert [route.guid for route in CloudFoundry.stopped_apps[0].routes] == ['route-1']
+    assert [(route.domain, route.apps) for route in cold_routes] == [
+        ('apps-np.fake.com', ['CI-HelloWorld-v2.7.0', 'ci-helloworld-v2.9.0'])]
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_deploy_blue_green_stages_app_before_starting():
+    base_url = 'https://api.run-np.fake.com'
+    responses.add(responses.GET, base_url + '/v3/apps',
+                  json={'resources': [{'guid': 'app-guid', 'name': 'CI-HelloWorld-v2.9.0'}], 'pagination': {}})
+    responses.add(responses.GET, base_url + '/v3/apps/app-guid/droplets/current', status=404, json={})
+    responses.add(responses.GET, base_url + '/v3/packages', json={'resources': [{'guid': 'package-guid'}]})
+    responses.add(responses.POST, base_url + '/v3/builds', json={'guid': 'build-guid', 'state': 'STAGING'},
+                  status=201)
+    responses.add(responses.GET, base_url + '/v3/builds/build-guid',
+                  json={'guid': 'build-guid', 'state': 'STAGED', 'droplet': {'guid': 'droplet-guid'}})
+    responses.add(responses.PATCH, base_url + '/v3/apps/app-guid/relationships/current_droplet', json={})
+    responses.add(responses.POST, base_url + '/v3/apps/app-guid/actions/start', json={})
+
+    _b = MagicMock(BuildConfig)
+    _b.project_name = 'CI-HelloWorld'
+    _b.version_number = 'v2.9.0'
+    _cf = CloudFoundry(_b)
+    CloudFoundry.cf_api_endpoint = 'api.run-np.fake.com'
+    CloudFoundry.space_guid = 'space-guid'
+    CloudFoundry.app_inventory = None
+    cf_push = MagicMock()
+
+    with patch('flow.utils.commons.print_msg'), \
+            patch('flow.cloud.cloudfoundry.cf_api.CloudFoundryApi.job_poll_interval', 0), \
+            patch.multiple(_cf, api_login=MagicMock(), _get_space_guid=MagicMock(),
+                           _verify_required_attributes=MagicMock(), download_cf_cli=MagicMock(),
+                           _cf_login_check=MagicMock(), _cf_login=MagicMock(), _check_cf_version=MagicMock(),
+                           _get_stopped_apps=MagicMock(), _get_started_apps=MagicMock(),
+                           _get_routes=MagicMock(return_value=[]), _cf_push=cf_push):
+        _cf.deploy(manifest='manifest-unittest.yml', blue_green=True)
+
+    cf_push.assert_called_once_with('manifest-unittest.yml', True)
+    assert _cf_api_calls() == ['GET {}/v3/apps'.format(base_url),
+                               'GET {}/v3/apps/app-guid/droplets/current'.format(base_url),
+                               'GET {}/v3/packages'.format(base_url),
+                               'POST {}/v3/builds'.format(base_url),
+                               'GET {}/v3/builds/build-guid'.format(base_url),
+                               'PATCH {}/v3/apps/app-guid/relationships/current_droplet'.format(base_url),
+                               'POST {}/v3/apps/app-guid/actions/start'.format(base_url)]
+    assert json.loads(responses.calls[3].request.body) == {'package': {'guid': 'package-guid'}}
+    assert json.loads(responses.calls[5].request.body) == {'data': {'guid': 'droplet-guid'}}
@@ -0,0 +1,105 @@
+import hashlib
+import io
+import os
+import tarfile
+import time
+from unittest.mock import patch
+
+import pytest
+import responses
+from flow.cloud.toolchain_cache import ToolchainCache, ToolchainException
+
+cli_url = 'https://packages.cloudfoundry.fake.com/stable?release=linux64-binary'
+
+
+def _cli_tgz(version=b'6.32.0'):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        data = b'#!/bin/sh\necho cf version ' + version + b'\n'
+        info = tarfile.TarInfo('cf')
+        info.size = len(data)
+        info.mode = 0o755
+        tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_install_downloads_once_and_reuses_the_cache(tmpdir):
+    cli_tgz = _cli_tgz()
+    responses.add(responses.GET, cli_url, body=cli_tgz)
+
+    with patch('flow.utils.commons.print_msg'):
+        first = ToolchainCache(str(tmpdir)).install('cf', cli_url, hashlib.sha256(cli_tgz).hexdigest())
+        second = ToolchainCache(str(tmpdir)).install('cf', cli_url, hashlib.sha256(cli_tgz).hexdigest())
+
+    assert first == second
+    assert len(responses.calls) == 1
+    assert os.access(os.path.join(first, 'cf'), os.X_OK)
+    assert os.listdir(os.path.dirname(first)) == [os.path.basename(first)]
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_install_rejects_checksum_mismatch(tmpdir):
+    responses.add(responses.GET, cli_url, body=_cli_tgz())
+
+    with patch('flow.utils.commons.print_msg'):
+        with pytest.raises(ToolchainException, match='Checksum mismatch'):
+            ToolchainCache(str(tmpdir)).install('cf', cli_url, '0' * 64)
+
+    # nothing is left behind for the next run to pick up
+    assert os.listdir(str(tmpdir.join('toolchains', 'cf'))) == []
+
+
+def test_install_directory_is_versioned_by_url_and_checksum(tmpdir):
+    cache = ToolchainCache(str(tmpdir))
+
+    assert cache.install_directory('gcloud', 'https://fake.com/sdk-182.tar.gz', 'a' * 64) != \
+        cache.install_directory('gcloud', 'https://fake.com/sdk-183.tar.gz', 'a' * 64)
+    assert cache.install_directory('gcloud', 'https://fake.com/sdk-182.tar.gz', 'a' * 64) != \
+        cache.install_directory('gcloud', 'https://fake.com/sdk-182.tar.gz', 'b' * 64)
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_install_without_checksum_refreshes_after_max_age(tmpdir):
+    old_cli, new_cli = _cli_tgz(), _cli_tgz(b'6.40.0')
+    responses.add(responses.GET, cli_url, body=old_cli)
+    responses.add(responses.GET, cli_url, body=new_cli)
+
+    with patch('flow.utils.commons.print_msg'):
+        first = ToolchainCache(str(tmpdir)).install('cf', cli_url)
+        assert ToolchainCache(str(tmpdir)).install('cf', cli_url) == first
+        assert len(responses.calls) == 1
+
+        marker = os.path.join(first, ToolchainCache.marker_file)
+        os.utime(marker, (time.time() - 25 * 60 * 60,) * 2)
+        refreshed = ToolchainCache(str(tmpdir), max_age_hours=24).install('cf', cli_url)
+
+    assert len(responses.calls) == 2
+    assert refreshed == ToolchainCache(str(tmpdir)).install_directory('cf', cli_url,
+                                                                      hashlib.sha256(new_cli).hexdigest())
+    assert refreshed != first
+
+
+def _tgz_with(member):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        tar.addfile(member)
+    return buffer.getvalue()
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_install_rejects_links_outside_the_install(tmpdir):
+    link = tarfile.TarInfo('cf')
+    link.type = tarfile.SYMTYPE
+    link.linkname = '../../../../outside'
+    responses.add(responses.GET, cli_url, body=_tgz_with(link))
+
+    with patch('flow.utils.commons.print_msg'):
+        with pytest.raises(ToolchainException, match='unsafe member cf'):
+            ToolchainCache(str(tmpdir)).install('cf', cli_url)
+
+    assert os.listdir(str(tmpdir.join('toolchains', 'cf'))) == []
@@ -1,11 +1,15 @@
+import configparser
 import json
 import os
+import subprocess
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import pytest
 import responses
 from flow.coderepo.github.github import GitHub
+from flow.coderepo.github.github_graphql import GitHubGraphQL
+from flow.coderepo.github.local_git import LocalGit
 
 from flow.buildconfig import BuildConfig
 
@@ -697,3 +701,256 @@ def test_get_all_git_commit_history_between_provided_tags_beginning_tag_not_foun
     mock_printmsg_fn.assert_any_call('GitHub', 'get_all_git_commit_history_between_provided_tags', "Version tag not "
                                                                                                    "found v1.99.98",
                                      'ERROR')
+
+
+def _github_with_cache(cache_directory):
+    _b = MagicMock(BuildConfig)
+    _b.build_env_info = mock_build_config_dict['environments']['develop']
+    _b.json_config = mock_build_config_dict
+    _b.settings = configparser.ConfigParser()
+    _b.settings.read_dict({'github': {'cache_directory': str(cache_directory)}})
+    _github = GitHub(config_override=_b, verify_repo=False)
+    _github._verify_required_attributes()
+    GitHub.all_tags_and_shas = []
+    GitHub.all_commits = []
+    GitHub.found_all_commits = False
+    return _github
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_get_all_tags_and_shas_revalidates_disk_cache(tmpdir):
+    tags_url = 'https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/tags?per_page=100&page=1'
+    responses.add(responses.GET, tags_url, json=[{'name': 'v1.0.0', 'commit': {'sha': 'abc123'}}],
+                  headers={'ETag': '"tags-v1"'}, status=200)
+    responses.add(responses.GET, tags_url, status=304)
+
+    tags = _github_with_cache(tmpdir).get_all_tags_and_shas_from_github()
+    assert tags == [('v1.0.0', 'abc123')]
+
+    # a new process only has the disk cache to go on
+    GitHub.cache = None
+    tags = _github_with_cache(tmpdir).get_all_tags_and_shas_from_github()
+
+    assert tags == [('v1.0.0', 'abc123')]
+    assert len(responses.calls) == 2
+    assert 'If-None-Match' not in responses.calls[0].request.headers
+    assert responses.calls[1].request.headers['If-None-Match'] == '"tags-v1"'
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_add_tag_invalidates_cached_tags(tmpdir):
+    tags_url = 'https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/tags?per_page=100&page=1'
+    responses.add(responses.GET, tags_url, json=[{'name': 'v1.0.0', 'commit': {'sha': 'abc123'}}],
+                  headers={'ETag': '"tags-v1"'}, status=200)
+    responses.add(responses.POST, 'https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/releases', status=201)
+    responses.add(responses.GET, tags_url, json=[{'name': 'v1.0.0+1', 'commit': {'sha': 'def456'}},
+                                                 {'name': 'v1.0.0', 'commit': {'sha': 'abc123'}}],
+                  headers={'ETag': '"tags-v2"'}, status=200)
+
+    _github = _github_with_cache(tmpdir)
+    _github.get_all_tags_and_shas_from_github()
+    _github.add_tag_and_release_notes_to_github([1, 0, 0, 1], 'notes')
+    tags = _github.get_all_tags_and_shas_from_github()
+
+    assert tags == [('v1.0.0+1', 'def456'), ('v1.0.0', 'abc123')]
+    assert 'If-None-Match' not in responses.calls[2].request.headers
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_get_all_commits_uses_cached_page_when_not_modified(tmpdir):
+    commits_url = 'https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/commits?per_page=100&page=1&sha=develop'
+    responses.add(responses.GET, commits_url, json=[{'sha': 'abc123', 'commit': {'message': 'first [#123]'}}],
+                  headers={'ETag': '"commits-v1"'}, status=200)
+    responses.add(responses.GET, commits_url, status=304)
+
+    _github_with_cache(tmpdir).get_all_commits_from_github()
+    GitHub.cache = None
+    commits = _github_with_cache(tmpdir).get_all_commits_from_github()
+
+    assert commits == [{'sha': 'abc123', 'commit': {'message': 'first [#123]'}}]
+    assert responses.calls[1].request.headers['If-None-Match'] == '"commits-v1"'
+
+
+def _git(cwd, *args):
+    subprocess.check_call(['git'] + list(args), cwd=str(cwd), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+@pytest.fixture
+def local_clone(tmpdir, monkeypatch):
+    for variable in ['GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME']:
+        monkeypatch.setenv(variable, 'flow')
+    for variable in ['GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL']:
+        monkeypatch.setenv(variable, 'flow@example.com')
+
+    origin = tmpdir.mkdir('Org-GitHub').join('Repo-GitHub.git')
+    _git(tmpdir, 'init', '--bare', str(origin))
+    clone = tmpdir.join('workspace')
+    _git(tmpdir, 'clone', str(origin), str(clone))
+    _git(clone, 'checkout', '-b', 'develop')
+
+    for number, tag in [(1, 'v1.0.0'), (2, None), (3, 'v1.0.0+1'), (4, None)]:
+        _git(clone, 'commit', '--allow-empty', '-m', 'commit {} [#10{}]'.format(number, number))
+        if tag:
+            _git(clone, 'tag', '-a', tag, '-m', tag)
+    _git(clone, 'push', '--tags', 'origin', 'develop')
+
+    monkeypatch.chdir(str(clone))
+
+    _b = MagicMock(BuildConfig)
+    _b.build_env_info = mock_build_config_dict['environments']['develop']
+    _b.json_config = mock_build_config_dict
+    _b.settings = configparser.ConfigParser()
+    _b.settings.read_dict({'github': {'local_git': 'true'}})
+    _github = GitHub(config_override=_b, verify_repo=False)
+    _github._verify_required_attributes()
+    GitHub.all_tags_and_shas = []
+    GitHub.all_commits = []
+    GitHub.found_all_commits = False
+    GitHub.local_git = None
+    yield _github
+    GitHub.local_git = None
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_get_all_tags_and_shas_from_local_clone(local_clone):
+    tags = local_clone.get_all_tags_and_shas_from_github(need_release=1)
+
+    assert [name for name, _ in tags] == ['v1.0.0+1', 'v1.0.0']
+    commit_of_first_tag = subprocess.check_output(['git', 'rev-parse', 'v1.0.0^{commit}']).decode().strip()
+    assert tags[1][1] == commit_of_first_tag
+    assert len(responses.calls) == 0
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_commit_history_between_tags_from_local_clone(local_clone):
+    commits = local_clone.get_all_git_commit_history_between_provided_tags([1, 0, 0, 0])
+
+    assert [commit.split(' ', 1)[1] for commit in commits] == ['commit 4 [#104]', 'commit 3 [#103]',
+                                                               'commit 2 [#102]']
+
+    commits = local_clone.get_all_git_commit_history_between_provided_tags([1, 0, 0, 0], [1, 0, 0, 1])
+
+    assert [commit.split(' ', 1)[1] for commit in commits] == ['commit 3 [#103]', 'commit 2 [#102]']
+    assert len(responses.calls) == 0
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_shallow_clone_falls_back_to_api(local_clone, tmpdir, monkeypatch):
+    shallow = tmpdir.join('shallow')
+    _git(tmpdir, 'clone', '--depth', '1', '--branch', 'develop',
+         'file://' + str(tmpdir.join('Org-GitHub', 'Repo-GitHub.git')), str(shallow))
+    monkeypatch.chdir(str(shallow))
+
+    responses.add(responses.GET, 'https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/tags?per_page=100&page=1',
+                  json=[{'name': 'v1.0.0', 'commit': {'sha': 'abc123'}}], status=200)
+
+    tags = local_clone.get_all_tags_and_shas_from_github()
+
+    assert tags == [('v1.0.0', 'abc123')]
+    assert len(responses.calls) == 1
+
+
+def test_local_git_fetch_never_prompts_for_credentials(local_clone):
+    real_run = subprocess.run
+    git_calls = []
+
+    def _run(command, **kwargs):
+        git_calls.append((command, kwargs))
+        return real_run(command, **kwargs)
+
+    with patch('flow.coderepo.github.local_git.subprocess.run', side_effect=_run):
+        LocalGit('Org-GitHub', 'Repo-GitHub').is_usable()
+
+    fetch_command, fetch_kwargs = [call for call in git_calls if call[0][1] == 'fetch'][0]
+    assert fetch_kwargs['env']['GIT_TERMINAL_PROMPT'] == '0'
+    assert fetch_kwargs['stdin'] == subprocess.DEVNULL
+    assert fetch_kwargs['timeout'] == LocalGit.fetch_timeout
+
+
+def test_local_git_tags_sorted_by_name_like_the_api(local_clone, tmpdir):
+    clone = tmpdir.join('workspace')
+    for tag in ['v1.9.0', 'v1.10.0']:
+        _git(clone, 'tag', tag)
+
+    tags = [name for name, sha in LocalGit('Org-GitHub', 'Repo-GitHub', str(clone)).get_tags()]
+
+    assert tags == ['v1.9.0', 'v1.10.0', 'v1.0.0+1', 'v1.0.0']
+
+
+def _github_with_graphql():
+    _b = MagicMock(BuildConfig)
+    _b.build_env_info = mock_build_config_dict['environments']['develop']
+    _b.json_config = mock_build_config_dict
+    _b.settings = configparser.ConfigParser()
+    _b.settings.read_dict({'github': {'api': 'graphql'}})
+    _github = GitHub(config_override=_b, verify_repo=False)
+    _github._verify_required_attributes()
+    GitHub.token = 'fake_token'
+    GitHub.all_tags_and_shas = []
+    GitHub.all_commits = []
+    GitHub.found_all_commits = False
+    return _github
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_get_all_tags_and_shas_from_graphql():
+    pages = [
+        {'data': {'repository': {'refs': {
+            'pageInfo': {'hasNextPage': True, 'endCursor': 'cursor1'},
+            'nodes': [{'name': 'v1.0.0+1', 'target': {'oid': 'tagobject', 'target': {'oid': 'def456'}}}]}}}},
+        {'data': {'repository': {'refs': {
+            'pageInfo': {'hasNextPage': False, 'endCursor': 'cursor2'},
+            'nodes': [{'name': 'v1.0.0', 'target': {'oid': 'abc123'}}]}}}}
+    ]
+    for page in pages:
+        responses.add(responses.POST, 'https://fakegithub.com/api/graphql', json=page, status=200)
+
+    try:
+        tags = _github_with_graphql().get_all_tags_and_shas_from_github(need_release=1)
+    finally:
+        GitHub.token = None
+
+    assert tags == [('v1.0.0+1', 'def456'), ('v1.0.0', 'abc123')]
+    assert len(responses.calls) == 2
+    assert responses.calls[0].request.headers['Authorization'] == 'bearer fake_token'
+    assert json.loads(responses.calls[1].request.body)['variables']['cursor'] == 'cursor1'
+    assert json.loads(responses.calls[1].request.body)['variables']['first'] == GitHubGraphQL.page_size
+    # same order as the rest tags api
+    assert 'orderBy: {field: ALPHABETICAL, direction: DESC}' in json.loads(responses.calls[0].request.body)['query']
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_get_all_commits_from_graphql_walks_to_beginning_sha():
+    responses.add(responses.POST, 'https://fakegithub.com/api/graphql',
+                  json={'data': {'repository': {'object': {'history': {
+                      'pageInfo': {'hasNextPage': True, 'endCursor': 'cursor1'},
+                      'nodes': [{'oid': 'def456', 'message': 'second [#102]'}]}}}}}, status=200)
+    # a merged commit authored before the beginning sha is still part of the release
+    responses.add(responses.POST, 'https://fakegithub.com/api/graphql',
+                  json={'data': {'repository': {'object': {'history': {
+                      'pageInfo': {'hasNextPage': True, 'endCursor': 'cursor2'},
+                      'nodes': [{'oid': 'aaa111', 'message': 'older merged [#103]'},
+                                {'oid': 'abc123', 'message': 'first [#101]'}]}}}}}, status=200)
+
+    try:
+        commits = _github_with_graphql().get_all_commits_from_github('abc123')
+    finally:
+        GitHub.token = None
+
+    assert commits == [{'sha': 'def456', 'commit': {'message': 'second [#102]'}},
+                       {'sha': 'aaa111', 'commit': {'message': 'older merged [#103]'}},
+                       {'sha': 'abc123', 'commit': {'message': 'first [#101]'}}]
+    assert len(responses.calls) == 2
+    variables = json.loads(responses.calls[1].request.body)['variables']
+    assert variables['expression'] == 'develop'
+    assert variables['cursor'] == 'cursor1'
+    assert 'since' not in variables
+    assert not GitHub.found_all_commits
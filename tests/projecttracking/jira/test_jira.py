@@ -0,0 +1,107 @@
+import configparser
+import json
+from unittest.mock import MagicMock
+from urllib.parse import parse_qs, urlparse
+
+import responses
+from flow.projecttracking.jira.jira import Jira
+
+from flow.buildconfig import BuildConfig
+
+mock_build_config_dict = {
+    "projectInfo": {
+        "name": "testproject"
+    },
+    "projectTracking": {
+        "jira": {
+            "projectId": "TEST",
+            "url": "https://fakejira.com"
+        }
+    },
+    "environments": {
+        "unittest": {
+            "artifactCategory": "release"
+        }
+    }
+}
+
+
+def _issue(key, summary, issue_type='Story'):
+    return {
+        "id": key.split('-')[1],
+        "key": key,
+        "fields": {
+            "summary": summary,
+            "issuetype": {"name": issue_type},
+            "labels": [],
+            "fixVersions": [{"name": "testproject-1.0.0"}]
+        }
+    }
+
+
+def _jira():
+    _b = MagicMock(BuildConfig)
+    _b.json_config = mock_build_config_dict
+    _b.settings = configparser.ConfigParser()
+    return Jira(config_override=_b)
+
+
+@responses.activate
+def test_get_details_for_all_stories_uses_search():
+    search_response = {"startAt": 0, "maxResults": 100, "total": 2,
+                       "issues": [_issue('TEST-2', 'Second Story', 'Bug'), _issue('TEST-1', 'First Story')]}
+    responses.add(responses.GET, 'https://fakejira.com/rest/api/2/search', json=search_response, status=200)
+
+    story_details = _jira().get_details_for_all_stories(['TEST-1', 'test-2'])
+
+    assert len(responses.calls) == 1
+    query = parse_qs(urlparse(responses.calls[0].request.url).query)
+    assert query['jql'] == ['key in (TEST-1,TEST-2)']
+    assert query['fields'] == ['summary,labels,fixVersions,issuetype']
+
+    assert [story.name for story in story_details] == ['TEST-1', 'TEST-2']
+    assert story_details[0].description == 'first story'
+    assert story_details[1].story_type == 'bug'
+    assert story_details[1].url == 'https://fakejira.com/browse/TEST-2'
+    assert story_details[1].versions == ['testproject-1.0.0']
+
+
+@responses.activate
+def test_get_details_for_all_stories_pages_search_results():
+    first_page = {"startAt": 0, "maxResults": 1, "total": 2, "issues": [_issue('TEST-1', 'First Story')]}
+    second_page = {"startAt": 1, "maxResults": 1, "total": 2, "issues": [_issue('TEST-2', 'Second Story')]}
+    responses.add(responses.GET, 'https://fakejira.com/rest/api/2/search', json=first_page, status=200)
+    responses.add(responses.GET, 'https://fakejira.com/rest/api/2/search', json=second_page, status=200)
+
+    story_details = _jira().get_details_for_all_stories(['TEST-1', 'TEST-2'])
+
+    assert len(responses.calls) == 2
+    assert parse_qs(urlparse(responses.calls[1].request.url).query)['startAt'] == ['1']
+    assert [story.name for story in story_details] == ['TEST-1', 'TEST-2']
+
+
+@responses.activate
+def test_get_details_for_all_stories_falls_back_for_missing_keys():
+    search_response = {"startAt": 0, "maxResults": 100, "total": 1, "issues": [_issue('TEST-1', 'First Story')]}
+    responses.add(responses.GET, 'https://fakejira.com/rest/api/2/search', json=search_response, status=200)
+    responses.add(responses.GET, 'https://fakejira.com/rest/api/2/issue/OLD-7',
+                  body=json.dumps(_issue('TEST-7', 'Moved Story')), status=200)
+    responses.add(responses.GET, 'https://fakejira.com/rest/api/2/issue/TEST-9', body='{}', status=404)
+
+    story_details = _jira().get_details_for_all_stories(['OLD-7', 'TEST-1', 'TEST-9'])
+
+    assert len(responses.calls) == 3
+    assert [story.name for story in story_details] == ['TEST-7', 'TEST-1']
+
+
+@responses.activate
+def test_get_details_for_all_stories_falls_back_when_search_rejected():
+    responses.add(responses.GET, 'https://fakejira.com/rest/api/2/search',
+                  json={"errorMessages": ["An issue with key 'TEST-9' does not exist for field 'key'."]}, status=400)
+    responses.add(responses.GET, 'https://fakejira.com/rest/api/2/issue/TEST-1',
+                  body=json.dumps(_issue('TEST-1', 'First Story')), status=200)
+    responses.add(responses.GET, 'https://fakejira.com/rest/api/2/issue/TEST-9', body='{}', status=404)
+
+    story_details = _jira().get_details_for_all_stories(['TEST-1', 'TEST-9'])
+
+    assert [story.name for story in story_details] == ['TEST-1']
@@ -1,6 +1,7 @@
 import configparser
 import json
 import os
+import time
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
@@ -212,3 +213,26 @@ def test_init_missing_env_variable(monkeypatch):
             Tracker()
 
         mock_printmsg_fn.assert_called_with('Tracker', '__init__', "No tracker token found in environment.  Did you define environment variable 'TRACKER_TOKEN'?", 'ERROR')
+
+
+def test_get_details_for_all_stories_keeps_story_order(monkeypatch):
+    monkeypatch.setenv('TRACKER_TOKEN', 'fake_token')
+
+    _b = MagicMock(BuildConfig)
+    _b.json_config = mock_build_config_dict
+    parser = configparser.ConfigParser()
+    parser.read_string(mock_setting_ini + "\n[project]\nmax_concurrent_requests = 4\n")
+    _b.settings = parser
+
+    _tracker = Tracker(config_override=_b)
+
+    def _retrieve_story_detail(story_id):
+        # later stories finish first to prove results are not returned in completion order
+        time.sleep(0.05 / int(story_id))
+        return None if story_id == '3' else story_id
+
+    with patch.object(_tracker, '_retrieve_story_detail', side_effect=_retrieve_story_detail) as mock_retrieve:
+        story_details = _tracker.get_details_for_all_stories(['1', '2', '3', '4', '5'])
+
+    assert mock_retrieve.call_count == 5
+    assert story_details == ['1', '2', '4', '5']
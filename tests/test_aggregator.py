@@ -1,9 +1,15 @@
+import os
+import subprocess
+import sys
+import threading
 from io import StringIO, TextIOWrapper
 from unittest.mock import MagicMock
 from unittest.mock import PropertyMock
 from unittest.mock import mock_open
 from unittest.mock import patch
 
+import pytest
+
 import flow.aggregator
 from argparse import ArgumentParser
 from argparse import Namespace
@@ -11,6 +17,8 @@ from flow.coderepo.github.github import GitHub
 from flow.projecttracking.tracker.tracker import Tracker
 from flow.staticqualityanalysis.sonar.sonarmodule import SonarQube
 from flow.artifactstorage.artifactory.artifactory import Artifactory
+from flow.communications.slack.slack import Slack
+from flow.servicemanagement.servicenow.service_now import ServiceNow
 import flow.utils.commons
 
 from flow.buildconfig import BuildConfig
@@ -672,3 +680,197 @@ def test_aggregator_github_outputs_getversion():
 #             flow.aggregator.call_github_getversion(_github, file_path='somefilepath', open_func=_open_mock)
 # 
 #     print('Mock Call Stack\n{}'.format(str(_github.method_calls)))
+
+
+def test_aggregator_builds_each_client_once(mocker):
+    with patch('sys.argv', ['flow', 'slack', 'release', 'development']):
+        mocker.patch.object(GitHub, '__init__')
+        GitHub.__init__.return_value = None
+        mocker.patch.object(GitHub, 'get_git_last_tag')
+        GitHub.get_git_last_tag.return_value = '1.0.0.0'
+        mocker.patch.object(Slack, '__init__')
+        Slack.__init__.return_value = None
+        mocker.patch.object(Slack, 'publish_deployment')
+        mocker.patch.object(flow.aggregator, 'get_git_commit_history')
+        flow.aggregator.get_git_commit_history.return_value = []
+        mocker.patch.object(flow.aggregator, 'get_story_details')
+        flow.aggregator.get_story_details.return_value = None
+
+        flow.aggregator.main()
+
+    # the client that resolved the version is the one the task uses
+    assert GitHub.__init__.call_count == 1
+    assert isinstance(flow.aggregator.get_git_commit_history.call_args[0][0], GitHub)
+    Slack.publish_deployment.assert_called_once_with(None)
+
+
+def test_aggregator_plugins_register_as_tasks(mocker):
+    with patch('sys.argv', ['flow', 'foo', 'fooa', 'development']):
+        mocker.patch.object(GitHub, '__init__')
+        GitHub.__init__.return_value = None
+
+        flow.aggregator.main()
+
+    assert 'foo' in flow.aggregator.tasks
+    assert not flow.aggregator.tasks['foo'].resolve_version
+    GitHub.__init__.assert_not_called()
+
+
+def test_aggregator_pipeline_runs_steps_in_one_context(mocker):
+    with patch('sys.argv', ['flow', 'pipeline', 'tracker label-release', 'slack release', 'servicenow createcr',
+                            'development']):
+        mocker.patch.object(GitHub, '__init__')
+        GitHub.__init__.return_value = None
+        mocker.patch.object(GitHub, 'get_git_last_tag')
+        GitHub.get_git_last_tag.return_value = '1.0.0.0'
+        mocker.patch.object(Tracker, '__init__')
+        Tracker.__init__.return_value = None
+        mocker.patch.object(Tracker, 'tag_stories_in_commit')
+        mocker.patch.object(Slack, '__init__')
+        Slack.__init__.return_value = None
+        mocker.patch.object(Slack, 'publish_deployment')
+        mocker.patch.object(ServiceNow, '__init__')
+        ServiceNow.__init__.return_value = None
+        mocker.patch.object(ServiceNow, 'create_chg')
+        mocker.patch.object(flow.aggregator, 'get_git_commit_history')
+        flow.aggregator.get_git_commit_history.return_value = ['blah1 [#12345678]']
+        mocker.patch.object(flow.aggregator, 'get_story_details')
+        flow.aggregator.get_story_details.return_value = [{'id': '12345678'}]
+
+        with patch('flow.utils.commons.print_msg') as mock_printmsg_fn:
+            flow.aggregator.main()
+
+    # one client and one history/story lookup serve every step
+    assert GitHub.__init__.call_count == 1
+    assert GitHub.get_git_last_tag.call_count == 3
+    flow.aggregator.get_git_commit_history.assert_called_once()
+    flow.aggregator.get_story_details.assert_called_once()
+    Tracker.tag_stories_in_commit.assert_called_once_with(['12345678'])
+    Slack.publish_deployment.assert_called_once_with([{'id': '12345678'}])
+    ServiceNow.create_chg.assert_called_once_with([{'id': '12345678'}])
+
+    summary = [call[0][2] for call in mock_printmsg_fn.call_args_list if call[0][1] == 'run_pipeline_steps']
+    assert '3 of 3 steps finished' in summary[-1]
+
+
+def test_aggregator_pipeline_rejects_bad_step_before_running(mocker):
+    with patch('sys.argv', ['flow', 'pipeline', 'sonar scan', 'nosuchtask deploy', 'development']):
+        mocker.patch.object(SonarQube, '__init__')
+        SonarQube.__init__.return_value = None
+        mocker.patch.object(SonarQube, 'scan_code')
+
+        with patch('sys.stderr'):
+            with pytest.raises(SystemExit):
+                flow.aggregator.main()
+
+    SonarQube.scan_code.assert_not_called()
+
+
+def test_aggregator_pipeline_plan_waits_for_producers():
+    steps_args = [Namespace(task='zipit'),
+                  Namespace(task='sonar', action='scan'),
+                  Namespace(task='artifactory', action='upload'),
+                  Namespace(task='tracker', action='label-release'),
+                  Namespace(task='cf', action='deploy'),
+                  Namespace(task='slack', action='release')]
+
+    plan = flow.aggregator.plan_pipeline(steps_args)
+
+    assert plan[1] == []
+    # the upload ships what zipit built
+    assert plan[2] == [0]
+    assert plan[3] == []
+    # cf runs on its own and slack waits for the artifact and the deployment
+    assert plan[4] == [0, 1, 2, 3]
+    assert plan[5] == [0, 2, 4]
+
+
+def test_aggregator_pipeline_plan_runs_github_version_alone():
+    steps_args = [Namespace(task='github', action='version', version=None),
+                  Namespace(task='sonar', action='scan', version=None),
+                  Namespace(task='tracker', action='label-release', version='2.0.0')]
+
+    assert flow.aggregator.plan_pipeline(steps_args) == [[], [0], [0, 1]]
+
+
+def test_aggregator_pipeline_runs_independent_steps_concurrently(mocker):
+    # each step waits at the barrier for the other, so the pipeline only finishes if they overlap
+    barrier = threading.Barrier(2, timeout=5)
+
+    with patch('sys.argv', ['flow', 'pipeline', 'tracker label-release', 'sonar scan', 'development']):
+        mocker.patch.object(GitHub, '__init__')
+        GitHub.__init__.return_value = None
+        mocker.patch.object(GitHub, 'get_git_last_tag')
+        GitHub.get_git_last_tag.return_value = '1.0.0.0'
+        mocker.patch.object(Tracker, '__init__')
+        Tracker.__init__.return_value = None
+        mocker.patch.object(Tracker, 'tag_stories_in_commit')
+        Tracker.tag_stories_in_commit.side_effect = lambda stories: barrier.wait()
+        mocker.patch.object(SonarQube, '__init__')
+        SonarQube.__init__.return_value = None
+        mocker.patch.object(SonarQube, 'scan_code')
+        SonarQube.scan_code.side_effect = lambda: barrier.wait()
+        mocker.patch.object(flow.aggregator, 'get_git_commit_history')
+        flow.aggregator.get_git_commit_history.return_value = ['blah1 [#12345678]']
+        # steps run one at a time unless max_concurrent_steps is raised
+        get_int_setting = flow.utils.commons.get_int_setting
+
+        def _two_concurrent_steps(settings, section, option, default):
+            return 2 if option == 'max_concurrent_steps' else get_int_setting(settings, section, option, default)
+
+        mocker.patch.object(flow.utils.commons, 'get_int_setting', side_effect=_two_concurrent_steps)
+
+        with patch('flow.utils.commons.print_msg'):
+            flow.aggregator.main()
+
+    assert GitHub.__init__.call_count == 1
+    Tracker.tag_stories_in_commit.assert_called_once_with(['12345678'])
+    SonarQube.scan_code.assert_called_once()
+
+
+def test_aggregator_pipeline_stops_after_failed_step(mocker):
+    with patch('sys.argv', ['flow', 'pipeline', 'sonar scan', 'github getversion', 'development']):
+        mocker.patch.object(GitHub, '__init__')
+        GitHub.__init__.return_value = None
+        mocker.patch.object(GitHub, 'get_git_last_tag')
+        GitHub.get_git_last_tag.return_value = '1.0.0.0'
+        mocker.patch.object(SonarQube, '__init__')
+        SonarQube.__init__.return_value = None
+        mocker.patch.object(SonarQube, 'scan_code')
+        SonarQube.scan_code.side_effect = SystemExit(1)
+        mocker.patch.object(flow.aggregator, 'call_github_getversion')
+
+        with patch('flow.utils.commons.print_msg') as mock_printmsg_fn:
+            with pytest.raises(SystemExit):
+                flow.aggregator.main()
+
+    flow.aggregator.call_github_getversion.assert_not_called()
+
+    graph = [call[0][2] for call in mock_printmsg_fn.call_args_list if call[0][1] == 'log_pipeline']
+    assert graph[-2:] == ["[0] sonar scan (failed) waits for nothing",
+                          "[1] github getversion (waiting) waits for [0] sonar scan"]
+
+
+def _imported_modules(statement):
+    # python -X importtime reports one "import time: self | cumulative | module" line per module on stderr
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(flow.aggregator.__file__)))
+    return [line.split('|')[-1].strip() for line in result.stderr.splitlines() if line.startswith('import time:')]
+
+
+def test_aggregator_import_does_not_load_integrations():
+    modules = _imported_modules('import flow.aggregator')
+
+    assert 'flow.aggregator' in modules
+    assert 'pkg_resources' not in modules
+    for integration_module in flow.aggregator.integrations.values():
+        assert integration_module not in modules
+
+
+def test_aggregator_loads_integration_on_first_use():
+    modules = _imported_modules('import flow.aggregator; flow.aggregator.load_integration("GitHub")')
+
+    # -X importtime reports the imports inside a module loaded by importlib.import_module but not its own line
+    assert 'flow.coderepo.github.github_graphql' in modules
+    assert 'flow.cloud.cloudfoundry.cloudfoundry' not in modules
@@ -0,0 +1,98 @@
+import configparser
+import json
+import os
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from pydispatch import dispatcher
+
+import flow.utils.commons as commons
+from flow.logger import Logger
+
+
+@pytest.fixture
+def log_settings(tmpdir):
+    settings = configparser.ConfigParser()
+    settings.read_dict({'logging': {'level': 'INFO', 'file': str(tmpdir.join('flow.log')), 'format': 'json',
+                                    'max_size_mb': '1', 'backup_count': '2'}})
+    yield settings
+    # closes the log file in tmpdir, the next message sets the logger up again with the defaults
+    Logger.shutdown()
+    Logger.logger = None
+
+
+class _CountingStr:
+    formatted = 0
+
+    def __str__(self):
+        _CountingStr.formatted += 1
+        return 'counted'
+
+
+def test_print_msg_keeps_console_format(log_settings):
+    Logger.configure(log_settings)
+
+    with patch('sys.stdout', new=StringIO()) as fake_stdout:
+        commons.print_msg('MyClass', 'my_method', 'hello', 'WARN')
+
+    assert fake_stdout.getvalue() == '{:7s} {:11s}  {:35s} {}\n'.format('[WARN]', 'MyClass', 'my_method', 'hello')
+
+
+def test_print_msg_skips_formatting_below_level(log_settings):
+    Logger.configure(log_settings)
+    _CountingStr.formatted = 0
+
+    with patch('sys.stdout', new=StringIO()) as fake_stdout:
+        commons.print_msg('MyClass', 'my_method', _CountingStr())
+        commons.print_msg('MyClass', 'my_method', 'Story list: {}', 'DEBUG', _CountingStr())
+
+    assert fake_stdout.getvalue() == ''
+    assert _CountingStr.formatted == 0
+
+
+def test_print_msg_writes_json_log_file(log_settings):
+    Logger.configure(log_settings)
+
+    with patch('sys.stdout', new=StringIO()):
+        commons.print_msg('MyClass', 'my_method', 'Story list: {}', 'INFO', ['123'])
+    Logger.shutdown()
+
+    with open(log_settings.get('logging', 'file')) as log_file:
+        record = json.loads(log_file.readline())
+
+    assert record['level'] == 'INFO'
+    assert record['class'] == 'MyClass'
+    assert record['method'] == 'my_method'
+    assert record['message'] == "Story list: ['123']"
+
+
+def test_log_file_rotates(log_settings):
+    Logger.configure(log_settings)
+
+    with patch('sys.stdout', new=StringIO()):
+        for _ in range(3):
+            commons.print_msg('MyClass', 'my_method', 'x' * 600 * 1024, 'INFO')
+    Logger.shutdown()
+
+    log_file = log_settings.get('logging', 'file')
+    assert os.path.isfile(log_file + '.1')
+    assert os.path.isfile(log_file + '.2')
+    assert not os.path.isfile(log_file + '.3')
+
+
+def test_print_msg_error_sends_signal(log_settings):
+    Logger.configure(log_settings)
+    received = []
+
+    def _on_error(sender, message, class_name, method_name):
+        received.append((message, class_name, method_name))
+
+    dispatcher.connect(_on_error, signal='publish-error-signal', sender=dispatcher.Any)
+    try:
+        with patch('sys.stdout', new=StringIO()):
+            commons.print_msg('MyClass', 'my_method', 'Failed {}', 'ERROR', 'upload')
+    finally:
+        dispatcher.disconnect(_on_error, signal='publish-error-signal', sender=dispatcher.Any)
+
+    assert received == [('Failed upload', 'MyClass', 'my_method')]
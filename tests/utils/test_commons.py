@@ -1,3 +1,6 @@
+import time
+
+import pytest
 from unittest.mock import mock_open
 from unittest.mock import patch
 
@@ -67,3 +70,22 @@ def test_write_to_file():
     open_mock.assert_called_once_with("somefilepath", "a")
     file_mock = open_mock()
     file_mock.write.assert_called_once_with("test_write_to_file")
+
+
+def test_map_concurrently_keeps_order():
+    assert commons.map_concurrently(lambda item: item * 2, [3, 1, 2], 3) == [6, 2, 4]
+
+
+def test_map_concurrently_fail_fast_cancels_pending():
+    started = []
+
+    def _work(item):
+        started.append(item)
+        if item == 0:
+            raise SystemExit(1)
+        time.sleep(0.05)
+
+    with pytest.raises(SystemExit):
+        commons.map_concurrently(_work, range(20), 2, fail_fast=True)
+
+    assert len(started) < 20
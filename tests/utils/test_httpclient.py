@@ -0,0 +1,72 @@
+import configparser
+from unittest.mock import patch
+
+import pytest
+import responses
+
+import flow.utils.httpclient as httpclient
+from flow.buildconfig import BuildConfig
+
+
+@pytest.fixture(autouse=True)
+def settings():
+    parser = configparser.ConfigParser()
+    parser.read_dict({'project': {'http_timeout_default_seconds': '45', 'http_retries': '2',
+                                  'http_backoff_factor': '0'},
+                      'http_timeouts': {'slow.example.com': '300'}})
+    with patch.object(BuildConfig, 'settings', parser):
+        httpclient.close_sessions()
+        yield parser
+    httpclient.close_sessions()
+
+
+def test_one_session_per_host():
+    assert httpclient.get_session('https://example.com/a') is httpclient.get_session('https://EXAMPLE.com/b')
+    assert httpclient.get_session('https://example.com/a') is not httpclient.get_session('https://other.com/a')
+
+
+def test_timeouts_from_settings():
+    assert httpclient.get_timeout('https://example.com/a') == 45
+    assert httpclient.get_timeout('https://slow.example.com/a') == 300
+
+
+@responses.activate
+def test_default_timeout_applied():
+    responses.add(responses.GET, 'https://example.com/a', status=200)
+
+    with patch('requests.Session.request', wraps=httpclient.get_session('https://example.com').request) as request:
+        httpclient.get('https://example.com/a')
+
+    assert request.call_args[1]['timeout'] == 45
+
+
+@responses.activate
+def test_retries_server_errors():
+    responses.add(responses.GET, 'https://example.com/a', status=503)
+    responses.add(responses.GET, 'https://example.com/a', status=200, body='ok')
+
+    resp = httpclient.get('https://example.com/a')
+
+    assert resp.status_code == 200
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_timing_hooks_called():
+    responses.add(responses.GET, 'https://example.com/a', status=200)
+    timings = []
+
+    with patch.object(httpclient, 'timing_hooks', [lambda *timing: timings.append(timing)]):
+        httpclient.get('https://example.com/a')
+
+    assert timings[0][0:3] == ('GET', 'https://example.com/a', 200)
+
+
+@responses.activate
+def test_responses_not_logged_without_timing_hooks():
+    responses.add(responses.GET, 'https://example.com/a', status=200)
+
+    with patch('flow.utils.commons.print_msg') as mock_printmsg_fn:
+        httpclient.get('https://example.com/a')
+
+    mock_printmsg_fn.assert_not_called()
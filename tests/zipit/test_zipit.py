@@ -0,0 +1,297 @@
+import configparser
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import tarfile
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+import responses
+from flow.artifactstorage.artifactory.artifactory import Artifactory
+from flow.buildconfig import BuildConfig
+from flow.zipit.archive_manifest import ArchiveManifest
+from flow.zipit.parallel_compressor import ParallelCompressor
+from flow.zipit.zipit import ZipIt
+
+
+def _zipit(block_size_kb='1'):
+    _b = MagicMock(BuildConfig)
+    _b.settings = configparser.ConfigParser()
+    _b.settings.read_dict({'zipit': {'compression_block_size_kb': block_size_kb}})
+
+    zipit = ZipIt('none', 'bundle', None)
+    zipit.config = _b
+    return zipit
+
+
+def _contents(tmpdir):
+    contents = tmpdir.mkdir('contents')
+    for index in range(20):
+        contents.join('file{}.txt'.format(index)).write(os.urandom(300).hex() * 3)
+    return contents
+
+
+@pytest.mark.parametrize('compression, opener', [('gzip', gzip.open), ('xz', lzma.open)])
+def test_zip_it_compressed_in_parallel_blocks(tmpdir, monkeypatch, compression, opener):
+    contents = _contents(tmpdir)
+    monkeypatch.chdir(str(tmpdir))
+
+    _zipit()._zip_it('builds/bundle.tar', str(contents), compression)
+
+    # several independent blocks, still readable as a single archive
+    with opener('bundle.tar', 'rb') as archive:
+        with tarfile.open(fileobj=archive, mode='r|') as tar:
+            names = sorted(member.name for member in tar if member.isfile())
+
+    assert names == sorted('builds/bundle.tar/file{}.txt'.format(index) for index in range(20))
+    assert os.path.getsize('bundle.tar') < 20 * 1800
+
+
+def test_zip_it_uncompressed_by_default(tmpdir, monkeypatch):
+    contents = _contents(tmpdir)
+    monkeypatch.chdir(str(tmpdir))
+
+    _zipit()._zip_it('bundle.tar', str(contents))
+
+    with tarfile.open('bundle.tar', 'r:') as tar:
+        assert len([member for member in tar if member.isfile()]) == 20
+
+
+def test_parallel_compressor_preserves_block_order(tmpdir):
+    data = b''.join(bytes([index]) * 1000 for index in range(200))
+
+    with open(str(tmpdir.join('data.gz')), 'wb') as output:
+        with ParallelCompressor(output, 'gzip', block_size=777, workers=4) as compressor:
+            for start in range(0, len(data), 313):
+                compressor.write(data[start:start + 313])
+
+    with gzip.open(str(tmpdir.join('data.gz')), 'rb') as compressed:
+        assert compressed.read() == data
+
+
+def test_parallel_compressor_rejects_unknown_compression(tmpdir):
+    with open(str(tmpdir.join('data')), 'wb') as output:
+        with pytest.raises(ValueError):
+            ParallelCompressor(output, 'bzip2')
+
+
+mock_build_config_dict = {
+    "projectInfo": {
+        "name": "testproject"
+    },
+    "artifact": {
+        "artifactoryDomain": "https://testdomain/artifactory",
+        "artifactoryRepoKey": "release-repo",
+        "artifactoryRepoKeySnapshot": "snapshot-repo",
+        "artifactoryGroup": "group"
+    },
+    "environments": {
+        "unittest": {
+            "artifactCategory": "release"
+        }
+    }
+}
+
+artifact_url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/bundle.tar.gz'
+
+
+def _stream_build_config():
+    _b = MagicMock(BuildConfig)
+    _b.build_env_info = mock_build_config_dict['environments']['unittest']
+    _b.json_config = mock_build_config_dict
+    _b.project_name = mock_build_config_dict['projectInfo']['name']
+    _b.version_number = 'v1.0.0'
+    _b.settings = configparser.ConfigParser()
+    _b.settings.read_dict({'zipit': {'compression_block_size_kb': '1', 'stream_buffer_mb': '1'}})
+    return _b
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_zipit_streams_archive_to_artifactory(tmpdir, monkeypatch):
+    contents = _contents(tmpdir)
+    monkeypatch.chdir(str(tmpdir.mkdir('workdir')))
+    uploaded = bytearray()
+
+    def _receive(request):
+        for chunk in request.body:
+            uploaded.extend(chunk)
+        return 201, {}, json.dumps({'checksums': {'sha1': hashlib.sha1(uploaded).hexdigest(),
+                                                  'md5': hashlib.md5(uploaded).hexdigest()}})
+
+    responses.add(responses.DELETE, artifact_url, status=404)
+    responses.add_callback(responses.PUT, artifact_url, callback=_receive)
+
+    _b = _stream_build_config()
+    with patch('flow.zipit.zipit.Artifactory', lambda: Artifactory(config_override=_b)):
+        with patch.object(ZipIt, 'config', _b):
+            ZipIt('artifactory', 'bundle.tar.gz', str(contents), 'gzip', None, True)
+
+    # nothing was written locally and the upload is a complete archive
+    assert os.listdir('.') == []
+    with tarfile.open(fileobj=io.BytesIO(bytes(uploaded)), mode='r:gz') as tar:
+        assert len([member for member in tar if member.isfile()]) == 20
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_zipit_stream_checksum_mismatch(tmpdir):
+    contents = _contents(tmpdir)
+
+    def _receive(request):
+        for _ in request.body:
+            pass
+        return 201, {}, json.dumps({'checksums': {'sha1': 'notthesha'}})
+
+    responses.add(responses.DELETE, artifact_url, status=404)
+    responses.add_callback(responses.PUT, artifact_url, callback=_receive)
+
+    _b = _stream_build_config()
+    with patch('flow.utils.commons.print_msg') as mock_printmsg_fn:
+        with patch('flow.zipit.zipit.Artifactory', lambda: Artifactory(config_override=_b)):
+            with patch.object(ZipIt, 'config', _b):
+                with pytest.raises(SystemExit):
+                    ZipIt('artifactory', 'bundle.tar.gz', str(contents), 'gzip', None, True)
+
+    assert mock_printmsg_fn.call_args[0][1] == 'publish_stream'
+    assert mock_printmsg_fn.call_args[0][3] == 'ERROR'
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_zipit_stream_reports_packing_failure(tmpdir):
+    contents = _contents(tmpdir)
+
+    def _receive(request):
+        for _ in request.body:
+            pass
+        return 201, {}, json.dumps({'checksums': {}})
+
+    responses.add(responses.DELETE, artifact_url, status=404)
+    responses.add_callback(responses.PUT, artifact_url, callback=_receive)
+
+    _b = _stream_build_config()
+    with patch('flow.utils.commons.print_msg') as mock_printmsg_fn:
+        with patch('flow.zipit.zipit.Artifactory', lambda: Artifactory(config_override=_b)):
+            with patch.object(ZipIt, 'config', _b):
+                with patch.object(ZipIt, '_write_tar', side_effect=OSError('disk on fire')):
+                    with pytest.raises(SystemExit):
+                        ZipIt('artifactory', 'bundle.tar.gz', str(contents), 'gzip', None, True)
+
+    errors = [call[0][2] for call in mock_printmsg_fn.call_args_list if call[0][3:] == ('ERROR',)]
+    assert 'disk on fire' in errors[0]
+    assert 'user name/password' not in errors[0]
+
+
+def test_zip_it_reproducible_archives_are_identical(tmpdir, monkeypatch):
+    contents = _contents(tmpdir)
+    monkeypatch.chdir(str(tmpdir))
+
+    zipit = _zipit()
+    zipit.reproducible = True
+
+    zipit._zip_it('bundle.tar.gz', str(contents), 'gzip')
+    first = tmpdir.join('bundle.tar.gz').read_binary()
+
+    for path in contents.listdir():
+        os.utime(str(path), (12345, 12345))
+    zipit._zip_it('bundle.tar.gz', str(contents), 'gzip')
+
+    assert tmpdir.join('bundle.tar.gz').read_binary() == first
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_zipit_reproducible_skips_unchanged_contents(tmpdir, monkeypatch):
+    contents = _contents(tmpdir)
+    monkeypatch.chdir(str(tmpdir.mkdir('workdir')))
+    published = {}
+
+    def _head(request):
+        if 'sha1' in published:
+            return 200, {'X-Checksum-Sha1': published['sha1']}, ''
+        return 404, {}, ''
+
+    def _put(request):
+        if request.body is None:
+            return 404, {}, ''
+        body = request.body.read() if hasattr(request.body, 'read') else request.body
+        published['sha1'] = hashlib.sha1(body).hexdigest()
+        return 201, {}, ''
+
+    responses.add_callback(responses.HEAD, artifact_url, callback=_head)
+    responses.add(responses.DELETE, artifact_url, status=404)
+    responses.add_callback(responses.PUT, artifact_url, callback=_put)
+
+    _b = _stream_build_config()
+    with patch('flow.zipit.zipit.Artifactory', lambda: Artifactory(config_override=_b)):
+        with patch.object(ZipIt, 'config', _b):
+            ZipIt('artifactory', 'bundle.tar.gz', str(contents), 'gzip', reproducible=True)
+            os.remove('bundle.tar.gz')
+            for path in contents.listdir():
+                os.utime(str(path), (12345, 12345))
+
+            with patch('flow.utils.commons.print_msg') as mock_printmsg_fn:
+                ZipIt('artifactory', 'bundle.tar.gz', str(contents), 'gzip', reproducible=True)
+
+    manifest = json.loads(open('bundle.tar.gz.manifest.json').read())
+    assert manifest['checksums']['sha1'] == published['sha1']
+    assert len(manifest['files']) == 20
+
+    # second run neither archived nor uploaded anything
+    assert not os.path.exists('bundle.tar.gz')
+    assert [call.request.method for call in responses.calls][-1] == 'HEAD'
+    mock_printmsg_fn.assert_any_call('ZipIt', '_ship_it_if_changed', 'Skipped archiving and upload of bundle.tar.gz.  '
+                                                                     'Unchanged artifact sha1 {}'.format(
+                                                                        published['sha1']))
+
+
+# noinspection PyUnresolvedReferences
+@responses.activate
+def test_zipit_reproducible_manifest_records_archived_bytes(tmpdir, monkeypatch):
+    contents = _contents(tmpdir)
+    monkeypatch.chdir(str(tmpdir.mkdir('workdir')))
+    scan = ArchiveManifest.scan
+
+    def _scan_then_change(manifest, scanned_contents, previous=None):
+        files = scan(manifest, scanned_contents, previous)
+        contents.join('file3.txt').write('changed after the scan')
+        return files
+
+    responses.add(responses.HEAD, artifact_url, status=404)
+    responses.add(responses.DELETE, artifact_url, status=404)
+    responses.add(responses.PUT, artifact_url, status=201)
+
+    _b = _stream_build_config()
+    with patch('flow.zipit.zipit.Artifactory', lambda: Artifactory(config_override=_b)):
+        with patch.object(ZipIt, 'config', _b):
+            with patch.object(ArchiveManifest, 'scan', _scan_then_change):
+                ZipIt('artifactory', 'bundle.tar.gz', str(contents), 'gzip', reproducible=True)
+
+    with tarfile.open('bundle.tar.gz') as tar:
+        archived = tar.extractfile('bundle.tar.gz/file3.txt').read()
+
+    manifest = json.loads(open('bundle.tar.gz.manifest.json').read())
+    assert archived == b'changed after the scan'
+    assert manifest['files']['file3.txt']['sha256'] == hashlib.sha256(archived).hexdigest()
+    assert manifest['files']['file3.txt']['size'] == len(archived)
+
+
+def test_archive_manifest_detects_changed_file(tmpdir):
+    contents = _contents(tmpdir)
+    manifest = ArchiveManifest(str(tmpdir.join('bundle.tar.manifest.json')))
+    options = {'compression': 'gzip'}
+
+    files = manifest.scan(str(contents))
+    manifest.save(files, options, {'sha1': 'abc'})
+    previous = manifest.load()
+
+    assert ArchiveManifest.unchanged(previous, manifest.scan(str(contents), previous), options)
+    assert not ArchiveManifest.unchanged(previous, manifest.scan(str(contents), previous), {'compression': 'xz'})
+
+    contents.join('file3.txt').write('changed')
+    assert not ArchiveManifest.unchanged(previous, manifest.scan(str(contents), previous), options)